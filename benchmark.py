@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 性能基准测试
+
+用ffmpeg的 testsrc/mandelbrot 信号源在本地生成不同分辨率和时长的测试视频,
+对每个 引擎 x 质量档位 分别运行 convert_single,并对整个测试集运行 convert_batch,
+记录 墙钟时间、CPU时间(含子进程)、内存峰值 和 输出大小,结果写成JSON基线
+
+每个用例在独立的子进程中运行,内存峰值和CPU时间互不累积
+
+--decode-gain 额外以 decode_scaling=False(按源分辨率解码后逐帧缩放)运行 moviepy/流式引擎的单文件用例,
+按 引擎 x 质量档位 汇总两种解码方式的吞吐量(每秒处理的视频秒数)和加速比
+
+用法:
+    python benchmark.py --output baseline.json
+    python benchmark.py --output current.json --compare baseline.json --tolerance 0.2
+    python benchmark.py --quick --engine stream --decode-gain
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import multiprocessing
+from pathlib import Path
+import ffmpeg_engine
+
+
+# 测试视频: (名称, 信号源, 分辨率, 时长秒, 帧率)
+VIDEO_SPECS = [
+    ('testsrc_320x240_5s', 'testsrc', '320x240', 5, 30),
+    ('testsrc_640x480_10s', 'testsrc', '640x480', 10, 30),
+    ('mandelbrot_640x480_5s', 'mandelbrot', '640x480', 5, 25),
+    ('testsrc_1280x720_20s', 'testsrc', '1280x720', 20, 30),
+]
+QUICK_SPECS = VIDEO_SPECS[:1] + VIDEO_SPECS[2:3]
+
+QUALITIES = ['high', 'medium', 'low']
+# 与基线比较的指标;输出大小与机器无关,时间和内存受机器负载影响
+COMPARED_METRICS = ['wall_seconds', 'cpu_seconds', 'peak_rss_bytes', 'output_bytes']
+
+
+def generate_videos(video_dir, specs, progress_callback=None):
+    """
+    生成测试视频,已存在的文件直接复用
+    :param video_dir: 视频目录
+    :param specs: VIDEO_SPECS 格式的列表
+    :return: 视频路径列表
+    """
+    video_dir = Path(video_dir)
+    video_dir.mkdir(parents=True, exist_ok=True)
+    ffmpeg_binary = ffmpeg_engine.get_ffmpeg_binary()
+
+    paths = []
+    for name, source, size, duration, rate in specs:
+        path = video_dir / f'{name}.mp4'
+        if not path.exists():
+            if progress_callback:
+                progress_callback(f"生成测试视频: {path.name}")
+            tmp_path = path.with_suffix('.tmp.mp4')
+            ffmpeg_engine.run_ffmpeg([
+                ffmpeg_binary, '-y', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', f'{source}=size={size}:rate={rate}', '-t', str(duration),
+                '-pix_fmt', 'yuv420p', '-c:v', 'libx264', '-preset', 'veryfast',
+                str(tmp_path)
+            ])
+            os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def _resource_usage():
+    """当前进程及已回收子进程的 (CPU时间, 内存峰值字节)"""
+    times = os.times()
+    cpu_seconds = times.user + times.system + times.children_user + times.children_system
+    try:
+        import resource
+    except ImportError:
+        from metrics import peak_rss_bytes
+        return cpu_seconds, peak_rss_bytes()
+
+    # Linux 单位为KB, macOS 为字节
+    unit = 1 if sys.platform == 'darwin' else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return cpu_seconds, peak * unit
+
+
+def _run_case(case, conn):
+    """子进程入口: 运行一个用例并把测量结果发回父进程"""
+    from video_to_gif import VideoToGifConverter
+
+    output_dir = Path(case['output_dir'])
+    shutil.rmtree(output_dir, ignore_errors=True)
+    converter = VideoToGifConverter(case['input_dir'], output_dir, engine=case['engine'],
+                                    decode_scaling=case.get('decode_scaling', True))
+
+    cpu_start, _ = _resource_usage()
+    start = time.perf_counter()
+    if case['mode'] == 'single':
+        success, result = converter.convert_single(case['video'], case['quality'])
+        ok = success
+        error = None if success else result
+    else:
+        success_count, fail_count, results = converter.convert_batch(case['quality'], workers=case['workers'])
+        ok = fail_count == 0
+        error = '; '.join(r['result'] for r in results if not r['success']) or None
+    wall_seconds = time.perf_counter() - start
+    cpu_end, peak = _resource_usage()
+
+    output_bytes = sum(f.stat().st_size for f in output_dir.glob('*.gif'))
+    conn.send({
+        'success': ok,
+        'error': error,
+        'wall_seconds': wall_seconds,
+        'cpu_seconds': cpu_end - cpu_start,
+        'peak_rss_bytes': peak,
+        'output_bytes': output_bytes
+    })
+    conn.close()
+
+
+def run_case(case):
+    """在独立子进程中运行用例"""
+    ctx = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_case, args=(case, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        result = {'success': False, 'error': f'子进程异常退出 (退出码 {process.exitcode})'}
+    process.join()
+    return result
+
+
+def build_cases(video_paths, video_dir, work_dir, engines, qualities, workers, decode_gain=False):
+    """
+    生成用例列表: 每个视频的 convert_single,以及每个档位的 convert_batch
+    :param decode_gain: 是否为 moviepy/流式引擎的单文件用例追加 decode_scaling=False 的对照用例
+    """
+    cases = []
+    for engine in engines:
+        for quality in qualities:
+            for video_path in video_paths:
+                case = {
+                    'id': f'single/{engine}/{quality}/{video_path.stem}',
+                    'mode': 'single',
+                    'engine': engine,
+                    'quality': quality,
+                    'video': str(video_path),
+                    'input_dir': str(video_dir),
+                    'output_dir': str(Path(work_dir) / 'out'),
+                    'decode_scaling': True
+                }
+                cases.append(case)
+                if decode_gain and engine != 'ffmpeg':
+                    cases.append(dict(case, id=case['id'] + '/resize-after-decode', decode_scaling=False))
+            cases.append({
+                'id': f'batch/{engine}/{quality}/workers={workers}',
+                'mode': 'batch',
+                'engine': engine,
+                'quality': quality,
+                'workers': workers,
+                'input_dir': str(video_dir),
+                'output_dir': str(Path(work_dir) / 'out')
+            })
+    return cases
+
+
+def decode_scaling_gain(results, specs):
+    """
+    按 引擎 x 质量档位 汇总解码端缩放相对逐帧缩放的吞吐量
+    :param results: 含对照用例的结果列表
+    :param specs: 测试视频规格,用于换算视频总时长
+    :return: [{'engine', 'quality', 'video_seconds', 'resize_seconds', 'decode_scaling_seconds',
+               'resize_throughput', 'decode_scaling_throughput', 'speedup'}, ...],
+             吞吐量为每秒墙钟时间处理的视频秒数;任一方式有失败用例的组合不汇总
+    """
+    durations = {name: duration for name, _, _, duration, _ in specs}
+    groups = {}
+    for case in results:
+        if case['mode'] != 'single' or case['engine'] == 'ffmpeg':
+            continue
+        key = (case['engine'], case['quality'])
+        groups.setdefault(key, {True: [], False: []})[case.get('decode_scaling', True)].append(case)
+
+    summary = []
+    for (engine, quality), runs in groups.items():
+        scaled, resized = runs[True], runs[False]
+        if not scaled or not resized or not all(case['success'] for case in scaled + resized):
+            continue
+        video_seconds = sum(durations.get(Path(case['video']).stem, 0) for case in scaled)
+        scaled_seconds = sum(case['wall_seconds'] for case in scaled)
+        resized_seconds = sum(case['wall_seconds'] for case in resized)
+        summary.append({
+            'engine': engine,
+            'quality': quality,
+            'video_seconds': video_seconds,
+            'resize_seconds': resized_seconds,
+            'decode_scaling_seconds': scaled_seconds,
+            'resize_throughput': video_seconds / resized_seconds,
+            'decode_scaling_throughput': video_seconds / scaled_seconds,
+            'speedup': resized_seconds / scaled_seconds
+        })
+    return summary
+
+
+def environment_info():
+    """记录运行环境,不同环境的基线不宜直接比较"""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count()
+    }
+    for module in ('moviepy', 'PIL', 'numpy'):
+        try:
+            info[module] = __import__(module).__version__
+        except (ImportError, AttributeError):
+            info[module] = None
+    return info
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线比较
+    :param tolerance: 允许的相对增幅,如0.2表示变慢/变大超过20%视为退化
+    :return: 退化描述列表
+    """
+    baseline_cases = {case['id']: case for case in baseline.get('cases', [])}
+    regressions = []
+    for case in results:
+        old = baseline_cases.get(case['id'])
+        if not old:
+            continue
+        if old.get('success') and not case.get('success'):
+            regressions.append(f"{case['id']}: 基线成功,本次失败 ({case.get('error')})")
+            continue
+        if not (old.get('success') and case.get('success')):
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = old.get(metric), case.get(metric)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{case['id']}: {metric} {before:.6g} -> {after:.6g} (+{after / before - 1:.0%})")
+    return regressions
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='视频转GIF性能基准测试')
+    parser.add_argument('--output', default='benchmark.json', help='结果JSON文件')
+    parser.add_argument('--work-dir', default='benchmark_work', help='测试视频和输出的工作目录')
+    parser.add_argument('--engine', action='append', choices=['moviepy', 'ffmpeg', 'stream'],
+                        help='要测试的引擎,可重复指定,默认全部')
+    parser.add_argument('--quality', action='append', choices=QUALITIES, help='要测试的质量档位,可重复指定,默认全部')
+    parser.add_argument('--workers', type=int, default=None, help='convert_batch 的进程数,默认为CPU核数')
+    parser.add_argument('--quick', action='store_true', help='只使用两个较小的测试视频')
+    parser.add_argument('--decode-gain', action='store_true',
+                        help='追加逐帧缩放的对照用例,汇总解码端缩放在各质量档位的吞吐量提升')
+    parser.add_argument('--compare', default=None, help='与该基线JSON比较,有退化时返回非零退出码')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='比较时允许的相对增幅')
+    args = parser.parse_args()
+
+    engines = args.engine or ['moviepy', 'ffmpeg', 'stream']
+    qualities = args.quality or QUALITIES
+    workers = args.workers or os.cpu_count() or 1
+    work_dir = Path(args.work_dir)
+    video_dir = work_dir / ('videos_quick' if args.quick else 'videos')
+
+    specs = QUICK_SPECS if args.quick else VIDEO_SPECS
+    video_paths = generate_videos(video_dir, specs, print)
+    cases = build_cases(video_paths, video_dir, work_dir, engines, qualities, workers, args.decode_gain)
+
+    results = []
+    for idx, case in enumerate(cases, 1):
+        measurement = run_case(case)
+        row = {key: case.get(key) for key in ('id', 'mode', 'engine', 'quality', 'video', 'decode_scaling')}
+        results.append({**row, **measurement})
+        if measurement['success']:
+            print(f"[{idx}/{len(cases)}] {case['id']}: {measurement['wall_seconds']:.2f}s "
+                  f"cpu {measurement['cpu_seconds']:.2f}s "
+                  f"rss {measurement['peak_rss_bytes'] / 1024 ** 2:.0f}MB "
+                  f"out {measurement['output_bytes'] / 1024:.0f}KB", flush=True)
+        else:
+            print(f"[{idx}/{len(cases)}] {case['id']}: 失败 {measurement['error']}", flush=True)
+    shutil.rmtree(work_dir / 'out', ignore_errors=True)
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': environment_info(),
+        'videos': [{'name': name, 'source': source, 'size': size, 'duration': duration, 'fps': rate}
+                   for name, source, size, duration, rate in specs],
+        'cases': results
+    }
+    if args.decode_gain:
+        report['decode_scaling_gain'] = decode_scaling_gain(results, specs)
+        print("解码端缩放的吞吐量(视频秒/墙钟秒):")
+        for row in report['decode_scaling_gain']:
+            print(f"  {row['engine']}/{row['quality']}: 逐帧缩放 {row['resize_throughput']:.2f} -> "
+                  f"解码端缩放 {row['decode_scaling_throughput']:.2f} ({row['speedup']:.2f}x)")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"发现 {len(regressions)} 项退化:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("与基线相比没有退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 转换结果缓存
+
+以输入文件的 大小 + 修改时间(或内容哈希) + 质量配置 + 转换引擎 作为键,
+把转换结果(GIF/WebP/APNG)保存在缓存目录中。再次扫描时命中缓存的文件直接跳过或复制到输出目录,
+缓存总大小超出预算时按最近最少使用(LRU)淘汰
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+from pathlib import Path
+
+
+class ConversionCache:
+    """持久化的转换结果缓存"""
+
+    INDEX_NAME = 'index.json'
+    BLOB_DIR = 'blobs'
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, cache_dir, max_bytes=2 * 1024 ** 3, hash_content=False):
+        """
+        初始化缓存
+        :param cache_dir: 缓存目录
+        :param max_bytes: 缓存总大小上限(字节),超出后按LRU淘汰
+        :param hash_content: 是否使用文件内容哈希代替修改时间作为键
+        """
+        self.cache_dir = Path(cache_dir)
+        self.blob_dir = self.cache_dir / self.BLOB_DIR
+        self.index_path = self.cache_dir / self.INDEX_NAME
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self._index = self._load_index()
+        self._remove_orphans()
+        self._prune_hashes()
+
+    def _load_index(self):
+        """读取索引文件,损坏或不存在时返回空索引"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            index.setdefault('entries', {})
+            index.setdefault('hashes', {})
+            return index
+        except (OSError, ValueError):
+            return {'entries': {}, 'hashes': {}}
+
+    def _remove_orphans(self):
+        """删除索引中没有记录的缓存文件(写入缓存后、保存索引前中断时留下),它们不计入预算,也不会被淘汰"""
+        indexed = {self._blob_path(key).name for key in self._index['entries']}
+        for blob_path in self.blob_dir.iterdir():
+            if blob_path.name not in indexed:
+                try:
+                    blob_path.unlink()
+                except OSError:
+                    pass
+
+    def _prune_hashes(self):
+        """删除内容哈希备忘中文件已不存在或已变化的记录,它们不会再被复用,备忘随热文件夹中出现过的文件增长"""
+        hashes = self._index['hashes']
+        for memo_key, (size, mtime_ns, _) in list(hashes.items()):
+            try:
+                stat = os.stat(memo_key)
+            except OSError:
+                del hashes[memo_key]
+                continue
+            if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+                del hashes[memo_key]
+
+    def save(self):
+        """原子地写回索引文件"""
+        tmp_path = self.index_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _content_hash(self, video_path, stat):
+        """计算文件内容哈希,大小和修改时间未变时复用上次结果"""
+        memo_key = str(video_path.resolve())
+        memo = self._index['hashes'].get(memo_key)
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+
+        digest = hashlib.sha256()
+        with open(video_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        self._index['hashes'][memo_key] = [stat.st_size, stat.st_mtime_ns, content_hash]
+        return content_hash
+
+    def make_key(self, video_path, quality_settings, engine):
+        """
+        计算缓存键
+        :param video_path: 输入视频路径
+        :param quality_settings: 解析后的质量配置字典
+        :param engine: 转换引擎名称
+        :return: 十六进制键字符串
+        """
+        video_path = Path(video_path)
+        stat = video_path.stat()
+        source = {'size': stat.st_size}
+        if self.hash_content:
+            source['sha256'] = self._content_hash(video_path, stat)
+        else:
+            source['mtime_ns'] = stat.st_mtime_ns
+
+        payload = json.dumps(
+            {'source': source, 'settings': quality_settings, 'engine': engine},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _blob_path(self, key, suffix=None):
+        """
+        :param suffix: 输出文件的扩展名,默认取索引中记录的扩展名(早期版本的条目没有记录,均为GIF)
+        """
+        if suffix is None:
+            suffix = self._index['entries'].get(key, {}).get('suffix', '.gif')
+        return self.blob_dir / (key + suffix)
+
+    def restore(self, key, output_path):
+        """
+        命中时把缓存结果放到输出路径
+        输出文件已是同一份缓存(写入缓存时的硬链接)时直接跳过,否则复制一份,修改输出文件不会影响缓存
+        :return: 是否命中
+        """
+        entry = self._index['entries'].get(key)
+        if entry is None:
+            return False
+
+        blob_path = self._blob_path(key)
+        if not blob_path.exists():
+            del self._index['entries'][key]
+            return False
+
+        output_path = Path(output_path)
+        if not (output_path.exists() and os.path.samefile(blob_path, output_path)):
+            if output_path.exists():
+                output_path.unlink()
+            shutil.copy2(blob_path, output_path)
+
+        entry['last_used'] = time.time()
+        return True
+
+    def store(self, key, output_path, source_name=''):
+        """
+        把转换结果加入缓存,随后按预算淘汰并保存索引,中途中断时已缓存的结果不会丢失记录
+        缓存文件硬链接到刚生成的输出文件,原地改写该输出文件会同时改动缓存;替换文件(写新文件再改名)不受影响
+        :param key: make_key 得到的缓存键
+        :param output_path: 已生成的输出文件路径,缓存文件沿用其扩展名
+        :param source_name: 源文件名,仅用于排查
+        """
+        output_path = Path(output_path)
+        blob_path = self._blob_path(key, output_path.suffix)
+        if blob_path.exists():
+            blob_path.unlink()
+        _link_or_copy(output_path, blob_path)
+
+        self._index['entries'][key] = {
+            'size': blob_path.stat().st_size,
+            'suffix': output_path.suffix,
+            'last_used': time.time(),
+            'source': source_name
+        }
+        self._evict()
+        self.save()
+
+    def _evict(self):
+        """总大小超出预算时淘汰最久未使用的条目"""
+        entries = self._index['entries']
+        total = sum(entry['size'] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            total -= entries[key]['size']
+            blob_path = self._blob_path(key)
+            del entries[key]
+            if blob_path.exists():
+                blob_path.unlink()
+
+
+def _link_or_copy(src, dst):
+    """优先硬链接,跨设备或文件系统不支持时退化为复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
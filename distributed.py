@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 多机分布式转换
+
+协调端把输入文件夹中的视频发布到共享存储上的任务队列并等待汇总结果,
+各机器上的工作端租用任务、在本机转换并写回结果,见 shared_queue 模块。
+各机器的输入/输出文件夹和队列文件应指向同一共享存储(挂载位置可以不同)
+
+用法:
+    # 协调端(任意一台机器)
+    python distributed.py coordinator --queue //nas/gif/queue.db --input //nas/gif/start --output //nas/gif/finish
+    # 工作端(每台机器,--processes 为本机同时运行的工作端进程数)
+    python distributed.py worker --queue /mnt/nas/gif/queue.db --input /mnt/nas/gif/start \\
+        --output /mnt/nas/gif/finish --processes 4
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import multiprocessing
+import ffmpeg_engine
+from video_to_gif import VideoToGifConverter
+from scheduler import JobControl
+from metrics import JsonLinesExporter, combine_callbacks
+
+
+def print_progress(msg):
+    print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+
+def _create_converter(args):
+    return VideoToGifConverter(args.input, args.output, engine=args.engine, output_format=args.format,
+                               queue_path=args.queue)
+
+
+def _worker_process(args, worker_id, control):
+    """工作端进程入口"""
+    event_callback = combine_callbacks(JsonLinesExporter(args.metrics_jsonl) if args.metrics_jsonl else None)
+    _create_converter(args).run_worker(worker_id, lease_seconds=args.lease, poll_seconds=args.poll,
+                                       exit_when_idle=not args.keep_running, progress_callback=print_progress,
+                                       event_callback=event_callback, control=control)
+
+
+def run_coordinator(args, control):
+    """发布批次并等待结果,结果列表以JSON写出到 --results 或标准输出"""
+    converter = _create_converter(args)
+    success, fail, results = converter.convert_distributed(
+        args.quality, print_progress, target_bytes=args.target_mb * 1024 ** 2 if args.target_mb else None,
+        order=args.order, poll_seconds=args.poll, timeout=args.timeout, control=control
+    )
+    report = json.dumps({'success': success, 'failed': fail, 'results': results}, ensure_ascii=False, indent=2)
+    if args.results:
+        with open(args.results, 'w', encoding='utf-8') as f:
+            f.write(report)
+    else:
+        print(report)
+    return 0 if fail == 0 else 1
+
+
+def run_workers(args, control):
+    """在本机启动 --processes 个工作端进程,全部退出后返回"""
+    host = socket.gethostname()
+    if args.processes == 1:
+        _worker_process(args, f'{host}-{os.getpid()}', control)
+        return 0
+    processes = [
+        multiprocessing.Process(target=_worker_process, args=(args, f'{host}-{os.getpid()}-{k}', control))
+        for k in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return 0
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='多机分布式转换: 协调端发布任务,各机器上的工作端租用并转换')
+    parser.add_argument('role', choices=['coordinator', 'worker'], help='coordinator 协调端, worker 工作端')
+    parser.add_argument('--queue', default=None, help='共享任务队列(SQLite)路径,默认为输出文件夹下的 .video_to_gif_queue.db')
+    parser.add_argument('--input', default='D:/GIF/start', help='输入视频文件夹')
+    parser.add_argument('--output', default='D:/GIF/finish', help='输出GIF文件夹')
+    parser.add_argument('--engine', default='moviepy', choices=VideoToGifConverter.ENGINES, help='转换引擎')
+    parser.add_argument('--format', default=None, choices=list(ffmpeg_engine.OUTPUT_FORMATS),
+                        help='输出格式,默认为GIF')
+    parser.add_argument('--poll', type=float, default=2.0, help='查询队列的间隔(秒)')
+    # 协调端
+    parser.add_argument('--quality', default='medium', choices=['high', 'medium', 'low'], help='质量等级')
+    parser.add_argument('--order', default='shortest', choices=['shortest', 'longest', 'name'], help='任务顺序')
+    parser.add_argument('--target-mb', type=float, default=None, help='每个输出文件的目标大小(MB)')
+    parser.add_argument('--timeout', type=float, default=None, help='协调端最长等待时间(秒)')
+    parser.add_argument('--results', default=None, help='协调端把结果列表写入该JSON文件,默认输出到标准输出')
+    # 工作端
+    parser.add_argument('--processes', type=int, default=1, help='本机同时运行的工作端进程数')
+    parser.add_argument('--lease', type=float, default=60.0, help='租约时长(秒),工作端失联超过该时长后任务重新排队')
+    parser.add_argument('--keep-running', action='store_true', help='队列为空时继续等待新批次,而不是退出')
+    parser.add_argument('--metrics-jsonl', default=None, help='工作端把计时事件追加写入该JSON Lines文件')
+    args = parser.parse_args()
+
+    control = JobControl()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: control.cancel())
+
+    if args.role == 'coordinator':
+        return run_coordinator(args, control)
+    return run_workers(args, control)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,682 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - FFmpeg滤镜图转换引擎
+
+用一条ffmpeg命令完成 抽帧(fps) + 缩放(scale) + 调色板生成/应用(palettegen/paletteuse),
+像素数据不经过Python,避免moviepy逐帧解码、复制再编码的开销。
+输出格式由配置中的 format 决定: GIF 使用调色板滤镜,动态WebP(有损/无损)和APNG
+直接交给对应编码器;FramePipeWriter 把Python管线处理好的帧经标准输入流式交给同样的编码器
+
+另提供不解码的元数据探测(probe_video): 优先使用ffprobe,没有ffprobe时解析 `ffmpeg -i` 的输出
+"""
+import os
+import re
+import json
+import math
+import shutil
+import signal
+import subprocess
+import threading
+from scheduler import ConversionCancelled
+from metrics import NULL_METRICS
+
+
+# 受控运行时检查取消/暂停的间隔(秒)
+CONTROL_POLL_SECONDS = 0.2
+
+# 输出格式 -> 扩展名;webp_lossless 与 webp 使用同一个编码器,只是开启无损模式
+OUTPUT_FORMATS = {
+    'gif': '.gif',
+    'webp': '.webp',
+    'webp_lossless': '.webp',
+    'apng': '.png'
+}
+
+
+def get_ffmpeg_binary():
+    """
+    获取ffmpeg可执行文件路径,与moviepy的查找规则一致但不导入moviepy(探测时不拉起重量级依赖)
+    环境变量 FFMPEG_BINARY 可指定路径;未设置或为 ffmpeg-imageio 时使用imageio-ffmpeg附带的ffmpeg,
+    为 auto-detect 时在PATH中查找
+    """
+    binary = os.environ.get('FFMPEG_BINARY', 'ffmpeg-imageio')
+    if binary == 'ffmpeg-imageio':
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    if binary == 'auto-detect':
+        return shutil.which('ffmpeg') or shutil.which('ffmpeg.exe') or 'unset'
+    return binary
+
+
+def get_ffprobe_binary(ffmpeg_binary=None):
+    """
+    查找ffprobe: 先找ffmpeg同目录下的同名文件,再找PATH
+    :return: ffprobe路径,找不到时返回None(imageio-ffmpeg 只附带ffmpeg)
+    """
+    ffmpeg_binary = ffmpeg_binary or get_ffmpeg_binary()
+    directory, name = os.path.split(ffmpeg_binary)
+    if 'ffmpeg' in name:
+        candidate = os.path.join(directory, name.replace('ffmpeg', 'ffprobe', 1))
+        if os.path.isfile(candidate):
+            return candidate
+    return shutil.which('ffprobe')
+
+
+def _popen_params():
+    """子进程公共参数,Windows下不弹出控制台窗口"""
+    params = {}
+    if os.name == 'nt':
+        params['creationflags'] = 0x08000000  # CREATE_NO_WINDOW
+    return params
+
+
+def output_extension(output_format):
+    """
+    输出格式对应的扩展名
+    :raises ValueError: 不支持的格式
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}")
+    return OUTPUT_FORMATS[output_format]
+
+
+def _frame_filters(quality_settings):
+    """各格式共用的前端滤镜: 抽帧 + 缩放"""
+    filters = [f"fps={quality_settings['fps']}"]
+    if quality_settings['scale'] != 1.0:
+        filters.append(f"scale=trunc(iw*{quality_settings['scale']}):-1:flags=lanczos")
+    return filters
+
+
+def _decimate_filter(threshold):
+    """
+    重复帧滤镜: mpdecimate 按8x8块与上一个保留帧比较,任何一块的平均绝对差超过阈值即保留该帧,
+    与 frame_pipeline.FrameDeduplicator 的判定方式一致。
+    GIF复用器按时间戳计算延时,被丢弃帧的时长合并到前一帧;末尾重复帧的时长由 gif_writer.pad_final_delay 补上
+    :param threshold: 平均绝对差阈值(0-255),0表示只丢弃完全相同的帧
+    """
+    block = 64 * int(threshold)
+    return f'mpdecimate=hi={block}:lo={block}:frac=0'
+
+
+def build_gif_filter(quality_settings, label=''):
+    """
+    根据质量配置构建滤镜图,非GIF格式只有抽帧和缩放
+    :param quality_settings: QualitySettings 中的配置字典
+    :param label: 中间流标签的后缀,同一滤镜图中包含多条转换链时用于区分
+    :return: -filter_complex 使用的滤镜图字符串
+    """
+    filters = _frame_filters(quality_settings)
+    if quality_settings.get('format', 'gif') != 'gif':
+        return ','.join(filters)
+    if quality_settings.get('dedup') is not None:
+        filters.append(_decimate_filter(quality_settings['dedup']))
+    filters.append(f'split[s0{label}][s1{label}]')
+
+    # 逐帧调色板对应 stats_mode=single + new=1,其余模式统计整段视频生成一个调色板
+    if quality_settings.get('palette') == 'frame':
+        palettegen = f"palettegen=max_colors={quality_settings['colors']}:stats_mode=single"
+        paletteuse = 'paletteuse=new=1'
+    else:
+        palettegen = f"palettegen=max_colors={quality_settings['colors']}"
+        paletteuse = 'paletteuse'
+
+    return ','.join(filters) + f';[s0{label}]{palettegen}[p{label}];[s1{label}][p{label}]{paletteuse}'
+
+
+def build_gif_command(input_path, output_path, quality_settings, ffmpeg_binary=None, ranges=None):
+    """
+    构建单次转换的ffmpeg命令
+    :param input_path: 输入视频路径
+    :param output_path: 输出路径,格式由 quality_settings 的 format 决定
+    :param quality_settings: 质量配置字典
+    :param ffmpeg_binary: ffmpeg路径,默认与moviepy一致
+    :param ranges: 只转换的时间片段列表 [(起点秒, 时长秒), ...],多段按顺序拼接;为None时转换整段
+    :return: 命令参数列表
+    """
+    cmd = [
+        ffmpeg_binary or get_ffmpeg_binary(),
+        '-y',
+        '-loglevel', 'error'
+    ]
+    if not ranges:
+        cmd += ['-i', str(input_path)]
+        filter_graph = build_gif_filter(quality_settings)
+    else:
+        # 每个片段作为一个输入,-ss 放在 -i 之前按关键帧快速定位
+        for start, length in ranges:
+            cmd += ['-ss', f'{start:.3f}', '-t', f'{length:.3f}', '-i', str(input_path)]
+        filter_graph = build_gif_filter(quality_settings)
+        if len(ranges) > 1:
+            inputs = ''.join(f'[{i}:v]' for i in range(len(ranges)))
+            filter_graph = f'{inputs}concat=n={len(ranges)}:v=1:a=0,' + filter_graph
+    cmd += ['-filter_complex', filter_graph] + _output_options(quality_settings)
+    cmd.append(str(output_path))
+    return cmd
+
+
+def _output_options(quality_settings):
+    """各输出格式的编码器参数,均为无限循环"""
+    output_format = quality_settings.get('format', 'gif')
+    if output_format == 'gif':
+        options = ['-loop', '0']
+        # ffmpeg的GIF编码器默认即做帧间裁剪和透明差分,未开启optimize时关闭
+        if not quality_settings.get('optimize', True):
+            options += ['-gifflags', '-offsetting-transdiff']
+        return options
+    if output_format in ('webp', 'webp_lossless'):
+        # 无损模式下 quality 表示压缩力度(越大越慢、文件越小)
+        lossless = output_format == 'webp_lossless'
+        return ['-c:v', 'libwebp_anim', '-lossless', '1' if lossless else '0',
+                '-quality', str(quality_settings.get('webp_quality', 75)), '-loop', '0', '-f', 'webp']
+    if output_format == 'apng':
+        return ['-c:v', 'apng', '-plays', '0', '-f', 'apng']
+    raise ValueError(f"不支持的输出格式: {output_format}")
+
+
+def build_multi_gif_command(input_path, outputs, quality_settings, ffmpeg_binary=None):
+    """
+    构建一条命令从同一个源文件截取多个片段,各自输出一个文件
+    每个片段作为一个在输入端定位的输入,片段以外的帧不会被解码
+    :param input_path: 输入视频路径
+    :param outputs: [(输出路径, 起点秒, 时长秒), ...]
+    :param quality_settings: 质量配置字典
+    :param ffmpeg_binary: ffmpeg路径,默认与moviepy一致
+    :return: 命令参数列表
+    """
+    cmd = [ffmpeg_binary or get_ffmpeg_binary(), '-y', '-loglevel', 'error']
+    for _, start, length in outputs:
+        cmd += ['-ss', f'{start:.3f}', '-t', f'{length:.3f}', '-i', str(input_path)]
+
+    chains = [
+        f'[{i}:v]' + build_gif_filter(quality_settings, label=str(i)) + f'[out{i}]'
+        for i in range(len(outputs))
+    ]
+    cmd += ['-filter_complex', ';'.join(chains)]
+    for i, (output_path, _, _) in enumerate(outputs):
+        cmd += ['-map', f'[out{i}]'] + _output_options(quality_settings) + [str(output_path)]
+    return cmd
+
+
+def build_decode_command(input_path, fps, size, start=0.0, duration=None, max_frames=None, ffmpeg_binary=None,
+                         stacked_sizes=None):
+    """
+    构建解码命令: 在解码端完成抽帧和缩放,向标准输出写出目标尺寸和帧率的 rgb24 原始帧
+    :param input_path: 输入视频路径
+    :param fps: 输出帧率
+    :param size: 输出尺寸 (宽, 高)
+    :param start: 起点(秒),在输入端定位
+    :param duration: 读取时长(秒),为None时读到结尾
+    :param max_frames: 最多输出的帧数
+    :param ffmpeg_binary: ffmpeg路径,默认与moviepy一致
+    :param stacked_sizes: 每帧同时缩放为多个尺寸时的尺寸列表,各画面左对齐、从上到下拼成一帧,
+                          size 为拼接后的尺寸(宽和每格的高补齐为偶数),见 StackedFrameReader
+    :return: 命令参数列表
+    """
+    cmd = [ffmpeg_binary or get_ffmpeg_binary(), '-loglevel', 'error']
+    if start:
+        cmd += ['-ss', f'{start:.6f}']
+    if duration is not None:
+        cmd += ['-t', f'{duration:.6f}']
+    if stacked_sizes and len(stacked_sizes) > 1:
+        # 缩放和拼接都在 yuv420p 下进行,拼接后只转换一次RGB;yuv420p 要求偶数尺寸,每格的宽高补齐为偶数
+        count = len(stacked_sizes)
+        graph = [f'fps={fps},format=yuv420p,split={count}' + ''.join(f'[s{k}]' for k in range(count))]
+        for k, (width, height) in enumerate(stacked_sizes):
+            graph.append(f'[s{k}]scale={width}:{height}:flags=lanczos,format=yuv420p,setsar=1,'
+                         f'pad={size[0]}:{_even(height)}[v{k}]')
+        video_filter = ';'.join(graph) + ';' + ''.join(f'[v{k}]' for k in range(count)) + f'vstack=inputs={count}'
+    else:
+        video_filter = f'fps={fps},scale={size[0]}:{size[1]}:flags=lanczos'
+    cmd += ['-i', str(input_path), '-an', '-sn', '-vf', video_filter]
+    if max_frames is not None:
+        cmd += ['-frames:v', str(max_frames)]
+    return cmd + ['-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1']
+
+
+class FrameReader:
+    """
+    解码端缩放的帧读取器: ffmpeg 直接输出目标尺寸和帧率的帧,
+    不再以源分辨率解码、经管道传出全部源帧后在Python中逐帧缩放。
+    提供流式管线和 moviepy 用到的剪辑接口(size / duration / iter_frames / get_frame),
+    时间从 start 起算,与 subclip 一致
+    """
+
+    # get_frame 向后跳过超过这么多帧时重新定位,而不是顺序读过去
+    SEEK_FRAMES = 50
+
+    def __init__(self, video_path, fps, size, duration, start=0.0, ffmpeg_binary=None):
+        """
+        :param video_path: 视频路径
+        :param fps: 输出帧率
+        :param size: 输出尺寸 (宽, 高)
+        :param duration: 读取时长(秒)
+        :param start: 起点(秒)
+        """
+        self.video_path = video_path
+        self.fps = fps
+        self.size = tuple(size)
+        self.w, self.h = self.size
+        self.duration = duration
+        self.start = start
+        self.ffmpeg_binary = ffmpeg_binary or get_ffmpeg_binary()
+        # 与 moviepy 的 iter_frames 一致: 取 t = i / fps < duration 的帧
+        self.frame_count = max(1, int(math.ceil(duration * fps - 1e-6)))
+        self._cursor = None
+        self._cursor_index = -1
+        self._cursor_frame = None
+
+    def frames(self, first_frame=0, last_frame=None):
+        """
+        顺序读取 [first_frame, last_frame) 区间的帧,每次调用启动一个新的解码进程
+        :return: (H, W, 3) uint8 数组生成器
+        :raises RuntimeError: ffmpeg返回非零退出码
+        """
+        import numpy as np
+
+        last_frame = self.frame_count if last_frame is None else min(last_frame, self.frame_count)
+        if first_frame >= last_frame:
+            return
+        cmd = self._decode_command(first_frame, last_frame)
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                **_popen_params())
+        stderr_chunks = []
+        reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+        reader.start()
+        frame_bytes = self.w * self.h * 3
+        try:
+            while True:
+                data = proc.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    break
+                yield np.frombuffer(data, dtype=np.uint8).reshape(self.h, self.w, 3)
+            returncode = proc.wait()
+            reader.join()
+            if returncode != 0:
+                stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace').strip()
+                raise RuntimeError(f"ffmpeg 退出码 {returncode}: {stderr[-500:]}")
+        finally:
+            # 消费者提前退出(取消、出错)时结束解码进程
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            reader.join()
+            proc.stdout.close()
+
+    def _decode_command(self, first_frame, last_frame):
+        return build_decode_command(self.video_path, self.fps, self.size, self.start + first_frame / self.fps,
+                                    max_frames=last_frame - first_frame, ffmpeg_binary=self.ffmpeg_binary)
+
+    def iter_frames(self, fps=None, dtype=None):
+        """与 moviepy 剪辑相同的调用方式,帧率必须与构造时一致(抽帧已在解码端完成)"""
+        if fps is not None and abs(fps - self.fps) > 1e-6:
+            raise ValueError(f"读取器的帧率为 {self.fps},不能按 {fps} 读取")
+        return self.frames()
+
+    def get_frame(self, t):
+        """
+        读取 t 秒处的帧(moviepy 的 make_frame 接口)
+        顺序向后读取时复用同一个解码进程,向前或远距离跳转时重新定位;超过结尾时返回最后一帧
+        """
+        index = min(max(0, int(round(t * self.fps))), self.frame_count - 1)
+        if index == self._cursor_index:
+            return self._cursor_frame
+        if self._cursor is None or index < self._cursor_index or index - self._cursor_index > self.SEEK_FRAMES:
+            if self._cursor is not None:
+                self._cursor.close()
+            self._cursor = self.frames(index)
+            self._cursor_index = index - 1
+        while self._cursor_index < index:
+            frame = next(self._cursor, None)
+            if frame is None:
+                # 实际帧数可能比按时长估计的少一帧
+                if self._cursor_frame is None:
+                    raise RuntimeError(f"无法读取 {t:.3f} 秒处的帧")
+                break
+            self._cursor_frame = frame
+            self._cursor_index += 1
+        return self._cursor_frame
+
+    def _close_cursor(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+        self._cursor_index = -1
+        self._cursor_frame = None
+
+    def close(self):
+        """结束 get_frame 使用的解码进程"""
+        self._close_cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _even(value):
+    """向上取偶数"""
+    return value + value % 2
+
+
+class StackedFrameReader(FrameReader):
+    """
+    一次解码同时得到多个尺寸的帧: ffmpeg 把每帧分别缩放为各个尺寸,左对齐、从上到下拼成一帧后经同一个管道传出,
+    split() 再把拼接帧切回各尺寸的画面(数组视图,不复制)。
+    缩放仍在解码端完成,供 frame_pipeline.fan_out 一次解码多路输出使用
+    """
+
+    def __init__(self, video_path, fps, sizes, duration, start=0.0, ffmpeg_binary=None):
+        """
+        :param sizes: 输出尺寸 [(宽, 高), ...],重复的尺寸只解码一份
+        其余参数同 FrameReader
+        """
+        self.sizes = list(dict.fromkeys(tuple(size) for size in sizes))
+        self._tops = {}
+        height = 0
+        for size in self.sizes:
+            self._tops[size] = height
+            height += _even(size[1]) if len(self.sizes) > 1 else size[1]
+        width = max(width for width, _ in self.sizes)
+        super().__init__(video_path, fps, (_even(width) if len(self.sizes) > 1 else width, height), duration,
+                         start, ffmpeg_binary)
+
+    def _decode_command(self, first_frame, last_frame):
+        return build_decode_command(self.video_path, self.fps, self.size, self.start + first_frame / self.fps,
+                                    max_frames=last_frame - first_frame, ffmpeg_binary=self.ffmpeg_binary,
+                                    stacked_sizes=self.sizes)
+
+    def split(self, frame):
+        """
+        :param frame: frames() 读出的拼接帧
+        :return: {(宽, 高): (高, 宽, 3) uint8 数组视图}
+        """
+        return {(width, height): frame[top:top + height, :width] for (width, height), top in self._tops.items()}
+
+
+def build_pipe_command(output_path, size, fps, quality_settings, ffmpeg_binary=None):
+    """
+    构建从标准输入读取原始RGB帧并编码的命令(帧已由Python管线抽帧和缩放)
+    :param output_path: 输出路径
+    :param size: 帧尺寸 (宽, 高)
+    :param fps: 帧率
+    :param quality_settings: 质量配置字典,使用其中的 format 等编码参数
+    :param ffmpeg_binary: ffmpeg路径,默认与moviepy一致
+    :return: 命令参数列表
+    """
+    return [
+        ffmpeg_binary or get_ffmpeg_binary(), '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{size[0]}x{size[1]}', '-framerate', str(fps),
+        '-i', 'pipe:0'
+    ] + _output_options(quality_settings) + [str(output_path)]
+
+
+class FramePipeWriter:
+    """
+    流式写入器: 逐帧把RGB数据写入ffmpeg编码进程的标准输入,编码器边收边写文件,
+    Python侧不缓存帧;管道写满时 write_frame 阻塞,等待时间计入 encode 阶段
+    """
+
+    def __init__(self, output_path, size, fps, quality_settings, metrics=NULL_METRICS, ffmpeg_binary=None):
+        """
+        :param output_path: 输出路径
+        :param size: 帧尺寸 (宽, 高)
+        :param fps: 帧率
+        :param quality_settings: 质量配置字典
+        :param metrics: ConversionMetrics,记录 encode 阶段耗时
+        """
+        self.size = tuple(size)
+        self.frame_count = 0
+        self.metrics = metrics
+        self._proc = subprocess.Popen(
+            build_pipe_command(output_path, self.size, fps, quality_settings, ffmpeg_binary),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            **_popen_params()
+        )
+        self._stderr = []
+        self._reader = threading.Thread(target=lambda: self._stderr.append(self._proc.stderr.read()), daemon=True)
+        self._reader.start()
+
+    def write_frame(self, frame):
+        """
+        写入一帧
+        :param frame: (H, W, 3) uint8 数组或RGB PIL图像,尺寸必须与构造时一致
+        :raises RuntimeError: ffmpeg已异常退出
+        """
+        data = frame.tobytes()
+        with self.metrics.stage('encode'):
+            try:
+                self._proc.stdin.write(data)
+            except (BrokenPipeError, OSError):
+                self._check(self._proc.wait())
+                raise
+        self.frame_count += 1
+
+    def close(self):
+        """结束输入并等待编码完成"""
+        if self._proc.stdin.closed:
+            return
+        with self.metrics.stage('encode'):
+            try:
+                self._proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+            returncode = self._proc.wait()
+        self._reader.join()
+        self._check(returncode)
+
+    def abort(self):
+        """出错或取消时结束编码进程,输出文件由调用方删除"""
+        if self._proc.poll() is None:
+            self._proc.kill()
+        try:
+            self._proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self._proc.wait()
+        self._reader.join()
+
+    def _check(self, returncode):
+        if returncode != 0:
+            self._reader.join()
+            stderr = b''.join(self._stderr).decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg 退出码 {returncode}: {stderr[-500:]}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def run_ffmpeg(cmd, control=None, on_progress=None):
+    """
+    执行ffmpeg命令
+    :param cmd: 命令参数列表
+    :param control: scheduler.JobControl,指定时定期检查: 取消时结束ffmpeg进程,
+                    暂停时挂起进程(仅POSIX;Windows下当前命令继续执行)
+    :param on_progress: 进度回调 on_progress(已输出帧数),由ffmpeg的 -progress 输出驱动(约每0.5秒一次)
+    :raises RuntimeError: ffmpeg返回非零退出码
+    :raises ConversionCancelled: 已取消
+    """
+    if control is None and on_progress is None:
+        proc = subprocess.run(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            **_popen_params()
+        )
+        returncode, stderr = proc.returncode, proc.stderr
+    else:
+        returncode, stderr = _run_monitored(cmd, control, on_progress)
+    if returncode != 0:
+        stderr = stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffmpeg 退出码 {returncode}: {stderr[-500:]}")
+
+
+def _run_monitored(cmd, control, on_progress):
+    """运行ffmpeg,响应取消/暂停并解析进度,返回 (退出码, stderr)"""
+    if control:
+        control.checkpoint()
+    if on_progress:
+        # -progress 是全局选项,按固定间隔把 frame=N 等键值对写到标准输出
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats'] + list(cmd[1:])
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if on_progress else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        **_popen_params()
+    )
+    # 标准输出和错误输出各由一个线程读取,管道写满时ffmpeg不会阻塞
+    stderr_chunks = []
+    readers = [threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)]
+    if on_progress:
+        readers.append(threading.Thread(target=_read_progress, args=(proc.stdout, on_progress), daemon=True))
+    for reader in readers:
+        reader.start()
+
+    suspended = False
+    try:
+        while True:
+            try:
+                proc.wait(timeout=CONTROL_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if control is None:
+                continue
+            if control.cancelled:
+                raise ConversionCancelled("转换已取消")
+            if hasattr(signal, 'SIGSTOP') and control.paused != suspended:
+                suspended = control.paused
+                proc.send_signal(signal.SIGSTOP if suspended else signal.SIGCONT)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        for reader in readers:
+            reader.join()
+    return proc.returncode, b''.join(stderr_chunks)
+
+
+def _read_progress(stream, on_progress):
+    """解析 -progress 输出中的 frame= 行"""
+    for line in stream:
+        if line.startswith(b'frame='):
+            try:
+                on_progress(int(line[6:]))
+            except ValueError:
+                pass
+
+
+def _parse_rate(rate):
+    """把ffprobe的帧率 '30000/1001' 转为浮点数,无效时返回0"""
+    try:
+        num, _, den = rate.partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _probe_with_ffprobe(video_path, ffprobe_binary):
+    """使用ffprobe读取第一条视频流的元数据"""
+    proc = subprocess.run(
+        [ffprobe_binary, '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'stream=codec_name,width,height,avg_frame_rate,r_frame_rate:stream_tags=rotate'
+                          ':stream_side_data=rotation:format=duration',
+         '-of', 'json', str(video_path)],
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        **_popen_params()
+    )
+    if proc.returncode != 0:
+        stderr = proc.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"ffprobe 退出码 {proc.returncode}: {stderr[-500:]}")
+
+    data = json.loads(proc.stdout.decode('utf-8', errors='replace') or '{}')
+    streams = data.get('streams') or []
+    if not streams:
+        raise RuntimeError("没有视频流")
+    stream = streams[0]
+    return {
+        'duration': float(data.get('format', {}).get('duration') or 0.0),
+        'width': int(stream.get('width') or 0),
+        'height': int(stream.get('height') or 0),
+        'fps': _parse_rate(stream.get('avg_frame_rate', '')) or _parse_rate(stream.get('r_frame_rate', '')),
+        'codec': stream.get('codec_name'),
+        'rotation': _parse_rotation(stream)
+    }
+
+
+def _parse_rotation(stream):
+    """ffprobe输出中的旋转角度: 新版本在显示矩阵(side data)中,旧版本在 rotate 标签中"""
+    for side_data in stream.get('side_data_list') or []:
+        if 'rotation' in side_data:
+            return int(round(float(side_data['rotation']))) % 360
+    try:
+        return int((stream.get('tags') or {}).get('rotate', 0)) % 360
+    except ValueError:
+        return 0
+
+
+_DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+_VIDEO_STREAM_RE = re.compile(r'Stream #\d+:\d+.*?: Video: (\w+).*')
+_SIZE_RE = re.compile(r', (\d{2,5})x(\d{2,5})')
+_FPS_RE = re.compile(r', ([\d.]+)(k?) (?:fps|tbr)')
+_ROTATION_RE = re.compile(r'(?:rotation of|rotate\s*:)\s*(-?[\d.]+)')
+
+
+def _probe_with_ffmpeg(video_path, ffmpeg_binary):
+    """没有ffprobe时解析 `ffmpeg -i` 打印的输入信息(不指定输出,ffmpeg只读文件头后退出)"""
+    proc = subprocess.run(
+        [ffmpeg_binary, '-hide_banner', '-i', str(video_path)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        **_popen_params()
+    )
+    stderr = proc.stderr.decode('utf-8', errors='replace')
+    stream = _VIDEO_STREAM_RE.search(stderr)
+    if not stream:
+        raise RuntimeError(stderr.strip().splitlines()[-1] if stderr.strip() else "没有视频流")
+
+    line = stream.group(0)
+    duration = _DURATION_RE.search(stderr)
+    size = _SIZE_RE.search(line)
+    fps = _FPS_RE.search(line)
+    # 旋转信息在视频流之后的元数据/side data中
+    rotation = _ROTATION_RE.search(stderr, stream.start())
+    return {
+        'duration': (int(duration.group(1)) * 3600 + int(duration.group(2)) * 60
+                     + float(duration.group(3))) if duration else 0.0,
+        'width': int(size.group(1)) if size else 0,
+        'height': int(size.group(2)) if size else 0,
+        'fps': float(fps.group(1)) * (1000 if fps.group(2) else 1) if fps else 0.0,
+        'codec': stream.group(1),
+        'rotation': int(round(float(rotation.group(1)))) % 360 if rotation else 0
+    }
+
+
+def probe_video(video_path, ffprobe_binary=None, ffmpeg_binary=None):
+    """
+    读取视频元数据,不启动解码
+    :param video_path: 视频路径
+    :param ffprobe_binary: ffprobe路径,为None时自动查找,找不到则解析ffmpeg的输出
+    :param ffmpeg_binary: ffmpeg路径,默认与moviepy一致
+    :return: {'duration': 秒, 'width': 宽, 'height': 高, 'fps': 帧率, 'codec': 编码格式,
+              'rotation': 播放时的旋转角度(0/90/180/270),宽高为旋转前的编码尺寸}
+    :raises RuntimeError: 文件无法读取或没有视频流
+    """
+    ffprobe_binary = ffprobe_binary or get_ffprobe_binary(ffmpeg_binary)
+    if ffprobe_binary:
+        return _probe_with_ffprobe(video_path, ffprobe_binary)
+    return _probe_with_ffmpeg(video_path, ffmpeg_binary or get_ffmpeg_binary())
@@ -0,0 +1,687 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 流式帧处理管线
+
+解码线程通过有界队列向主线程提供帧,主线程逐帧缩放、量化并写入GIF。
+同一时刻驻留内存的帧数由内存上限决定,长视频不会因帧数多而占满内存。
+动态WebP/APNG 复用同样的解码和缩放前端,缩放后的帧经管道交给ffmpeg编码器(stream_to_animation)。
+fan_out 把一次解码的帧同时分发给多路编码器,一个源文件输出多个档位/格式/片段和封面图
+"""
+import math
+import queue
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from pathlib import Path
+import numpy as np
+from PIL import Image
+import ffmpeg_engine
+from gif_writer import GifBlockWriter, GifStreamWriter
+from metrics import NULL_METRICS, PROGRESS_INTERVAL, ConversionMetrics
+from palette import DEFAULT_SAMPLE_FRAMES, Palette, SceneDetector, sample_frames
+import scheduler
+
+
+# 除队列中的帧外,解码线程正在生成的一帧和主线程正在处理的一帧也占用内存
+IN_FLIGHT_FRAMES = 2
+
+
+def frame_buffer_size(frame_size, max_memory_bytes):
+    """
+    根据内存上限计算解码队列可容纳的帧数
+    :param frame_size: 解码帧尺寸 (宽, 高)
+    :param max_memory_bytes: 帧缓冲内存上限(字节)
+    :return: 队列长度(至少为1)
+    :raises MemoryError: 上限连一帧都容纳不下
+    """
+    width, height = frame_size
+    frame_bytes = width * height * 3
+    buffered = max_memory_bytes // frame_bytes - IN_FLIGHT_FRAMES
+    if buffered < 1:
+        needed_mb = frame_bytes * (IN_FLIGHT_FRAMES + 1) / (1024 * 1024)
+        raise MemoryError(f"内存上限过小,{width}x{height} 的视频至少需要 {needed_mb:.1f} MB")
+    return buffered
+
+
+class _ReaderError:
+    """包装解码线程中的异常,交给消费者重新抛出"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+_END = object()
+
+
+def bounded_frames(frames, max_buffered):
+    """
+    在后台线程中预读帧,队列满时解码线程阻塞等待
+    :param frames: 帧迭代器
+    :param max_buffered: 队列最多缓存的帧数
+    :return: 帧生成器
+    """
+    buffer = queue.Queue(maxsize=max_buffered)
+    stop = threading.Event()
+
+    def put(item):
+        # 消费者提前退出时不再阻塞
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for frame in frames:
+                if not put(frame):
+                    return
+            put(_END)
+        except Exception as e:
+            put(_ReaderError(e))
+
+    reader = threading.Thread(target=produce, daemon=True)
+    reader.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _END:
+                break
+            if isinstance(item, _ReaderError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        reader.join()
+
+
+def frame_delays_ms(fps, start_index=0):
+    """
+    按固定帧率生成每帧的显示时长(毫秒)
+    GIF延时精度为1/100秒,按累计时间取整,避免长视频出现时间漂移
+    :param start_index: 第一帧在整段视频中的序号,分段编码时保证各段拼接后时间轴一致
+    """
+    index = start_index
+    previous = int(round(index * 100.0 / fps))
+    while True:
+        index += 1
+        current = int(round(index * 100.0 / fps))
+        yield (current - previous) * 10
+        previous = current
+
+
+class DeltaEncoder:
+    """
+    帧间差分: 只保留相对上一帧发生变化的矩形区域,区域内未变化的像素标记为透明。
+    帧使用"保留"处置方式叠加在上一帧之上,解码结果与完整帧一致
+    """
+
+    def __init__(self):
+        self._canvas = None
+
+    def encode(self, indices, colors):
+        """
+        :param indices: (H, W) uint8 调色板索引
+        :param colors: (K, 3) uint8 调色板, K 必须小于256以留出透明色
+        :return: (裁剪后的索引, 偏移 (x, y), 透明色索引或None)
+        """
+        rgb = colors[indices]
+        canvas, self._canvas = self._canvas, rgb
+        if canvas is None:
+            return indices, (0, 0), None
+
+        transparent = len(colors)
+        changed = np.any(rgb != canvas, axis=2)
+        rows = np.flatnonzero(changed.any(axis=1))
+        if len(rows) == 0:
+            # 画面无变化,仍需输出一帧占位以保持时间轴
+            return np.full((1, 1), transparent, dtype=np.uint8), (0, 0), transparent
+
+        cols = np.flatnonzero(changed.any(axis=0))
+        top, bottom = rows[0], rows[-1] + 1
+        left, right = cols[0], cols[-1] + 1
+        cropped = indices[top:bottom, left:right].copy()
+        cropped[~changed[top:bottom, left:right]] = transparent
+        return cropped, (int(left), int(top)), transparent
+
+
+class FrameDeduplicator:
+    """
+    重复帧检测: 把帧缩成 64x64 网格,与上一个保留帧逐格比较,
+    所有格子的平均差都不超过阈值时视为重复帧。
+    逐格取最大值而不是整体平均,鼠标指针这类小区域变化不会被当作重复
+    """
+
+    GRID_SIZE = (64, 64)
+
+    def __init__(self, threshold):
+        """
+        :param threshold: 格子平均绝对差阈值(0-255),0表示只丢弃完全相同的帧
+        """
+        self.threshold = threshold
+        self._kept = None
+
+    def is_duplicate(self, image):
+        """
+        :param image: RGB PIL图像
+        :return: 是否与上一个保留帧重复;不重复时该帧成为新的比较基准
+        """
+        grid = np.asarray(image.resize(self.GRID_SIZE, Image.BOX), dtype=np.int16)
+        if self._kept is not None and np.abs(grid - self._kept).max() <= self.threshold:
+            return True
+        self._kept = grid
+        return False
+
+
+def resized_frames(frames, size, metrics=NULL_METRICS, control=None):
+    """
+    各输出格式共用的前端: 每帧检查暂停/取消、计数(用于进度事件)并缩放到输出尺寸
+    :param frames: RGB帧迭代器
+    :param size: 输出尺寸 (宽, 高)
+    :param metrics: ConversionMetrics,记录 resize 阶段耗时
+    :param control: scheduler.JobControl,为None时不检查
+    :return: RGB PIL图像生成器
+    """
+    for frame in frames:
+        if control:
+            control.checkpoint()
+        metrics.advance()
+        with metrics.stage('resize'):
+            image = Image.fromarray(frame)
+            if image.size != size:
+                image = image.resize(size, Image.LANCZOS)
+        yield image
+
+
+def _quantize(image, colors, palette):
+    """
+    量化一帧
+    :return: ((H, W) uint8 索引, (K, 3) uint8 调色板)
+    """
+    if palette is None:
+        quantized = image.quantize(colors, method=Image.Quantize.FASTOCTREE)
+        table = np.array(quantized.getpalette()[:colors * 3], dtype=np.uint8).reshape(-1, 3)
+        return np.asarray(quantized), table
+    return palette.map(np.asarray(image)), palette.colors
+
+
+def split_scene_buffer(max_buffered, palette_mode):
+    """
+    'scene' 模式下把帧缓冲一分为二,一半留给解码队列,一半缓冲当前场景的帧;其他模式不缓冲场景
+    :param max_buffered: 内存上限可容纳的帧数,见 frame_buffer_size
+    :return: (解码队列长度, 场景缓冲帧数)
+    """
+    if palette_mode != 'scene':
+        return max_buffered, 0
+    scene_frames = max(1, max_buffered // 2)
+    return max(1, max_buffered - scene_frames), scene_frames
+
+
+def _deduplicated(images, delays, dedup, dropped, metrics=NULL_METRICS):
+    """
+    去重: 丢弃与上一个保留帧重复的帧,把时长合并到该帧;每帧延后一步产出,以便合并后续重复帧的时长
+    :param images: RGB PIL图像迭代器
+    :param delays: 每帧显示时长(毫秒)迭代器
+    :param dedup: FrameDeduplicator,为None时不去重
+    :param dropped: 单元素列表,累加丢弃的帧数
+    :param metrics: ConversionMetrics,重复帧比较计入 quantize 阶段
+    :return: (图像, 显示时长) 生成器
+    """
+    pending = None
+    for image, duration_ms in zip(images, delays):
+        with metrics.stage('quantize'):
+            is_duplicate = dedup and dedup.is_duplicate(image)
+        if is_duplicate:
+            pending[1] += duration_ms
+            dropped[0] += 1
+            continue
+        if pending:
+            yield tuple(pending)
+        pending = [image, duration_ms]
+    if pending:
+        yield tuple(pending)
+
+
+def _scene_palettes(frames, colors, scene_frames, metrics=NULL_METRICS, detector=None):
+    """
+    'scene' 模式: 缓冲每个场景的帧,直到下一次场景切换(或缓冲区满),
+    从缓冲帧中均匀抽取 DEFAULT_SAMPLE_FRAMES 帧生成该场景的调色板,场景中之后的帧沿用该调色板
+    :param frames: (图像, 显示时长) 迭代器
+    :param scene_frames: 场景缓冲的最大帧数,超出场景缓冲的长场景只从开头的这些帧中抽样
+    :param detector: 场景切换检测器,默认为 SceneDetector()
+    :return: (图像, 显示时长, Palette) 生成器
+    """
+    detector = detector or SceneDetector()
+    buffered = []
+    palette = None
+
+    def flush():
+        step = len(buffered) / min(len(buffered), DEFAULT_SAMPLE_FRAMES)
+        samples = [np.asarray(buffered[int(k * step)][0]) for k in range(min(len(buffered), DEFAULT_SAMPLE_FRAMES))]
+        with metrics.stage('palette'):
+            scene_palette = Palette.from_frames(samples, colors)
+        for image, duration_ms in buffered:
+            yield image, duration_ms, scene_palette
+        buffered.clear()
+        return scene_palette
+
+    for image, duration_ms in frames:
+        with metrics.stage('palette'):
+            is_cut = detector.is_cut(image)
+        if is_cut:
+            if buffered:
+                yield from flush()
+            palette = None
+        if palette is not None:
+            yield image, duration_ms, palette
+            continue
+        buffered.append((image, duration_ms))
+        if len(buffered) >= scene_frames:
+            palette = yield from flush()
+    if buffered:
+        yield from flush()
+
+
+def _encode_frames(frames, delays, writer, size, colors, palette_mode, fixed_palette=None,
+                   optimize=False, dedup_threshold=None, metrics=NULL_METRICS, control=None, scene_frames=1):
+    """
+    管线核心: 缩放、去重、量化、差分后交给写入器
+    :param frames: RGB帧迭代器
+    :param delays: 每帧显示时长(毫秒)迭代器
+    :param writer: GifStreamWriter 或 GifBlockWriter
+    :param fixed_palette: 'global' 模式下预先生成的调色板
+    :param metrics: ConversionMetrics,记录 resize/palette/quantize 阶段耗时和帧数(并按间隔报告进度)
+    :param control: scheduler.JobControl,每帧之前检查暂停/取消;暂停时解码线程随队列填满而阻塞
+    :param scene_frames: 'scene' 模式下场景缓冲的最大帧数,见 split_scene_buffer
+    :return: 丢弃的重复帧数
+    """
+    # 差分需要一个调色板索引表示透明
+    if optimize:
+        colors = min(colors, 255)
+
+    delta = DeltaEncoder() if optimize else None
+    dedup = FrameDeduplicator(dedup_threshold) if dedup_threshold is not None else None
+    dropped = [0]
+    kept = _deduplicated(resized_frames(frames, size, metrics, control), delays, dedup, dropped, metrics)
+    if palette_mode == 'scene':
+        paletted = _scene_palettes(kept, colors, max(1, scene_frames), metrics)
+    else:
+        current_palette = fixed_palette if palette_mode == 'global' else None
+        paletted = ((image, duration_ms, current_palette) for image, duration_ms in kept)
+
+    for image, duration_ms, current_palette in paletted:
+        with metrics.stage('quantize'):
+            indices, table = _quantize(image, colors, current_palette)
+        if delta:
+            with metrics.stage('quantize'):
+                indices, offset, transparency = delta.encode(indices, table)
+            # 透明色占用调色板末尾的一个额外条目
+            writer.write_frame(indices=indices, palette=table.tobytes() + b'\x00\x00\x00',
+                               duration_ms=duration_ms, offset=offset,
+                               transparency=transparency, disposal=1)
+        else:
+            writer.write_frame(indices=indices, palette=table.tobytes(), duration_ms=duration_ms)
+    return dropped[0]
+
+
+def _global_palette(clip, size, colors, optimize):
+    """从抽样帧生成全局调色板"""
+    return Palette.from_frames(sample_frames(clip, size=size), min(colors, 255) if optimize else colors)
+
+
+def stream_to_gif(clip, output_path, fps, colors, max_memory_bytes, size=None, palette_mode='frame',
+                  optimize=False, dedup_threshold=None, metrics=NULL_METRICS, control=None):
+    """
+    流式转换: 逐帧读取、缩放、量化并写入GIF
+    :param clip: moviepy 视频剪辑,或解码端已完成抽帧和缩放的 ffmpeg_engine.FrameReader
+    :param output_path: 输出GIF路径
+    :param fps: 输出帧率
+    :param colors: 调色板颜色数
+    :param max_memory_bytes: 帧缓冲内存上限(字节)
+    :param size: 输出尺寸 (宽, 高),为None时保持原尺寸
+    :param palette_mode: 调色板模式
+        'frame'  每帧单独量化
+        'global' 抽样帧生成一个全局调色板,所有帧查表映射
+        'scene'  缓冲每个场景的帧,从中均匀抽样生成该场景的调色板(场景缓冲占帧缓冲内存上限的一半)
+    :param optimize: 是否启用帧间差分(裁剪变化区域 + 透明像素)
+    :param dedup_threshold: 重复帧阈值,见 FrameDeduplicator;为None时不去重
+    :param metrics: ConversionMetrics,记录各阶段耗时
+    :param control: scheduler.JobControl,每帧之前检查暂停/取消
+    :return: 统计信息 {'frames': 写入帧数, 'frames_dropped': 丢弃的重复帧数}
+    """
+    max_buffered, scene_frames = split_scene_buffer(frame_buffer_size(clip.size, max_memory_bytes), palette_mode)
+    size = tuple(size) if size else tuple(clip.size)
+    fixed_palette = None
+    if palette_mode == 'global':
+        with metrics.stage('palette'):
+            fixed_palette = _global_palette(clip, size, colors, optimize)
+
+    source = metrics.timed(clip.iter_frames(fps=fps, dtype='uint8'), 'decode')
+    frames = bounded_frames(source, max_buffered)
+    try:
+        with GifStreamWriter(output_path, size, metrics=metrics) as writer:
+            dropped = _encode_frames(frames, frame_delays_ms(fps), writer, size, colors, palette_mode,
+                                     fixed_palette, optimize, dedup_threshold, metrics, control, scene_frames)
+            return {'frames': writer.frame_count, 'frames_dropped': dropped}
+    finally:
+        frames.close()
+
+
+def stream_to_animation(clip, output_path, fps, max_memory_bytes, quality_settings, size=None,
+                        metrics=NULL_METRICS, control=None):
+    """
+    流式转换为动态WebP或APNG: 解码和缩放与 stream_to_gif 相同,
+    缩放后的帧经管道逐帧交给ffmpeg编码器,边编码边写文件。
+    这两种格式没有调色板,不做量化和帧间差分;恒定帧率输入,不做重复帧合并
+    (libwebp 的动画编码器会自行合并完全相同的帧)
+    :param quality_settings: 质量配置字典,format 为 'webp'、'webp_lossless' 或 'apng'
+    其余参数同 stream_to_gif
+    :return: 统计信息 {'frames': 写入帧数, 'frames_dropped': 0}
+    """
+    max_buffered = frame_buffer_size(clip.size, max_memory_bytes)
+    size = tuple(size) if size else tuple(clip.size)
+
+    source = metrics.timed(clip.iter_frames(fps=fps, dtype='uint8'), 'decode')
+    frames = bounded_frames(source, max_buffered)
+    try:
+        with ffmpeg_engine.FramePipeWriter(output_path, size, fps, quality_settings, metrics=metrics) as writer:
+            for image in resized_frames(frames, size, metrics, control):
+                writer.write_frame(image)
+        return {'frames': writer.frame_count, 'frames_dropped': 0}
+    finally:
+        frames.close()
+
+
+# fan_out 中 format 为该值的输出只保存一帧静态封面图
+POSTER_FORMAT = 'poster'
+
+
+class FanOutTarget:
+    """fan_out 的一路输出: 从共享的解码帧中按自己的帧率和时间范围取帧"""
+
+    def __init__(self, output_path, quality_settings, size, start, frame_count):
+        """
+        :param output_path: 输出路径
+        :param quality_settings: 质量配置字典,format 为 POSTER_FORMAT 时输出一帧静态图(格式由扩展名决定)
+        :param size: 输出尺寸 (宽, 高)
+        :param start: 第一帧相对读取器起点的时刻(秒)
+        :param frame_count: 输出帧数
+        """
+        self.output_path = output_path
+        self.quality_settings = quality_settings
+        self.fps = quality_settings['fps']
+        self.size = tuple(size)
+        self.start = start
+        self.frame_count = frame_count
+        self.metrics = ConversionMetrics(Path(output_path).name)
+        self.palette = None
+        self.queue = None
+        self.scene_frames = 0
+        self.closed = threading.Event()
+        self.ended = False
+        self.result = None
+        self.error = None
+        self._next_frame = 0
+
+    @property
+    def complete(self):
+        """所需的帧是否都已分发"""
+        return self._next_frame >= self.frame_count
+
+    def take(self, index, source_fps):
+        """
+        读取器第 index 帧要分发给该输出的次数: 输出帧取不晚于其时刻的最后一个解码帧(与 moviepy get_frame 一致),
+        输出帧率高于解码帧率时同一帧重复多次
+        """
+        count = 0
+        while not self.complete and \
+                math.floor((self.start + self._next_frame / self.fps) * source_fps + 1e-5) <= index:
+            self._next_frame += 1
+            count += 1
+        return count
+
+
+def _offer(target, item):
+    """放入输出队列,队列满时等待(背压);该路已结束时丢弃"""
+    while not target.closed.is_set():
+        try:
+            target.queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _target_frames(target):
+    """从输出队列取帧的生成器"""
+    while True:
+        item = target.queue.get()
+        if item is _END:
+            return
+        if isinstance(item, _ReaderError):
+            raise item.error
+        frame, count = item
+        for _ in range(count):
+            yield frame
+
+
+def _encode_target(target, control):
+    """编码线程: 把队列中的帧编码为该路的输出文件,结果或异常记录在 target 上"""
+    settings = target.quality_settings
+    metrics = target.metrics
+    frames = _target_frames(target)
+    try:
+        if settings['format'] == POSTER_FORMAT:
+            for image in resized_frames(frames, target.size, metrics, control):
+                with metrics.stage('write'):
+                    image.save(target.output_path, quality=90)
+                target.result = {'frames': 1, 'frames_dropped': 0}
+                return
+            raise RuntimeError("没有读取到封面帧")
+
+        if settings['format'] != 'gif':
+            with ffmpeg_engine.FramePipeWriter(target.output_path, target.size, target.fps, settings,
+                                               metrics=metrics) as writer:
+                for image in resized_frames(frames, target.size, metrics, control):
+                    writer.write_frame(image)
+            target.result = {'frames': writer.frame_count, 'frames_dropped': 0}
+            return
+
+        with GifStreamWriter(target.output_path, target.size, metrics=metrics) as writer:
+            dropped = _encode_frames(frames, frame_delays_ms(target.fps), writer, target.size, settings['colors'],
+                                     settings.get('palette', 'frame'), target.palette, settings['optimize'],
+                                     settings.get('dedup'), metrics, control, target.scene_frames)
+        target.result = {'frames': writer.frame_count, 'frames_dropped': dropped}
+    except BaseException as e:
+        target.error = e
+    finally:
+        frames.close()
+        target.closed.set()
+
+
+def fan_out(reader, targets, max_memory_bytes, metrics=NULL_METRICS, control=None):
+    """
+    一次解码,多路输出: 读取器在解码端把每帧同时缩放为各路的尺寸,
+    再按各路的帧率和时间范围分发给各路的编码线程(GIF / 动态WebP / APNG / 封面图)。
+    每路有一个有界队列,同一帧在各队列中共享而不复制;任何一路编码较慢时解码随其队列填满而阻塞(背压),
+    驻留内存的帧数不超过内存上限。某一路失败只结束该路,其余各路继续;所有路都取够帧后提前停止解码
+    :param reader: ffmpeg_engine.StackedFrameReader,尺寸包含各路的输出尺寸,时间范围覆盖各路输出
+    :param targets: FanOutTarget 列表
+    :param max_memory_bytes: 帧缓冲内存上限(字节),由各路队列平分
+    :param metrics: ConversionMetrics,记录 decode 阶段并按解码帧数报告进度;各路的阶段耗时结束后合并进来
+    :param control: scheduler.JobControl,解码和各路编码每帧之前检查暂停/取消
+    :return: 与 targets 顺序一致的 [(成功标志, 统计信息或异常), ...]
+    """
+    max_buffered = max(1, frame_buffer_size(reader.size, max_memory_bytes) // len(targets))
+    for target in targets:
+        queue_size, target.scene_frames = split_scene_buffer(max_buffered, target.quality_settings.get('palette'))
+        target.queue = queue.Queue(maxsize=queue_size)
+        if target.quality_settings['format'] == 'gif' and target.quality_settings.get('palette') == 'global':
+            # 抽样只定位读取少数几帧,在开始解码之前完成
+            sampler = ffmpeg_engine.FrameReader(reader.video_path, target.fps, target.size,
+                                                target.frame_count / target.fps, start=reader.start + target.start,
+                                                ffmpeg_binary=reader.ffmpeg_binary)
+            try:
+                with target.metrics.stage('palette'):
+                    target.palette = _global_palette(sampler, target.size, target.quality_settings['colors'],
+                                                     target.quality_settings['optimize'])
+            finally:
+                sampler.close()
+
+    encoders = [threading.Thread(target=_encode_target, args=(target, control), daemon=True) for target in targets]
+    for encoder in encoders:
+        encoder.start()
+
+    source = reader.frames()
+    end = _END
+    try:
+        for index, frame in enumerate(metrics.timed(source, 'decode')):
+            if control:
+                control.checkpoint()
+            metrics.advance()
+            views = reader.split(frame)
+            for target in targets:
+                count = target.take(index, reader.fps)
+                if count:
+                    _offer(target, (views[target.size], count))
+                if target.complete and not target.ended:
+                    _offer(target, _END)
+                    target.ended = True
+            if all(target.ended or target.closed.is_set() for target in targets):
+                break
+    except Exception as e:
+        end = _ReaderError(e)
+    finally:
+        source.close()
+
+    for target in targets:
+        if not target.ended:
+            _offer(target, end)
+    for encoder in encoders:
+        encoder.join()
+
+    outcomes = []
+    for target in targets:
+        metrics.merge(target.metrics.stages)
+        outcomes.append((True, target.result) if target.error is None else (False, target.error))
+    return outcomes
+
+
+def encode_segment(video_path, first_frame, last_frame, chunk_path, fps, colors, max_memory_bytes,
+                   size, palette_mode, palette_colors=None, optimize=False, dedup_threshold=None,
+                   start_time=0.0, decode_scaling=False):
+    """
+    进程池任务: 编码 [first_frame, last_frame) 区间的帧,写成不含文件头的数据块文件
+    每段的第一帧总是完整帧,因此各段可以直接首尾拼接
+    :param palette_colors: 'global' 模式下共享的 (K, 3) 调色板
+    :param start_time: 第0帧在源视频中的时刻(秒),只转换部分片段时使用
+    :param decode_scaling: 是否由 ffmpeg_engine.FrameReader 在解码端完成抽帧和缩放
+    :return: (写入帧数, 丢弃的重复帧数, 各阶段耗时)
+    暂停/取消由进程池 initializer 传入的 JobControl 控制,完成的帧数累加到 initializer 传入的共享计数器
+    """
+    from moviepy.editor import VideoFileClip
+
+    metrics = ConversionMetrics(Path(video_path).name, shared_frames=_segment_frames)
+    with metrics.stage('load'):
+        if decode_scaling:
+            clip = ffmpeg_engine.FrameReader(video_path, fps, size, last_frame / fps, start=start_time)
+        else:
+            clip = VideoFileClip(str(video_path), audio=False)
+    try:
+        max_buffered, scene_frames = split_scene_buffer(frame_buffer_size(clip.size, max_memory_bytes),
+                                                        palette_mode)
+        with metrics.stage('palette'):
+            fixed_palette = Palette(palette_colors) if palette_colors is not None else None
+        if decode_scaling:
+            source = clip.frames(first_frame, last_frame)
+        else:
+            # 请求时刻对齐到源视频的帧起点: 与顺序读取取到同一帧,且分段起点的跳转落在帧边界上
+            source = (
+                clip.get_frame(math.floor((start_time + i / fps) * clip.fps + 1e-5) / clip.fps).astype('uint8')
+                for i in range(first_frame, last_frame)
+            )
+        frames = bounded_frames(metrics.timed(source, 'decode'), max_buffered)
+        try:
+            # 各分段已各占一个进程,段内逐帧压缩,不再开压缩线程
+            with GifBlockWriter(chunk_path, metrics=metrics, compress_workers=1) as writer:
+                dropped = _encode_frames(frames, frame_delays_ms(fps, first_frame), writer, tuple(size),
+                                         colors, palette_mode, fixed_palette, optimize, dedup_threshold,
+                                         metrics, scheduler.worker_control(), scene_frames)
+                return writer.frame_count, dropped, metrics.stages
+        finally:
+            frames.close()
+    finally:
+        clip.close()
+
+
+_segment_frames = None
+
+
+def _init_segment_worker(control, shared_frames):
+    """分段进程池 initializer: 记录暂停/取消控制和共享的帧计数器"""
+    global _segment_frames
+    scheduler.init_worker(control)
+    _segment_frames = shared_frames
+
+
+def segmented_stream_to_gif(clip, video_path, output_path, fps, colors, max_memory_bytes, workers,
+                            size=None, palette_mode='frame', optimize=False, dedup_threshold=None,
+                            metrics=NULL_METRICS, start_time=0.0, control=None, decode_scaling=False):
+    """
+    分段并行的流式转换: 把视频按帧序号切成若干段,在进程池中并行编码,
+    再按顺序把各段的帧数据块拼接成一个GIF,拼接时不重新编码。
+    'global' 模式下各段共享同一个抽样调色板;内存上限对每个分段进程分别生效
+    :param clip: 已打开的 moviepy 视频剪辑(或其片段)或 FrameReader,用于读取时长和抽样调色板
+    :param video_path: 视频文件路径,各子进程自行打开
+    :param start_time: clip 的第0秒在源视频中的时刻,clip 为 subclip 片段时使用
+    :param workers: 分段数(同时也是进程数)
+    :param metrics: ConversionMetrics,各分段进程的阶段耗时会合并进来(为各进程耗时之和);
+                    等待各分段时按各进程完成帧数的合计报告进度
+    :param control: scheduler.JobControl,传给各分段进程,每帧之前检查暂停/取消
+    :param decode_scaling: 各分段进程是否在解码端完成抽帧和缩放(ffmpeg_engine.FrameReader),
+                           否则用 moviepy 按源分辨率解码后缩放
+    其余参数同 stream_to_gif
+    :return: 统计信息 {'frames': 写入帧数, 'frames_dropped': 丢弃的重复帧数}
+    """
+    size = tuple(size) if size else tuple(clip.size)
+    palette_colors = None
+    if palette_mode == 'global':
+        with metrics.stage('palette'):
+            palette_colors = _global_palette(clip, size, colors, optimize).colors
+
+    # 与 iter_frames 一致: 取 t = i / fps < duration 的帧
+    total_frames = int(math.ceil(clip.duration * fps - 1e-6))
+    workers = max(1, min(workers, total_frames))
+    bounds = [total_frames * k // workers for k in range(workers + 1)]
+
+    output_path = Path(output_path)
+    with tempfile.TemporaryDirectory(prefix='.segments-', dir=output_path.parent) as tmp_dir:
+        chunk_paths = [Path(tmp_dir) / f'{k:04d}.blocks' for k in range(workers)]
+        shared_frames = multiprocessing.Value('q', 0)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_segment_worker,
+                                 initargs=(control, shared_frames)) as executor:
+            futures = [
+                executor.submit(encode_segment, video_path, bounds[k], bounds[k + 1], chunk_paths[k], fps,
+                                colors, max_memory_bytes, size, palette_mode, palette_colors,
+                                optimize, dedup_threshold, start_time, decode_scaling)
+                for k in range(workers)
+            ]
+            while wait(futures, timeout=PROGRESS_INTERVAL).not_done:
+                metrics.report_progress(shared_frames.value)
+            segment_stats = [future.result() for future in futures]
+
+        for _, _, stages in segment_stats:
+            metrics.merge(stages)
+        metrics.frames += sum(frame_count + dropped for frame_count, dropped, _ in segment_stats)
+
+        with GifStreamWriter(output_path, size, metrics=metrics) as writer:
+            for chunk_path, (frame_count, _, _) in zip(chunk_paths, segment_stats):
+                with metrics.stage('write'):
+                    writer.append_blocks(chunk_path, frame_count)
+            return {
+                'frames': writer.frame_count,
+                'frames_dropped': sum(dropped for _, dropped, _ in segment_stats)
+            }
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 流式GIF写入器
+
+逐帧把已量化的调色板图像写入GIF文件,写完即释放,内存占用与视频时长无关。
+LZW压缩默认使用Pillow的C编码器(压缩期间释放GIL),在线程池中逐帧并行压缩,按帧顺序经缓冲写入文件;
+Pillow的GIF编码接口不可用时使用纯Python的数组码表编码器(lzw_encode)。
+两种编码器的输出由 test_gif_writer.py 用Pillow解码校验
+"""
+import io
+import os
+import shutil
+import struct
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image, ImageFile
+from metrics import NULL_METRICS
+
+
+BLOCK_COPY_SIZE = 1024 * 1024
+# 输出文件的写缓冲大小,帧数据块较小,合并后再写盘
+WRITE_BUFFER_SIZE = 1024 * 1024
+# 并行压缩的最大线程数,LZW只占转换耗时的一小部分,更多线程没有收益
+MAX_COMPRESS_WORKERS = 4
+# 每个压缩线程最多积压的帧数,超出时等待最早的一帧写出,内存占用有上限
+PENDING_FRAMES_PER_WORKER = 2
+# GIF规定最长12位码,码表最多4096项
+MAX_CODES = 4096
+# 帧数据的最小码长,调色板索引为8位
+MIN_CODE_SIZE = 8
+# Pillow 的GIF编码器是私有接口,不可用时退回纯Python编码器
+PILLOW_LZW = hasattr(ImageFile, '_save') and hasattr(Image.core, 'gif_encoder')
+
+_tables = threading.local()
+
+
+def default_compress_workers():
+    """并行压缩的线程数: CPU核数,不超过 MAX_COMPRESS_WORKERS;单核时为1(在调用线程中压缩)"""
+    return max(1, min(MAX_COMPRESS_WORKERS, os.cpu_count() or 1))
+
+
+def _palette_bits(palette_len):
+    """调色板(RGB字节)所需的位数,GIF颜色表长度必须为2的幂"""
+    colors = max(2, palette_len // 3)
+    bits = 1
+    while (1 << bits) < colors:
+        bits += 1
+    return bits
+
+
+def _padded_palette(palette):
+    """把调色板补齐到2的幂个颜色"""
+    bits = _palette_bits(len(palette))
+    return bytes(palette) + b'\x00' * ((3 << bits) - len(palette)), bits
+
+
+def _child_table():
+    """
+    当前线程的LZW子节点表: child[前缀码 * 256 + 字节] 为对应字符串的码,0表示不存在。
+    扁平的 uint16 数组(2MB),每个线程分配一次,用完只清零写过的项
+    """
+    table = getattr(_tables, 'child', None)
+    if table is None:
+        table = _tables.child = array('H', bytes(2 * MAX_CODES * 256))
+    return table
+
+
+def lzw_encode(data, min_code_size=MIN_CODE_SIZE):
+    """
+    GIF变长码LZW压缩,码表为扁平数组,不为每个码建立字符串、元组或字典项;
+    码按小端位序累积在一个整数中,每满32位写出4字节
+    :param data: 调色板索引字节(每个值小于 2 ** min_code_size)
+    :param min_code_size: 最小码长(2-8)
+    :return: 压缩码流(以清除码开头、结束码结尾,尚未分成数据子块)
+    """
+    clear = 1 << min_code_size
+    end = clear + 1
+    child = _child_table()
+    used = []
+    out = bytearray()
+    code_size = min_code_size + 1
+    limit = 1 << code_size
+    next_code = end + 1
+    bit_buffer = clear
+    bit_count = code_size
+    try:
+        symbols = iter(data)
+        prefix = next(symbols, None)
+        if prefix is not None:
+            for byte in symbols:
+                key = (prefix << 8) | byte
+                code = child[key]
+                if code:
+                    prefix = code
+                    continue
+                bit_buffer |= prefix << bit_count
+                bit_count += code_size
+                if bit_count >= 32:
+                    out += (bit_buffer & 0xFFFFFFFF).to_bytes(4, 'little')
+                    bit_buffer >>= 32
+                    bit_count -= 32
+                if next_code < MAX_CODES:
+                    child[key] = next_code
+                    used.append(key)
+                    next_code += 1
+                    # 解码端比编码端晚一个码建表,码表项数超过当前码长的表示范围后才加宽
+                    if next_code > limit and code_size < 12:
+                        code_size += 1
+                        limit <<= 1
+                else:
+                    # 码表已满: 以当前码长写出清除码,重新建表
+                    bit_buffer |= clear << bit_count
+                    bit_count += code_size
+                    for key in used:
+                        child[key] = 0
+                    used.clear()
+                    code_size = min_code_size + 1
+                    limit = 1 << code_size
+                    next_code = end + 1
+                prefix = byte
+            bit_buffer |= prefix << bit_count
+            bit_count += code_size
+            # 解码端读到最后一个码后仍会建表,结束码按它此时的码长写出
+            if next_code >= limit and code_size < 12:
+                code_size += 1
+    finally:
+        for key in used:
+            child[key] = 0
+    bit_buffer |= end << bit_count
+    bit_count += code_size
+    out += bit_buffer.to_bytes((bit_count + 7) // 8, 'little')
+    return bytes(out)
+
+
+def _sub_blocks(data):
+    """把码流分成最长255字节的数据子块,末尾加块终止符"""
+    out = bytearray()
+    for start in range(0, len(data), 255):
+        chunk = data[start:start + 255]
+        out.append(len(chunk))
+        out += chunk
+    out.append(0)
+    return bytes(out)
+
+
+def encode_frame_data(indices, compressor=None):
+    """
+    对调色板索引进行LZW压缩
+    :param indices: (H, W) uint8 调色板索引数组
+    :param compressor: 'pillow'(C编码器)或 'array'(lzw_encode),默认在Pillow可用时使用 'pillow'
+    :return: 最小码长字节 + 数据子块 + 块终止符
+    """
+    compressor = compressor or ('pillow' if PILLOW_LZW else 'array')
+    if compressor == 'array':
+        return bytes([MIN_CODE_SIZE]) + _sub_blocks(lzw_encode(indices.tobytes()))
+    if compressor != 'pillow':
+        raise ValueError(f"不支持的LZW编码器: {compressor}")
+
+    height, width = indices.shape
+    image = Image.frombytes('P', (width, height), indices.tobytes())
+    image.encoderconfig = (8, False)
+
+    buf = io.BytesIO()
+    buf.write(bytes([MIN_CODE_SIZE]))
+    ImageFile._save(image, buf, [('gif', (0, 0) + image.size, 0, 'P')])
+    buf.write(b'\x00')
+    return buf.getvalue()
+
+
+class GifBlockWriter:
+    """
+    只写帧数据块(图形控制扩展 + 图像描述符 + 颜色表 + 压缩数据)的写入器,
+    不含文件头和文件尾。分段并行编码时各段先写成数据块文件,再由 GifStreamWriter 拼接。
+    compress_workers 大于1时各帧提交到线程池压缩,调用方可继续量化下一帧,压缩完的帧按提交顺序写出
+    """
+
+    def __init__(self, path, metrics=NULL_METRICS, compress_workers=None, compressor=None):
+        """
+        :param path: 输出文件路径
+        :param metrics: ConversionMetrics,记录 encode(LZW压缩) 和 write(写文件) 阶段耗时;
+                        并行压缩时 encode 为等待压缩完成的时间
+        :param compress_workers: 并行压缩的线程数,默认为 default_compress_workers(),1表示在调用线程中压缩
+        :param compressor: LZW编码器,见 encode_frame_data
+        """
+        self.frame_count = 0
+        self.metrics = metrics
+        self.compressor = compressor
+        self._fp = open(path, 'wb', buffering=WRITE_BUFFER_SIZE)
+        compress_workers = compress_workers or default_compress_workers()
+        self._executor = None
+        if compress_workers > 1:
+            self._executor = ThreadPoolExecutor(compress_workers, thread_name_prefix='gif-lzw')
+        self._max_pending = compress_workers * PENDING_FRAMES_PER_WORKER
+        # 已提交、尚未写出的帧: (帧头字节, 压缩数据或 Future)
+        self._pending = deque()
+
+    def write_frame(self, indices, palette, duration_ms, offset=(0, 0),
+                    transparency=None, disposal=1, frame_data=None):
+        """
+        写入一帧
+        :param indices: (H, W) uint8 调色板索引数组
+        :param palette: RGB调色板字节
+        :param duration_ms: 帧显示时长(毫秒)
+        :param offset: 帧在画布上的位置 (x, y)
+        :param transparency: 透明色索引,None表示不透明
+        :param disposal: 帧处置方式 (1=保留, 2=恢复背景)
+        :param frame_data: 预先压缩好的数据(encode_frame_data 的结果),为None时现场压缩
+        """
+        # 图形控制扩展: 处置方式、透明色和延时(单位1/100秒)
+        packed = (disposal & 0x07) << 2
+        if transparency is not None:
+            packed |= 0x01
+        delay = min(0xFFFF, max(1, int(round(duration_ms / 10.0))))
+        control = b'\x21\xf9\x04' + struct.pack('<BHB', packed, delay, transparency or 0) + b'\x00'
+
+        # 图像描述符 + 局部颜色表
+        table, bits = _padded_palette(palette)
+        height, width = indices.shape
+        descriptor = b'\x2c' + struct.pack('<HHHHB', offset[0], offset[1], width, height, 0x80 | (bits - 1))
+        head = control + descriptor + table
+
+        if frame_data is None and self._executor:
+            # indices 提交后不再被调用方修改(管线每帧生成新数组)
+            self._pending.append((head, self._executor.submit(encode_frame_data, indices, self.compressor)))
+        else:
+            if frame_data is None:
+                with self.metrics.stage('encode'):
+                    frame_data = encode_frame_data(indices, self.compressor)
+            self._pending.append((head, frame_data))
+        self.frame_count += 1
+        self._drain(self._max_pending)
+
+    def _drain(self, limit):
+        """
+        按提交顺序写出已压缩完的帧
+        :param limit: 允许积压的帧数,超出时等待最早的一帧压缩完成;0表示全部写出
+        """
+        while self._pending:
+            head, frame_data = self._pending[0]
+            if isinstance(frame_data, Future):
+                if not frame_data.done() and len(self._pending) <= limit:
+                    break
+                with self.metrics.stage('encode'):
+                    frame_data = frame_data.result()
+            self._pending.popleft()
+            with self.metrics.stage('write'):
+                self._fp.write(head)
+                self._fp.write(frame_data)
+
+    def flush(self):
+        """等待所有已提交的帧压缩完成并写出"""
+        self._drain(0)
+
+    def close(self):
+        """写出剩余的帧并关闭文件"""
+        try:
+            if self._fp:
+                self.flush()
+        finally:
+            self._release()
+
+    def _release(self):
+        """停止压缩线程并关闭文件,不再写出积压的帧"""
+        # 逐个取消尚未开始的压缩任务(shutdown 的 cancel_futures 参数需要 Python 3.9)
+        for head, frame_data in self._pending:
+            if isinstance(frame_data, Future):
+                frame_data.cancel()
+        self._pending.clear()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 出错或取消时输出文件会被删除,不必等待积压的帧
+        if exc_type:
+            self._release()
+        else:
+            self.close()
+
+
+class GifStreamWriter(GifBlockWriter):
+    """流式GIF写入器"""
+
+    def __init__(self, path, size, loop=0, metrics=NULL_METRICS, compress_workers=None, compressor=None):
+        """
+        打开输出文件并写入文件头
+        :param path: 输出GIF路径
+        :param size: 画布尺寸 (宽, 高)
+        :param loop: 循环次数,0表示无限循环
+        :param metrics: ConversionMetrics,见 GifBlockWriter
+        :param compress_workers: 并行压缩的线程数,见 GifBlockWriter
+        :param compressor: LZW编码器,见 encode_frame_data
+        """
+        super().__init__(path, metrics, compress_workers, compressor)
+        self.size = size
+        self._write_header(loop)
+
+    def _write_header(self, loop):
+        width, height = self.size
+        # 不使用全局颜色表,每帧携带局部颜色表
+        self._fp.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0x70, 0, 0))
+        self._fp.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', loop) + b'\x00')
+
+    def append_blocks(self, path, frame_count):
+        """
+        原样拼接 GifBlockWriter 写出的数据块文件,不重新编码
+        :param path: 数据块文件路径
+        :param frame_count: 该文件包含的帧数
+        """
+        self.flush()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self._fp, BLOCK_COPY_SIZE)
+        self.frame_count += frame_count
+
+    def close(self):
+        """写出剩余的帧和文件尾并关闭文件"""
+        try:
+            if self._fp:
+                self.flush()
+                self._fp.write(b'\x3b')
+        finally:
+            self._release()
+
+
+def _skip_sub_blocks(f):
+    """跳过一串数据子块(直到块终止符)"""
+    while True:
+        length = f.read(1)
+        if not length or length[0] == 0:
+            return
+        f.seek(length[0], os.SEEK_CUR)
+
+
+def pad_final_delay(path, total_ms):
+    """
+    延长GIF最后一帧的显示时长,使各帧时长之和达到 total_ms(不缩短原有时长)。
+    ffmpeg 的 mpdecimate 丢弃末尾的重复帧后,GIF复用器不会把它们的时长计入最后一帧,由此补上
+    :param path: GIF文件路径,原地修改
+    :param total_ms: 动画应有的总时长(毫秒)
+    :return: 文件中的帧数
+    """
+    delays = []
+    with open(path, 'r+b') as f:
+        header = f.read(13)
+        if len(header) < 13 or header[:3] != b'GIF':
+            raise ValueError(f"不是GIF文件: {path}")
+        if header[10] & 0x80:
+            f.seek(3 << ((header[10] & 0x07) + 1), os.SEEK_CUR)
+        frames = 0
+        while True:
+            introducer = f.read(1)
+            if not introducer or introducer == b'\x3b':
+                break
+            if introducer == b'\x21':
+                label = f.read(1)
+                if label == b'\xf9':
+                    block = f.read(6)
+                    # 块长度(4)、标志、延时(2字节,1/100秒)、透明色、块终止符
+                    delays.append((f.tell() - 4, struct.unpack('<H', block[2:4])[0]))
+                else:
+                    _skip_sub_blocks(f)
+            elif introducer == b'\x2c':
+                descriptor = f.read(9)
+                if descriptor[8] & 0x80:
+                    f.seek(3 << ((descriptor[8] & 0x07) + 1), os.SEEK_CUR)
+                f.read(1)
+                _skip_sub_blocks(f)
+                frames += 1
+            else:
+                raise ValueError(f"GIF数据块无法识别: {path}")
+
+        if delays:
+            position, last = delays[-1]
+            padded = max(last, int(round(total_ms / 10.0)) - sum(delay for _, delay in delays[:-1]))
+            if padded != last:
+                f.seek(position)
+                f.write(struct.pack('<H', min(padded, 0xFFFF)))
+    return frames
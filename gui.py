@@ -5,32 +5,44 @@
 """
 import sys
 import os
+import time
+import multiprocessing
 from pathlib import Path
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QTextEdit, QComboBox, QGroupBox,
-    QFileDialog, QLineEdit, QMessageBox, QProgressBar
+    QFileDialog, QLineEdit, QMessageBox, QProgressBar, QCheckBox
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QFont, QIcon
-from video_to_gif import VideoToGifConverter
+from PyQt5.QtGui import QFont, QIcon, QMovie, QPixmap
+from video_to_gif import VideoToGifConverter, warm_up
+from scheduler import JobControl
 
 
 class ConvertThread(QThread):
     """转换线程"""
     progress = pyqtSignal(str)
+    event = pyqtSignal(dict)
     finished = pyqtSignal(int, int)
 
-    def __init__(self, converter, quality):
+    def __init__(self, converter, quality, resume=False, output_format='gif'):
         super().__init__()
         self.converter = converter
         self.quality = quality
+        self.resume = resume
+        self.output_format = output_format
+        # 界面线程通过它取消、暂停或置顶文件,转换在每一帧之前检查
+        self.control = JobControl()
 
     def run(self):
         """执行转换"""
         success, fail, results = self.converter.convert_batch(
             quality=self.quality,
-            progress_callback=self.emit_progress
+            progress_callback=self.emit_progress,
+            resume=self.resume,
+            control=self.control,
+            output_format=self.output_format,
+            event_callback=self.event.emit
         )
         self.finished.emit(success, fail)
 
@@ -39,6 +51,41 @@ class ConvertThread(QThread):
         self.progress.emit(msg)
 
 
+class ProbeThread(QThread):
+    """元数据探测线程,避免扫描大量文件时界面卡顿"""
+    probed = pyqtSignal(dict, dict)
+
+    def __init__(self, converter, video_files):
+        super().__init__()
+        self.converter = converter
+        self.video_files = video_files
+
+    def run(self):
+        """并发探测所有文件"""
+        infos, errors = self.converter.probe_all(self.video_files)
+        self.probed.emit(infos, errors)
+
+
+class PreviewThread(QThread):
+    """预览生成线程"""
+    ready = pyqtSignal(str, str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, converter, video_path, kind):
+        super().__init__()
+        self.converter = converter
+        self.video_path = video_path
+        self.kind = kind
+
+    def run(self):
+        """生成(或从缓存读取)预览"""
+        try:
+            preview_path = self.converter.preview(self.video_path, self.kind)
+            self.ready.emit(str(preview_path), self.kind)
+        except Exception as e:
+            self.failed.emit(f'预览失败 {Path(self.video_path).name}: {str(e)}')
+
+
 class VideoToGifGUI(QMainWindow):
     """视频转GIF工具主窗口"""
 
@@ -46,12 +93,20 @@ class VideoToGifGUI(QMainWindow):
         super().__init__()
         self.converter = None
         self.convert_thread = None
+        self.probe_thread = None
+        self.preview_thread = None
+        self.preview_movie = None
+        # 总进度: 需要转换的文件数、已结束的文件数、正在转换的文件 -> 完成比例
+        self.batch_files = 0
+        self.files_done = 0
+        self.file_fractions = {}
+        self.batch_start = 0.0
         self.init_ui()
 
     def init_ui(self):
         """初始化界面"""
         self.setWindowTitle('视频转GIF工具 v1.0')
-        self.setGeometry(100, 100, 800, 600)
+        self.setGeometry(100, 100, 800, 760)
 
         # 创建中央部件
         central_widget = QWidget()
@@ -106,6 +161,17 @@ class VideoToGifGUI(QMainWindow):
         self.quality_combo.addItems(['高质量(文件较大)', '中等质量(推荐)', '低质量(文件较小)'])
         self.quality_combo.setCurrentIndex(1)
         quality_layout.addWidget(self.quality_combo)
+
+        quality_layout.addWidget(QLabel('输出格式:'))
+        self.format_combo = QComboBox()
+        for label, output_format in (('GIF(兼容性最好)', 'gif'), ('WebP 动图(文件最小)', 'webp'),
+                                     ('WebP 无损', 'webp_lossless'), ('APNG', 'apng')):
+            self.format_combo.addItem(label, output_format)
+        quality_layout.addWidget(self.format_combo)
+
+        # 任务日志中有未完成的文件时默认勾选,只重新转换失败或中断的文件
+        self.resume_check = QCheckBox('继续上次未完成的转换')
+        quality_layout.addWidget(self.resume_check)
         quality_layout.addStretch()
 
         quality_group.setLayout(quality_layout)
@@ -124,12 +190,61 @@ class VideoToGifGUI(QMainWindow):
         self.convert_btn.setEnabled(False)
         button_layout.addWidget(self.convert_btn)
 
+        self.pause_btn = QPushButton('暂停')
+        self.pause_btn.setMinimumHeight(40)
+        self.pause_btn.clicked.connect(self.toggle_pause)
+        self.pause_btn.setEnabled(False)
+        button_layout.addWidget(self.pause_btn)
+
+        self.stop_btn = QPushButton('停止')
+        self.stop_btn.setMinimumHeight(40)
+        self.stop_btn.clicked.connect(self.stop_conversion)
+        self.stop_btn.setEnabled(False)
+        button_layout.addWidget(self.stop_btn)
+
         main_layout.addLayout(button_layout)
 
-        # 进度条
+        # 预览: 只解码关键帧,几百毫秒内生成
+        preview_group = QGroupBox('快速预览')
+        preview_layout = QHBoxLayout()
+        preview_controls = QVBoxLayout()
+        self.preview_combo = QComboBox()
+        self.preview_combo.setEnabled(False)
+        preview_controls.addWidget(self.preview_combo)
+        self.preview_gif_btn = QPushButton('预览动图')
+        self.preview_gif_btn.clicked.connect(lambda: self.show_preview('gif'))
+        self.preview_gif_btn.setEnabled(False)
+        preview_controls.addWidget(self.preview_gif_btn)
+        self.preview_sheet_btn = QPushButton('缩略图')
+        self.preview_sheet_btn.clicked.connect(lambda: self.show_preview('sheet'))
+        self.preview_sheet_btn.setEnabled(False)
+        preview_controls.addWidget(self.preview_sheet_btn)
+        self.pin_btn = QPushButton('优先转换')
+        self.pin_btn.clicked.connect(self.pin_selected)
+        self.pin_btn.setEnabled(False)
+        preview_controls.addWidget(self.pin_btn)
+        preview_controls.addStretch()
+        preview_layout.addLayout(preview_controls)
+
+        self.preview_label = QLabel('扫描后选择文件即可预览')
+        self.preview_label.setAlignment(Qt.AlignCenter)
+        self.preview_label.setMinimumSize(480, 180)
+        preview_layout.addWidget(self.preview_label, 1)
+        preview_group.setLayout(preview_layout)
+        main_layout.addWidget(preview_group)
+
+        # 进度条: 当前文件(帧数) 和 总进度,附带帧率和剩余时间
+        self.file_progress_bar = QProgressBar()
+        self.file_progress_bar.setRange(0, 1000)
+        self.file_progress_bar.setVisible(False)
+        main_layout.addWidget(self.file_progress_bar)
         self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
         self.progress_bar.setVisible(False)
         main_layout.addWidget(self.progress_bar)
+        self.progress_label = QLabel('')
+        self.progress_label.setVisible(False)
+        main_layout.addWidget(self.progress_label)
 
         # 日志输出
         log_label = QLabel('转换日志:')
@@ -188,14 +303,79 @@ class VideoToGifGUI(QMainWindow):
             self.convert_btn.setEnabled(False)
             return
 
-        # 显示扫描结果
-        self.log(f'\n找到 {len(video_files)} 个视频文件:')
-        for video in video_files:
+        # 在后台读取时长、分辨率等信息,完成后再显示扫描结果
+        self.log(f'\n找到 {len(video_files)} 个视频文件,正在读取视频信息...')
+        self.statusBar().showMessage('正在读取视频信息...')
+        self.scan_btn.setEnabled(False)
+        self.convert_btn.setEnabled(False)
+
+        self.probe_thread = ProbeThread(self.converter, video_files)
+        self.probe_thread.probed.connect(self.on_probed)
+        self.probe_thread.start()
+
+    def on_probed(self, infos, errors):
+        """显示扫描结果,无法读取的文件单独标出"""
+        total_duration = 0.0
+        for video in sorted(list(infos) + list(errors)):
             file_size = video.stat().st_size / (1024 * 1024)
-            self.log(f'  - {video.name} ({file_size:.2f} MB)')
+            if video in errors:
+                self.log(f'  ✗ {video.name} ({file_size:.2f} MB) 无法读取: {errors[video]}')
+                continue
+            info = infos[video]
+            total_duration += info['duration']
+            self.log(f"  - {video.name} ({file_size:.2f} MB, {info['width']}x{info['height']}, "
+                     f"{info['duration']:.1f}秒, {info['fps']:.0f}fps, {info['codec']})")
 
-        self.convert_btn.setEnabled(True)
-        self.statusBar().showMessage(f'已找到 {len(video_files)} 个视频文件')
+        self.scan_btn.setEnabled(True)
+        self.convert_btn.setEnabled(bool(infos))
+
+        unfinished = self.converter.unfinished_jobs()
+        self.resume_check.setChecked(bool(unfinished))
+        if unfinished:
+            self.log(f'上次转换有 {len(unfinished)} 个文件未完成,已勾选"继续上次未完成的转换"')
+
+        # 只有可读取的文件才能预览
+        self.preview_combo.clear()
+        for video in sorted(infos):
+            self.preview_combo.addItem(video.name, str(video))
+        for widget in (self.preview_combo, self.preview_gif_btn, self.preview_sheet_btn):
+            widget.setEnabled(bool(infos))
+        status = f'已找到 {len(infos)} 个视频文件,总时长 {total_duration:.1f} 秒'
+        if errors:
+            status += f',{len(errors)} 个无法读取'
+        self.statusBar().showMessage(status)
+
+    def show_preview(self, kind):
+        """在后台生成所选文件的预览"""
+        video_path = self.preview_combo.currentData()
+        if not video_path or (self.preview_thread and self.preview_thread.isRunning()):
+            return
+
+        self.preview_label.setText('正在生成预览...')
+        self.preview_thread = PreviewThread(self.converter, video_path, kind)
+        self.preview_thread.ready.connect(self.on_preview_ready)
+        self.preview_thread.failed.connect(self.on_preview_failed)
+        self.preview_thread.start()
+
+    def on_preview_ready(self, preview_path, kind):
+        """显示预览动图或缩略图"""
+        if self.preview_movie:
+            self.preview_movie.stop()
+            self.preview_movie = None
+        if kind == 'gif':
+            self.preview_movie = QMovie(preview_path)
+            self.preview_label.setMovie(self.preview_movie)
+            self.preview_movie.start()
+        else:
+            pixmap = QPixmap(preview_path)
+            self.preview_label.setPixmap(pixmap.scaled(
+                self.preview_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
+            ))
+
+    def on_preview_failed(self, msg):
+        """预览失败只记录日志"""
+        self.preview_label.setText('预览失败')
+        self.log(msg)
 
     def start_conversion(self):
         """开始转换"""
@@ -214,20 +394,117 @@ class VideoToGifGUI(QMainWindow):
         self.input_browse_btn.setEnabled(False)
         self.output_browse_btn.setEnabled(False)
         self.quality_combo.setEnabled(False)
+        self.format_combo.setEnabled(False)
+        self.resume_check.setEnabled(False)
 
-        # 显示进度条
-        self.progress_bar.setVisible(True)
-        self.progress_bar.setRange(0, 0)  # 不确定进度
+        self.pause_btn.setText('暂停')
+        self.pause_btn.setEnabled(True)
+        self.stop_btn.setEnabled(True)
+        self.pin_btn.setEnabled(True)
 
-        self.log(f'\n开始批量转换 (质量: {self.quality_combo.currentText()})...')
+        # 显示进度条
+        self.batch_files = 0
+        self.files_done = 0
+        self.file_fractions = {}
+        self.batch_start = time.time()
+        for widget in (self.file_progress_bar, self.progress_bar, self.progress_label):
+            widget.setVisible(True)
+        self.file_progress_bar.setValue(0)
+        self.file_progress_bar.setFormat('等待开始...')
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat('总进度 %p%')
+        self.progress_label.setText('')
+
+        self.log(f'\n开始批量转换 (质量: {self.quality_combo.currentText()}, '
+                 f'格式: {self.format_combo.currentText()})...')
         self.statusBar().showMessage('正在转换...')
 
         # 创建并启动转换线程
-        self.convert_thread = ConvertThread(self.converter, quality)
+        self.convert_thread = ConvertThread(self.converter, quality, self.resume_check.isChecked(),
+                                            self.format_combo.currentData())
         self.convert_thread.progress.connect(self.on_progress)
+        self.convert_thread.event.connect(self.on_event)
         self.convert_thread.finished.connect(self.on_finished)
         self.convert_thread.start()
 
+    def toggle_pause(self):
+        """暂停或继续: 正在转换的文件在下一帧之前停住"""
+        control = self.convert_thread.control
+        if control.paused:
+            control.resume()
+            self.pause_btn.setText('暂停')
+            self.statusBar().showMessage('正在转换...')
+            self.log('继续转换')
+        else:
+            control.pause()
+            self.pause_btn.setText('继续')
+            self.statusBar().showMessage('已暂停')
+            self.log('已暂停')
+
+    def stop_conversion(self):
+        """停止: 正在转换的文件在下一帧之前结束并删除临时文件,其余文件不再转换"""
+        self.convert_thread.control.cancel()
+        self.pause_btn.setEnabled(False)
+        self.stop_btn.setEnabled(False)
+        self.statusBar().showMessage('正在停止...')
+        self.log('正在停止,勾选"继续上次未完成的转换"可在之后接着转换')
+
+    def pin_selected(self):
+        """把预览列表中选中的文件移到待转换队列的最前面"""
+        video_path = self.preview_combo.currentData()
+        if video_path and self.convert_thread and self.convert_thread.isRunning():
+            self.convert_thread.control.pin(video_path)
+            self.log(f'优先转换: {Path(video_path).name}')
+
+    def on_event(self, event):
+        """根据结构化进度事件更新进度条"""
+        kind = event.get('event')
+        if kind == 'batch':
+            self.batch_files = event['files']
+        elif kind == 'progress':
+            frames_total = event['frames_total']
+            if frames_total:
+                fraction = min(1.0, event['frames_done'] / frames_total)
+                self.file_fractions[event['file']] = fraction
+                self.file_progress_bar.setValue(int(fraction * 1000))
+                self.file_progress_bar.setFormat(
+                    f"{event['file']}: {event['frames_done']}/{frames_total} 帧 (%p%)"
+                )
+                remaining = (frames_total - event['frames_done']) / event['fps'] if event['fps'] > 0 else None
+            else:
+                remaining = None
+            self.progress_label.setText(
+                f"{event['fps']:.1f} 帧/秒, 已写入 {event['bytes_written'] / 1024:.0f} KB"
+                + (f", 当前文件剩余 {format_eta(remaining)}" if remaining is not None else '')
+                + self.batch_eta_text()
+            )
+        elif kind == 'file':
+            self.files_done += 1
+            self.file_fractions.pop(event['file'], None)
+        else:
+            return
+        self.update_overall_progress()
+
+    def overall_fraction(self):
+        """总进度: 已结束的文件 + 正在转换的文件的完成比例"""
+        if not self.batch_files:
+            return 0.0
+        return min(1.0, (self.files_done + sum(self.file_fractions.values())) / self.batch_files)
+
+    def batch_eta_text(self):
+        """按总进度和已用时间估算全部完成的剩余时间"""
+        fraction = self.overall_fraction()
+        if fraction <= 0:
+            return ''
+        elapsed = time.time() - self.batch_start
+        return f", 全部剩余 {format_eta(elapsed * (1 - fraction) / fraction)}"
+
+    def update_overall_progress(self):
+        """刷新总进度条"""
+        self.progress_bar.setValue(int(self.overall_fraction() * 1000))
+        if self.batch_files:
+            self.progress_bar.setFormat(f'总进度 {min(self.files_done, self.batch_files)}/{self.batch_files} 个文件 (%p%)')
+
     def on_progress(self, msg):
         """处理进度更新"""
         self.log(msg)
@@ -235,7 +512,11 @@ class VideoToGifGUI(QMainWindow):
     def on_finished(self, success, fail):
         """转换完成"""
         # 隐藏进度条
-        self.progress_bar.setVisible(False)
+        for widget in (self.file_progress_bar, self.progress_bar, self.progress_label):
+            widget.setVisible(False)
+        self.pause_btn.setEnabled(False)
+        self.stop_btn.setEnabled(False)
+        self.pin_btn.setEnabled(False)
 
         # 重新启用按钮
         self.convert_btn.setEnabled(True)
@@ -243,9 +524,14 @@ class VideoToGifGUI(QMainWindow):
         self.input_browse_btn.setEnabled(True)
         self.output_browse_btn.setEnabled(True)
         self.quality_combo.setEnabled(True)
+        self.format_combo.setEnabled(True)
+        self.resume_check.setEnabled(True)
 
         # 显示结果
-        result_msg = f'转换完成! 成功: {success}, 失败: {fail}'
+        if self.convert_thread.control.cancelled:
+            result_msg = f'转换已停止! 成功: {success}, 失败: {fail}'
+        else:
+            result_msg = f'转换完成! 成功: {success}, 失败: {fail}'
         self.log(f'\n{result_msg}')
         self.statusBar().showMessage(result_msg)
 
@@ -261,8 +547,19 @@ class VideoToGifGUI(QMainWindow):
         self.log_text.setTextCursor(cursor)
 
 
+def format_eta(seconds):
+    """把剩余秒数格式化为 1:05 或 1:02:05"""
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes}:{seconds:02d}'
+
+
 def main():
     """主函数"""
+    # 打包为exe后,批量转换的进程池子进程需要由此进入
+    multiprocessing.freeze_support()
+
     app = QApplication(sys.argv)
 
     # 设置应用样式
@@ -271,6 +568,9 @@ def main():
     window = VideoToGifGUI()
     window.show()
 
+    # 窗口显示后再在后台导入moviepy等转换依赖,第一次转换时无需等待
+    warm_up()
+
     sys.exit(app.exec_())
 
 
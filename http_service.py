@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 异步HTTP转换服务
+
+其他服务通过HTTP上传视频、查询进度并下载结果,不必再往输入文件夹放文件后轮询输出文件夹:
+    POST   /jobs?quality=medium&format=webp&filename=talk.mp4   请求体为视频文件本身,返回 202 和任务状态
+    GET    /jobs                                               全部任务的状态
+    GET    /jobs/<id>                                          任务状态和进度
+    GET    /jobs/<id>/result                                   下载转换结果
+    DELETE /jobs/<id>                                          取消排队/转换中的任务,或删除已结束任务的结果
+    GET    /health                                             转换中、排队和上传中的任务数
+
+只依赖标准库 asyncio。上传按块直接写入磁盘(支持 Content-Length 和 chunked),不在内存中缓存整个文件;
+排队已满时在读取请求体之前返回 503,客户端发送 Expect: 100-continue 时不会白白上传。
+转换在有界的进程池中进行,子进程的进度和日志经由共享队列转发回事件循环;每个任务各有一个 JobControl,可单独取消。
+结束的任务及其结果在 keep_seconds 后自动清理
+
+用法:
+    python http_service.py --input D:/GIF/uploads --output D:/GIF/results --port 8080 --workers 2 --queue-depth 16
+    curl -X POST -T talk.mp4 "http://127.0.0.1:8080/jobs?filename=talk.mp4&quality=low"
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import asyncio
+import argparse
+import mimetypes
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import suppress
+from functools import partial
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl, quote
+import ffmpeg_engine
+from video_to_gif import VideoToGifConverter
+from scheduler import JobControl
+
+
+class HttpError(Exception):
+    """以指定状态码结束请求,消息以JSON返回给客户端"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class ConversionService:
+    """异步HTTP转换服务: 接收上传、排队转换、报告进度、提供下载"""
+
+    # 上传和下载时每次读写的字节数
+    CHUNK_BYTES = 64 * 1024
+    # 请求行和请求头的总长度上限
+    MAX_HEADER_BYTES = 64 * 1024
+    # 每个任务保留的最近日志行数
+    LOG_LINES = 20
+    # 清理过期任务的间隔(秒)
+    CLEANUP_INTERVAL = 60
+    # 任务状态: 上传中、排队、转换中、完成、失败、取消
+    STATES = ['uploading', 'queued', 'running', 'done', 'failed', 'cancelled']
+    FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+    def __init__(self, converter, workers=2, queue_depth=16, max_uploads=4, max_upload_bytes=2 * 1024 ** 3,
+                 keep_seconds=3600, quality='medium', progress_callback=None):
+        """
+        :param converter: VideoToGifConverter,上传的视频保存在其输入文件夹,结果写入其输出文件夹
+        :param workers: 同时转换的任务数(进程池大小)
+        :param queue_depth: 等待转换的任务数上限(含正在上传的),超出时新请求返回 503
+        :param max_uploads: 同时进行的上传数上限,超出时返回 503
+        :param max_upload_bytes: 单个上传文件的大小上限(字节),超出时返回 413
+        :param keep_seconds: 结束的任务及其结果保留的时长(秒)
+        :param quality: 请求未指定质量时使用的档位
+        :param progress_callback: 服务日志回调函数(任务接收、开始、结束)
+        """
+        self.converter = converter
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.max_uploads = max_uploads
+        self.max_upload_bytes = max_upload_bytes
+        self.keep_seconds = keep_seconds
+        self.quality = quality
+        self.progress_callback = progress_callback
+        self._jobs = {}
+        self._pending = deque()
+        self._running = {}
+        self._uploading = 0
+        self._manager = None
+        self._messages = None
+        self._executor = None
+
+    def _log(self, msg):
+        if self.progress_callback:
+            self.progress_callback(msg)
+
+    async def serve(self, host='127.0.0.1', port=8080, stop=None, ready=None):
+        """
+        运行服务直到 stop 被设置,退出时取消未完成的任务
+        :param stop: asyncio.Event,为None时一直运行
+        :param ready: 回调函数,监听开始后以实际端口调用(port=0 时由系统分配)
+        """
+        loop = asyncio.get_running_loop()
+        self._manager = multiprocessing.Manager()
+        self._messages = self._manager.Queue()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        relay = threading.Thread(target=self._relay_messages, args=(loop,), daemon=True)
+        relay.start()
+        server = await asyncio.start_server(self._handle, host, port, limit=self.MAX_HEADER_BYTES)
+        cleaner = asyncio.create_task(self._cleanup_loop())
+        port = server.sockets[0].getsockname()[1]
+        self._log(f"HTTP转换服务已启动: http://{host}:{port}/ (并行 {self.workers}, 排队上限 {self.queue_depth})")
+        if ready:
+            ready(port)
+        try:
+            await (stop or asyncio.Event()).wait()
+        finally:
+            cleaner.cancel()
+            server.close()
+            await server.wait_closed()
+            for job in list(self._pending):
+                self._cancel_pending(job)
+            for job in self._running.values():
+                job['control'].cancel()
+            # 等待转换中的任务在下一帧之前停止并删除临时文件
+            await loop.run_in_executor(None, self._executor.shutdown)
+            self._messages.put(None)
+            relay.join()
+            self._manager.shutdown()
+            self._log("HTTP转换服务已停止")
+
+    def _relay_messages(self, loop):
+        """在转发线程中读取子进程发来的 (任务ID, 消息),交给事件循环处理,收到 None 时结束"""
+        while True:
+            item = self._messages.get()
+            if item is None:
+                break
+            loop.call_soon_threadsafe(self._on_message, *item)
+
+    def _on_message(self, job_id, msg):
+        """记录子进程的进度事件和日志"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        if isinstance(msg, dict):
+            # 转发线程与进程池的结果通知互不同步,结束后才到达的进度事件丢弃
+            if msg.get('event') == 'progress' and job['state'] == 'running':
+                job['progress'] = {key: msg.get(key) for key in
+                                   ('frames_done', 'frames_total', 'bytes_written', 'fps', 'elapsed')}
+        elif msg.strip():
+            # 日志中的文件名换回用户上传时的文件名
+            job['log'].append(msg.strip().replace(job['source'].name, job['file']))
+
+    async def _handle(self, reader, writer):
+        """处理一个连接上的一个请求(响应后关闭连接)"""
+        try:
+            request = await self._read_request(reader)
+            await self._route(*request, reader, writer)
+        except HttpError as e:
+            with suppress(ConnectionError):
+                await self._send_json(writer, e.status, {'error': e.message}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _read_request(self, reader):
+        """
+        读取请求行和请求头
+        :return: (方法, 路径, 查询参数字典, 请求头字典(键为小写))
+        """
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "请求头过长")
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "无效的请求行")
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        return method.upper(), url.path, dict(parse_qsl(url.query)), headers
+
+    async def _route(self, method, path, query, headers, reader, writer):
+        parts = [part for part in path.split('/') if part]
+        if parts == ['health']:
+            allowed = ['GET']
+            if method == 'GET':
+                return await self._send_json(writer, HTTPStatus.OK, self.health())
+        elif parts == ['jobs']:
+            allowed = ['GET', 'POST']
+            if method == 'GET':
+                return await self._send_json(writer, HTTPStatus.OK, [self.status(job) for job in self._jobs.values()])
+            if method == 'POST':
+                return await self._create_job(query, headers, reader, writer)
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            allowed = ['GET', 'DELETE']
+            job = self._get_job(parts[1])
+            if method == 'GET':
+                return await self._send_json(writer, HTTPStatus.OK, self.status(job))
+            if method == 'DELETE':
+                return await self._delete_job(job, writer)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'result':
+            allowed = ['GET']
+            if method == 'GET':
+                return await self._send_result(self._get_job(parts[1]), writer)
+        else:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"不存在的路径: {path}")
+        raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"{path} 不支持 {method}", {'Allow': ', '.join(allowed)})
+
+    def _get_job(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"任务不存在: {job_id}")
+        return job
+
+    def _parse_options(self, query):
+        """
+        把查询参数转换为 _convert_single 的参数
+        :raises HttpError: 参数无效(400)
+        """
+        quality = query.get('quality', self.quality)
+        if quality not in ('high', 'medium', 'low'):
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"不支持的质量等级: {quality}")
+        engine = query.get('engine')
+        if engine is not None and engine not in VideoToGifConverter.ENGINES:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"不支持的转换引擎: {engine}")
+        output_format = query.get('format')
+        if output_format is not None and output_format not in ffmpeg_engine.OUTPUT_FORMATS:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"不支持的输出格式: {output_format}")
+        options = {'quality': quality, 'engine': engine, 'output_format': output_format}
+        try:
+            for key in ('start', 'end', 'duration'):
+                options[key] = float(query[key]) if key in query else None
+            options['target_bytes'] = int(float(query['target_mb']) * 1024 ** 2) if 'target_mb' in query else None
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"无效的参数: {e}")
+        return options
+
+    async def _create_job(self, query, headers, reader, writer):
+        """接收上传并加入转换队列,请求体在通过全部检查后才开始读取"""
+        options = self._parse_options(query)
+        filename = Path(query.get('filename') or headers.get('x-filename') or 'upload.mp4').name
+        suffix = Path(filename).suffix.lower()
+        if suffix not in VideoToGifConverter.SUPPORTED_FORMATS:
+            raise HttpError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, f"不支持的视频格式: {suffix or filename}")
+
+        chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        length = None
+        if not chunked:
+            try:
+                length = int(headers['content-length'])
+            except KeyError:
+                raise HttpError(HTTPStatus.LENGTH_REQUIRED, "需要 Content-Length 或 chunked 编码")
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "无效的 Content-Length")
+            if length > self.max_upload_bytes:
+                raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                f"文件超过上限 {self.max_upload_bytes / 1024 ** 2:.0f} MB")
+        if len(self._pending) + self._uploading >= self.queue_depth:
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, f"排队任务已满 ({self.queue_depth})",
+                            {'Retry-After': '10'})
+        if self._uploading >= self.max_uploads:
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, f"同时上传数已满 ({self.max_uploads})",
+                            {'Retry-After': '5'})
+
+        job_id = uuid.uuid4().hex[:12]
+        settings = self.converter._get_quality_settings(options['quality'], options['output_format'])
+        # 以任务ID命名,不同请求上传同名文件时互不覆盖
+        source = self.converter.input_dir / (job_id + suffix)
+        job = {
+            'id': job_id,
+            'file': filename,
+            'state': 'uploading',
+            'options': options,
+            'source': source,
+            'output': self.converter._output_path(source, name=job_id, output_format=settings['format']),
+            'created': time.time(),
+            'started': None,
+            'finished': None,
+            'upload_bytes': 0,
+            'progress': None,
+            'log': deque(maxlen=self.LOG_LINES),
+            'error': None,
+            'info': {},
+            'control': JobControl(self._manager),
+        }
+        self._jobs[job_id] = job
+        self._uploading += 1
+        try:
+            if headers.get('expect', '').lower() == '100-continue':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                await writer.drain()
+            job['upload_bytes'] = await self._receive(reader, source, length, chunked)
+        except BaseException:
+            del self._jobs[job_id]
+            with suppress(OSError):
+                source.unlink()
+            raise
+        finally:
+            self._uploading -= 1
+
+        job['state'] = 'queued'
+        self._pending.append(job)
+        self._log(f"已接收任务 {job_id}: {filename} ({job['upload_bytes'] / 1024 ** 2:.1f} MB)")
+        self._dispatch()
+        await self._send_json(writer, HTTPStatus.ACCEPTED, self.status(job), {'Location': f'/jobs/{job_id}'})
+
+    async def _receive(self, reader, path, length, chunked):
+        """
+        把请求体逐块写入文件
+        :return: 写入的字节数
+        :raises HttpError: chunked 上传超过大小上限(413)或编码无效(400)
+        """
+        loop = asyncio.get_running_loop()
+        received = 0
+        with open(path, 'wb') as f:
+            async for chunk in self._body_chunks(reader, length, chunked):
+                received += len(chunk)
+                if received > self.max_upload_bytes:
+                    raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                    f"文件超过上限 {self.max_upload_bytes / 1024 ** 2:.0f} MB")
+                # 写盘放到线程中,慢速磁盘不阻塞其他请求
+                await loop.run_in_executor(None, f.write, chunk)
+        return received
+
+    async def _body_chunks(self, reader, length, chunked):
+        """逐块读取请求体,每块不超过 CHUNK_BYTES,客户端的 chunk 再大也不会整块读入内存"""
+        if not chunked:
+            remaining = length
+            while remaining:
+                chunk = await reader.read(min(remaining, self.CHUNK_BYTES))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(chunk)
+                yield chunk
+            return
+
+        while True:
+            size_line = await reader.readline()
+            try:
+                remaining = int(size_line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "无效的 chunked 编码")
+            if remaining == 0:
+                # 跳过 trailer 直到空行
+                while (await reader.readline()).strip():
+                    pass
+                return
+            while remaining:
+                chunk = await reader.read(min(remaining, self.CHUNK_BYTES))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(chunk)
+                yield chunk
+            await reader.readexactly(2)
+
+    def _dispatch(self):
+        """进程池有空位时按接收顺序提交排队的任务"""
+        while self._pending and len(self._running) < self.workers:
+            job = self._pending.popleft()
+            job['state'] = 'running'
+            job['started'] = time.time()
+            self._running[job['id']] = job
+            future = self._executor.submit(_run_job, self.converter, str(job['source']), str(job['output']),
+                                           job['options'], job['control'], _JobMessages(self._messages, job['id']))
+            asyncio.wrap_future(future).add_done_callback(partial(self._on_done, job))
+            self._log(f"开始转换 {job['id']}: {job['file']}")
+
+    def _on_done(self, job, future):
+        """记录转换结果,删除上传的源文件,并提交下一个任务"""
+        self._running.pop(job['id'], None)
+        try:
+            success, result, info = future.result()
+        except BaseException as e:
+            # 子进程异常退出,或服务停止时尚未开始的任务被取消
+            success, result, info = False, f"转换失败 {job['file']}: {str(e) or type(e).__name__}", {}
+        job['finished'] = time.time()
+        job['info'] = info
+        if info.get('cancelled'):
+            job['state'] = 'cancelled'
+        elif success:
+            job['state'] = 'done'
+            if job['progress']:
+                job['progress']['frames_done'] = job['progress']['frames_total']
+        else:
+            job['state'] = 'failed'
+            job['error'] = result.replace(job['source'].name, job['file'])
+        with suppress(OSError):
+            job['source'].unlink()
+        self._log(f"任务 {job['id']} {self._state_label(job)}: {job['file']}")
+        self._dispatch()
+
+    @staticmethod
+    def _state_label(job):
+        return {'done': '完成', 'failed': '失败', 'cancelled': '已取消'}.get(job['state'], job['state'])
+
+    def _cancel_pending(self, job):
+        """取消尚未开始的任务"""
+        self._pending.remove(job)
+        job['state'] = 'cancelled'
+        job['finished'] = time.time()
+        with suppress(OSError):
+            job['source'].unlink()
+
+    async def _delete_job(self, job, writer):
+        """排队的任务直接取消;转换中的任务在下一帧之前停止;已结束的任务删除结果文件和记录"""
+        if job['state'] == 'uploading':
+            raise HttpError(HTTPStatus.CONFLICT, "任务仍在上传")
+        if job['state'] == 'queued':
+            self._cancel_pending(job)
+            self._log(f"任务 {job['id']} 已取消: {job['file']}")
+        elif job['state'] == 'running':
+            job['control'].cancel()
+        else:
+            self._forget(job)
+            return await self._send(writer, HTTPStatus.NO_CONTENT)
+        await self._send_json(writer, HTTPStatus.ACCEPTED, self.status(job))
+
+    def _forget(self, job):
+        """删除已结束任务的结果文件和记录"""
+        with suppress(OSError):
+            job['output'].unlink()
+        self._jobs.pop(job['id'], None)
+
+    async def _cleanup_loop(self):
+        """定期删除结束超过 keep_seconds 的任务"""
+        while True:
+            await asyncio.sleep(self.CLEANUP_INTERVAL)
+            deadline = time.time() - self.keep_seconds
+            for job in list(self._jobs.values()):
+                if job['state'] in self.FINISHED_STATES and job['finished'] < deadline:
+                    self._forget(job)
+
+    def _download_name(self, job):
+        """下载时使用的文件名: 上传文件名加输出格式的扩展名"""
+        return Path(job['file']).stem + job['output'].suffix
+
+    async def _send_result(self, job, writer):
+        """分块发送转换结果"""
+        if job['state'] != 'done':
+            raise HttpError(HTTPStatus.CONFLICT, f"任务尚未完成: {job['state']}")
+        loop = asyncio.get_running_loop()
+        try:
+            f = open(job['output'], 'rb')
+        except OSError:
+            raise HttpError(HTTPStatus.GONE, "结果文件已被删除")
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            content_type = mimetypes.guess_type(job['output'].name)[0] or 'application/octet-stream'
+            writer.write(self._head(HTTPStatus.OK, {
+                'Content-Type': content_type,
+                'Content-Length': str(size),
+                'Content-Disposition': f"attachment; filename*=UTF-8''{quote(self._download_name(job))}",
+            }))
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, self.CHUNK_BYTES)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+    def status(self, job):
+        """
+        任务的公开状态(可序列化为JSON)
+        :return: {'id', 'file', 'state', 'options', 'created', 'started', 'finished', 'upload_bytes',
+                  'progress', 'log', 排队时 'queue_position', 完成时 'result', 失败时 'error'}
+        """
+        status = {key: job[key] for key in ('id', 'file', 'state', 'options', 'created', 'started', 'finished',
+                                            'upload_bytes')}
+        status['progress'] = progress = dict(job['progress']) if job['progress'] else None
+        status['log'] = list(job['log'])
+        if job['state'] == 'queued':
+            status['queue_position'] = self._pending.index(job) + 1
+        if progress and progress['frames_total']:
+            progress['percent'] = round(100.0 * progress['frames_done'] / progress['frames_total'], 1)
+        if job['state'] == 'done':
+            metrics = job['info'].get('metrics') or {}
+            status['result'] = {
+                'url': f"/jobs/{job['id']}/result",
+                'filename': self._download_name(job),
+                'bytes': metrics.get('output_bytes'),
+                'frames': metrics.get('frames'),
+                'frames_dropped': job['info'].get('frames_dropped', 0),
+                'wall_seconds': metrics.get('wall_seconds'),
+            }
+            if 'target' in job['info']:
+                status['result']['settings'] = job['info']['target'].get('settings')
+        elif job['state'] == 'failed':
+            status['error'] = job['error']
+        return status
+
+    def health(self):
+        """服务负载: 各状态的任务数和并行/排队上限"""
+        counts = dict.fromkeys(self.STATES, 0)
+        for job in self._jobs.values():
+            counts[job['state']] += 1
+        return {'jobs': counts, 'workers': self.workers, 'queue_depth': self.queue_depth,
+                'max_uploads': self.max_uploads}
+
+    @staticmethod
+    def _head(status, headers):
+        status = HTTPStatus(status)
+        lines = [f'HTTP/1.1 {status.value} {status.phrase}', 'Connection: close']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _send(self, writer, status, body=b'', content_type=None, headers=None):
+        headers = dict(headers or {})
+        if content_type:
+            headers['Content-Type'] = content_type
+        headers['Content-Length'] = str(len(body))
+        writer.write(self._head(status, headers) + body)
+        await writer.drain()
+
+    async def _send_json(self, writer, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        await self._send(writer, status, body, 'application/json; charset=utf-8', headers)
+
+
+class _JobMessages:
+    """可跨进程传递的进度/事件回调,把 (任务ID, 消息) 放入共享队列"""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+
+    def __call__(self, msg):
+        self.queue.put((self.job_id, msg))
+
+
+def _run_job(converter, video_path, output_path, options, control, messages):
+    """进程池任务: 转换一个上传的视频"""
+    options = dict(options)
+    quality = options.pop('quality')
+    return converter._convert_single(video_path, quality, messages, event_callback=messages,
+                                     output_path=output_path, control=control, **options)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='异步HTTP转换服务: 上传视频、查询进度、下载结果')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=8080, help='监听端口')
+    parser.add_argument('--input', default='D:/GIF/uploads', help='上传视频的保存文件夹')
+    parser.add_argument('--output', default='D:/GIF/results', help='转换结果文件夹')
+    parser.add_argument('--quality', default='medium', choices=['high', 'medium', 'low'], help='默认质量等级')
+    parser.add_argument('--engine', default='stream', choices=VideoToGifConverter.ENGINES, help='默认转换引擎')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='同时转换的任务数')
+    parser.add_argument('--queue-depth', type=int, default=16, help='等待转换的任务数上限,超出时返回503')
+    parser.add_argument('--max-uploads', type=int, default=4, help='同时进行的上传数上限')
+    parser.add_argument('--max-upload-mb', type=float, default=2048, help='单个上传文件的大小上限(MB)')
+    parser.add_argument('--keep', type=float, default=3600, help='结束的任务及其结果保留的时长(秒)')
+    args = parser.parse_args()
+
+    def print_progress(msg):
+        print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+    converter = VideoToGifConverter(args.input, args.output, engine=args.engine)
+    service = ConversionService(converter, workers=args.workers, queue_depth=args.queue_depth,
+                                max_uploads=args.max_uploads, max_upload_bytes=int(args.max_upload_mb * 1024 ** 2),
+                                keep_seconds=args.keep, quality=args.quality, progress_callback=print_progress)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                # Windows 的事件循环不支持 add_signal_handler
+                signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(stop.set))
+        await service.serve(args.host, args.port, stop)
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
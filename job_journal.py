@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 批量任务日志
+
+用SQLite记录批量转换中每个文件的状态(running / done / failed),每次状态变化立即提交,
+程序崩溃或断电后日志仍然完整。续转(resume)时只跳过 已完成、源文件和转换设置都未变化、
+输出文件仍然存在 的条目,失败的和中断时仍在转换的条目重新转换
+"""
+import json
+import time
+import sqlite3
+from pathlib import Path
+
+
+class JobJournal:
+    """以输出文件路径为键的任务日志,只在主进程中使用(连接不能传给子进程)"""
+
+    FILE_NAME = '.video_to_gif_journal.db'
+
+    def __init__(self, path):
+        """
+        打开(或创建)日志数据库
+        :param path: 数据库文件路径
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30)
+        # WAL: 写入只追加到日志文件,崩溃时最多丢失最后一次提交,数据库本身不会损坏
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' output TEXT PRIMARY KEY,'
+                ' source TEXT NOT NULL,'
+                ' source_size INTEGER,'
+                ' source_mtime_ns INTEGER,'
+                ' settings TEXT NOT NULL,'
+                ' state TEXT NOT NULL,'
+                ' error TEXT,'
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' updated REAL NOT NULL)'
+            )
+
+    @staticmethod
+    def settings_key(quality_settings, engine, target_bytes=None):
+        """
+        把影响输出结果的设置序列化为字符串,设置改变后旧的完成记录不再有效
+        :return: JSON字符串
+        """
+        return json.dumps({'settings': quality_settings, 'engine': engine, 'target_bytes': target_bytes},
+                          sort_keys=True)
+
+    def is_done(self, video_path, output_path, settings):
+        """
+        判断该文件是否已在之前的批量转换中完成
+        :param settings: settings_key 的结果
+        :return: 已完成且可以跳过时返回True
+        """
+        row = self._conn.execute(
+            'SELECT source_size, source_mtime_ns, settings, state FROM entries WHERE output = ?',
+            (str(output_path),)
+        ).fetchone()
+        if row is None or row[3] != 'done' or row[2] != settings:
+            return False
+        try:
+            stat = Path(video_path).stat()
+        except OSError:
+            return False
+        return (row[0], row[1]) == (stat.st_size, stat.st_mtime_ns) and Path(output_path).exists()
+
+    def start(self, items, settings):
+        """
+        把即将转换的文件标记为 running,尝试次数加一
+        :param items: [(视频路径, 输出路径), ...]
+        :param settings: settings_key 的结果
+        """
+        now = time.time()
+        rows = []
+        for video_path, output_path in items:
+            try:
+                stat = Path(video_path).stat()
+                size, mtime_ns = stat.st_size, stat.st_mtime_ns
+            except OSError:
+                size, mtime_ns = None, None
+            rows.append((str(output_path), str(video_path), size, mtime_ns, settings, now))
+        # 不使用 UPSERT,较早Python自带的SQLite(3.24之前)不支持
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO entries (output, source, settings, state, updated) VALUES (?, '', '', 'running', 0)",
+                [row[:1] for row in rows]
+            )
+            self._conn.executemany(
+                'UPDATE entries SET source = ?, source_size = ?, source_mtime_ns = ?, settings = ?,'
+                " state = 'running', error = NULL, attempts = attempts + 1, updated = ? WHERE output = ?",
+                [row[1:] + row[:1] for row in rows]
+            )
+
+    def finish(self, output_path, success, error=None):
+        """
+        记录一个文件的转换结果
+        :param success: 是否成功
+        :param error: 失败时的错误信息
+        """
+        with self._conn:
+            self._conn.execute(
+                'UPDATE entries SET state = ?, error = ?, updated = ? WHERE output = ?',
+                ('done' if success else 'failed', None if success else error, time.time(), str(output_path))
+            )
+
+    def unfinished(self):
+        """
+        未完成(失败或中断)的条目
+        :return: [{'source', 'output', 'state', 'error', 'attempts'}, ...]
+        """
+        rows = self._conn.execute(
+            "SELECT source, output, state, error, attempts FROM entries WHERE state != 'done' ORDER BY source"
+        ).fetchall()
+        return [dict(zip(('source', 'output', 'state', 'error', 'attempts'), row)) for row in rows]
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 分阶段计时与指标导出
+
+每个文件转换结束时产生结构化事件:
+    {'event': 'stage', 'file': ..., 'stage': 'decode', 'seconds': ...}   每个阶段一条
+    {'event': 'file', 'file': ..., 'success': ..., 'stages': {...}, 'frames': ...,
+     'fps': ..., 'output_bytes': ..., 'peak_rss_bytes': ..., 'wall_seconds': ...}
+转换过程中按固定间隔产生进度事件(间隔内的帧只计数,不发送):
+    {'event': 'progress', 'file': ..., 'index': ..., 'total': ..., 'frames_done': ..., 'frames_total': ...,
+     'bytes_written': ..., 'fps': ..., 'elapsed': ...}
+事件交给 event_callback;JsonLinesExporter 和 PrometheusExporter 本身就是可用作回调的导出器
+"""
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+STAGES = ['load', 'estimate', 'decode', 'resize', 'palette', 'quantize', 'encode', 'write']
+
+# 进度事件的最小间隔(秒),每帧只需比较一次时间
+PROGRESS_INTERVAL = 0.25
+
+
+def peak_rss_bytes():
+    """
+    当前进程的内存占用峰值(字节),无法获取时返回None
+    注意这是进程生命周期内的峰值,进程池复用的子进程会累积之前任务的峰值
+    """
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为KB, macOS 为字节
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+
+    if os.name == 'nt':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+        except (OSError, AttributeError):
+            pass
+    return None
+
+
+class ConversionMetrics:
+    """单个文件的分阶段计时器,可在多个线程中累加"""
+
+    def __init__(self, file_name, event_callback=None, shared_frames=None):
+        """
+        :param file_name: 文件名,写入事件中
+        :param event_callback: 事件回调函数,为None时只汇总不发送
+        :param shared_frames: multiprocessing.Value,分段编码的子进程把完成的帧数累加到这里,供主进程报告进度
+        """
+        self.file_name = file_name
+        self.event_callback = event_callback
+        self.shared_frames = shared_frames
+        self.stages = {}
+        self.frames = 0
+        # 进度事件中的附加信息,由转换流程设置
+        self.frames_total = None
+        self.job = None
+        self.output_path = None
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._next_progress = 0.0
+
+    def add(self, stage, seconds):
+        """累加某个阶段的耗时"""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def merge(self, stages):
+        """合并其他进程汇总的阶段耗时(分段并行编码时使用)"""
+        for stage, seconds in stages.items():
+            self.add(stage, seconds)
+
+    @contextmanager
+    def stage(self, stage):
+        """计时上下文: with metrics.stage('encode'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def timed(self, iterable, stage):
+        """包装迭代器,把每次取下一个元素的耗时计入指定阶段"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def advance(self, count=1):
+        """记录完成的帧数,距上次进度事件超过 PROGRESS_INTERVAL 时发送一次"""
+        self.frames += count
+        if self.shared_frames is not None:
+            with self.shared_frames.get_lock():
+                self.shared_frames.value += count
+        if self.event_callback and time.perf_counter() >= self._next_progress:
+            self.report_progress()
+
+    def report_progress(self, frames_done=None):
+        """
+        发送进度事件
+        :param frames_done: 已完成帧数,默认为 self.frames(分段编码时由主进程传入各子进程的合计)
+        """
+        if not self.event_callback:
+            return
+        now = time.perf_counter()
+        self._next_progress = now + PROGRESS_INTERVAL
+        frames_done = self.frames if frames_done is None else frames_done
+        elapsed = now - self._start
+        try:
+            bytes_written = os.path.getsize(self.output_path) if self.output_path else 0
+        except OSError:
+            bytes_written = 0
+        index, total = self.job or (None, None)
+        self.event_callback({
+            'event': 'progress',
+            'file': self.file_name,
+            'index': index,
+            'total': total,
+            'frames_done': frames_done,
+            'frames_total': self.frames_total,
+            'bytes_written': bytes_written,
+            'fps': frames_done / elapsed if elapsed > 0 else 0.0,
+            'elapsed': elapsed,
+            'timestamp': time.time()
+        })
+
+    def finish(self, success, output_path=None):
+        """
+        结束计时并发送事件
+        :param output_path: 输出文件路径,一次转换输出多个文件时为路径列表
+        :return: 文件级汇总字典(即 'file' 事件)
+        """
+        wall_seconds = time.perf_counter() - self._start
+        output_bytes = 0
+        if success and output_path:
+            paths = output_path if isinstance(output_path, (list, tuple)) else [output_path]
+            output_bytes = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+        summary = {
+            'event': 'file',
+            'file': self.file_name,
+            'success': success,
+            'stages': dict(self.stages),
+            'frames': self.frames,
+            'fps': self.frames / wall_seconds if wall_seconds > 0 else 0.0,
+            'output_bytes': output_bytes,
+            'peak_rss_bytes': peak_rss_bytes(),
+            'wall_seconds': wall_seconds,
+            'timestamp': time.time()
+        }
+
+        if self.event_callback:
+            emit_summary(summary, self.event_callback)
+        return summary
+
+
+def emit_summary(summary, event_callback):
+    """把文件级汇总展开为各阶段事件和文件事件,依次交给回调"""
+    for stage, seconds in summary['stages'].items():
+        event_callback({'event': 'stage', 'file': summary['file'], 'stage': stage, 'seconds': seconds})
+    event_callback(summary)
+
+
+class NullMetrics:
+    """不计时的占位实现,避免各处判断 metrics 是否为None"""
+
+    frames = 0
+
+    def add(self, stage, seconds):
+        pass
+
+    def advance(self, count=1):
+        pass
+
+    def report_progress(self, frames_done=None):
+        pass
+
+    def merge(self, stages):
+        pass
+
+    @contextmanager
+    def stage(self, stage):
+        yield
+
+    def timed(self, iterable, stage):
+        return iter(iterable)
+
+
+NULL_METRICS = NullMetrics()
+
+
+class JsonLinesExporter:
+    """把事件逐行追加写入JSON Lines文件"""
+
+    def __init__(self, path, include_progress=False):
+        """
+        :param path: 输出文件路径
+        :param include_progress: 是否写入进度事件(每个文件每秒数条),默认只写阶段和文件事件
+        """
+        self.path = path
+        self.include_progress = include_progress
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.get('event') == 'progress' and not self.include_progress:
+            return
+        line = json.dumps(event, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+class PrometheusExporter:
+    """
+    汇总 'file' 事件,写出Prometheus文本格式文件(可供 node_exporter textfile collector 采集)
+    每次更新都先写临时文件再替换,采集端不会读到半个文件
+    """
+
+    def __init__(self, path, prefix='video_to_gif'):
+        self.path = path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._files = {'success': 0, 'failure': 0}
+        self._stage_seconds = {}
+        self._frames = 0
+        self._output_bytes = 0
+        self._wall_seconds = 0.0
+        self._peak_rss = 0
+
+    def __call__(self, event):
+        if event.get('event') != 'file':
+            return
+        with self._lock:
+            self._files['success' if event['success'] else 'failure'] += 1
+            for stage, seconds in event['stages'].items():
+                self._stage_seconds[stage] = self._stage_seconds.get(stage, 0.0) + seconds
+            self._frames += event['frames']
+            self._output_bytes += event['output_bytes']
+            self._wall_seconds += event['wall_seconds']
+            self._peak_rss = max(self._peak_rss, event['peak_rss_bytes'] or 0)
+            self._write()
+
+    def _write(self):
+        p = self.prefix
+        lines = [
+            f'# HELP {p}_files_total 已处理的文件数',
+            f'# TYPE {p}_files_total counter',
+        ]
+        for status, count in self._files.items():
+            lines.append(f'{p}_files_total{{status="{status}"}} {count}')
+        lines += [
+            f'# HELP {p}_stage_seconds_total 各阶段累计耗时(秒)',
+            f'# TYPE {p}_stage_seconds_total counter',
+        ]
+        for stage, seconds in sorted(self._stage_seconds.items()):
+            lines.append(f'{p}_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}')
+        lines += [
+            f'# TYPE {p}_frames_total counter',
+            f'{p}_frames_total {self._frames}',
+            f'# TYPE {p}_output_bytes_total counter',
+            f'{p}_output_bytes_total {self._output_bytes}',
+            f'# TYPE {p}_wall_seconds_total counter',
+            f'{p}_wall_seconds_total {self._wall_seconds:.6f}',
+            f'# TYPE {p}_peak_rss_bytes gauge',
+            f'{p}_peak_rss_bytes {self._peak_rss}',
+        ]
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+def combine_callbacks(*callbacks):
+    """把多个事件回调合并为一个,忽略其中的None"""
+    callbacks = [callback for callback in callbacks if callback]
+    if not callbacks:
+        return None
+    if len(callbacks) == 1:
+        return callbacks[0]
+
+    def dispatch(event):
+        for callback in callbacks:
+            callback(event)
+    return dispatch
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 调色板生成与向量化量化
+
+从抽样帧统计 5bit/通道 颜色直方图,用加权中位切分(median-cut)生成调色板,
+再预先计算 32x32x32 查找表,每帧只需一次数组索引即可映射到调色板
+"""
+import numpy as np
+from PIL import Image
+
+
+PALETTE_MODES = ['frame', 'global', 'scene']
+
+# 全局调色板默认抽样帧数
+DEFAULT_SAMPLE_FRAMES = 16
+# 场景切换判定: 缩略图平均绝对差超过该值(0-255)视为新场景
+SCENE_CUT_THRESHOLD = 30.0
+SCENE_THUMB_SIZE = (32, 32)
+
+LUT_BITS = 5
+LUT_SIZE = 1 << LUT_BITS
+
+
+def _bin_keys(pixels):
+    """把 (N, 3) uint8 像素映射为15位直方图键"""
+    shift = 8 - LUT_BITS
+    pixels = pixels.astype(np.uint32) >> shift
+    return (pixels[:, 0] << (2 * LUT_BITS)) | (pixels[:, 1] << LUT_BITS) | pixels[:, 2]
+
+
+def _bin_centers(keys):
+    """直方图键对应的RGB中心值"""
+    mask = LUT_SIZE - 1
+    shift = 8 - LUT_BITS
+    half = 1 << (shift - 1)
+    r = (keys >> (2 * LUT_BITS)) & mask
+    g = (keys >> LUT_BITS) & mask
+    b = keys & mask
+    return (np.stack([r, g, b], axis=1) << shift) + half
+
+
+def median_cut(frames, colors):
+    """
+    对若干帧做加权中位切分
+    :param frames: (H, W, 3) uint8 数组列表
+    :param colors: 目标颜色数
+    :return: (K, 3) uint8 调色板, K <= colors
+    """
+    keys = np.concatenate([_bin_keys(f.reshape(-1, 3)) for f in frames])
+    counts = np.bincount(keys, minlength=LUT_SIZE ** 3)
+    occupied = np.nonzero(counts)[0]
+    points = _bin_centers(occupied).astype(np.float64)
+    weights = counts[occupied].astype(np.float64)
+
+    def make_box(indices):
+        # 记录盒子的最大跨度及其通道,避免每轮重复计算
+        if len(indices) < 2:
+            return indices, 0.0, 0
+        spans = np.ptp(points[indices], axis=0)
+        channel = int(np.argmax(spans))
+        return indices, float(spans[channel]), channel
+
+    boxes = [make_box(np.arange(len(occupied)))]
+    while len(boxes) < colors:
+        # 选取跨度最大的盒子沿最长通道切分
+        i = max(range(len(boxes)), key=lambda k: boxes[k][1])
+        box, span, channel = boxes[i]
+        if span == 0:
+            break
+
+        boxes.pop(i)
+        order = box[np.argsort(points[box, channel], kind='stable')]
+        cumulative = np.cumsum(weights[order])
+        split = int(np.searchsorted(cumulative, cumulative[-1] / 2.0))
+        split = min(max(split, 1), len(order) - 1)
+        boxes.append(make_box(order[:split]))
+        boxes.append(make_box(order[split:]))
+
+    palette = np.array([
+        np.average(points[box], axis=0, weights=weights[box]) for box, _, _ in boxes
+    ])
+    return np.clip(np.rint(palette), 0, 255).astype(np.uint8)
+
+
+class Palette:
+    """调色板及其 32x32x32 查找表"""
+
+    def __init__(self, colors):
+        """
+        :param colors: (K, 3) uint8 调色板
+        """
+        self.colors = np.asarray(colors, dtype=np.uint8)
+        self.lut = self._build_lut()
+
+    def _build_lut(self):
+        """为每个直方图格子预先求出最近的调色板索引"""
+        centers = _bin_centers(np.arange(LUT_SIZE ** 3, dtype=np.uint32)).astype(np.float32)
+        palette = self.colors.astype(np.float32)
+        # |c - p|^2 = |c|^2 - 2c·p + |p|^2, |c|^2 对 argmin 无影响
+        distances = (palette ** 2).sum(axis=1)[np.newaxis, :] - 2.0 * centers @ palette.T
+        return np.argmin(distances, axis=1).astype(np.uint8)
+
+    def map(self, frame):
+        """
+        把RGB帧映射为调色板索引
+        :param frame: (H, W, 3) uint8 数组
+        :return: (H, W) uint8 调色板索引数组
+        """
+        return self.lut[_bin_keys(frame.reshape(-1, 3))].reshape(frame.shape[:2])
+
+    def to_bytes(self):
+        """GIF颜色表使用的RGB字节"""
+        return self.colors.tobytes()
+
+    @classmethod
+    def from_frames(cls, frames, colors):
+        """从若干帧生成调色板"""
+        return cls(median_cut(frames, colors))
+
+
+def sample_frames(clip, count=DEFAULT_SAMPLE_FRAMES, size=None):
+    """
+    在剪辑时长内均匀抽取若干帧
+    :param clip: moviepy 视频剪辑
+    :param count: 抽样帧数
+    :param size: 缩放到的尺寸 (宽, 高),为None时保持原尺寸
+    :return: (H, W, 3) uint8 数组列表
+    """
+    duration = clip.duration or 0
+    frames = []
+    for i in range(count):
+        # 取每段的中点,避开片头片尾的黑场
+        t = duration * (i + 0.5) / count
+        frame = clip.get_frame(min(t, max(duration - 1e-3, 0)))
+        image = Image.fromarray(frame.astype(np.uint8))
+        if size and image.size != tuple(size):
+            image = image.resize(tuple(size), Image.BILINEAR)
+        frames.append(np.asarray(image))
+    return frames
+
+
+class SceneDetector:
+    """基于缩略图平均绝对差的场景切换检测"""
+
+    def __init__(self, threshold=SCENE_CUT_THRESHOLD):
+        self.threshold = threshold
+        self._previous = None
+
+    def is_cut(self, image):
+        """
+        :param image: RGB PIL图像
+        :return: 是否为新场景的第一帧(第一次调用总是返回True)
+        """
+        thumb = np.asarray(image.resize(SCENE_THUMB_SIZE, Image.BILINEAR), dtype=np.int16)
+        previous, self._previous = self._previous, thumb
+        if previous is None:
+            return True
+        return float(np.abs(thumb - previous).mean()) > self.threshold
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 快速预览
+
+在视频时长内均匀取若干时间点,每个时间点只定位并解码最近的关键帧
+(-skip_frame nokey + -noaccurate_seek),由一条ffmpeg命令生成
+低帧率小尺寸预览GIF或缩略图拼图(contact sheet),耗时与视频长度基本无关。
+结果按文件大小和修改时间缓存在预览目录中,总大小超出预算时按最近最少使用(LRU)淘汰
+"""
+import os
+import time
+import hashlib
+import tempfile
+from pathlib import Path
+import ffmpeg_engine
+
+
+PREVIEW_KINDS = ['gif', 'sheet']
+
+# 预览GIF: 帧数、帧率、宽度、颜色数
+PREVIEW_FRAMES = 12
+PREVIEW_FPS = 4
+PREVIEW_WIDTH = 240
+PREVIEW_COLORS = 64
+
+# 缩略图拼图: 列数 x 行数,每张缩略图宽度
+SHEET_COLUMNS = 4
+SHEET_ROWS = 3
+SHEET_THUMB_WIDTH = 160
+
+# 预览目录的总大小上限(字节),以及中断遗留的临时文件保留多久(秒)后清理
+PREVIEW_CACHE_MAX_BYTES = 256 * 1024 ** 2
+STALE_TEMP_SECONDS = 3600
+
+
+def keyframe_times(duration, count):
+    """
+    在时长内均匀取 count 个时间点(每段的中点)
+    :param duration: 视频时长(秒),未知时为0
+    :return: 时间点列表(秒)
+    """
+    if duration <= 0:
+        return [0.0]
+    return [duration * (i + 0.5) / count for i in range(count)]
+
+
+def build_preview_command(input_path, output_path, duration, kind='gif', ffmpeg_binary=None):
+    """
+    构建预览命令: 每个时间点作为一个输入,只解码定位到的那一个关键帧
+    :param input_path: 输入视频路径
+    :param output_path: 输出路径(gif 或 png)
+    :param duration: 视频时长(秒)
+    :param kind: 'gif' 预览动图, 'sheet' 缩略图拼图
+    :param ffmpeg_binary: ffmpeg路径,默认与moviepy一致
+    :return: 命令参数列表
+    """
+    if kind == 'gif':
+        times = keyframe_times(duration, PREVIEW_FRAMES)
+        width = PREVIEW_WIDTH
+    else:
+        times = keyframe_times(duration, SHEET_COLUMNS * SHEET_ROWS)
+        width = SHEET_THUMB_WIDTH
+
+    cmd = [ffmpeg_binary or ffmpeg_engine.get_ffmpeg_binary(), '-y', '-loglevel', 'error']
+    filters = []
+    for i, t in enumerate(times):
+        # -noaccurate_seek: 停在目标时间之前的关键帧上,不再向后解码非关键帧
+        cmd += ['-skip_frame', 'nokey', '-noaccurate_seek', '-ss', f'{t:.3f}', '-i', str(input_path)]
+        filters.append(f'[{i}:v]trim=end_frame=1,setpts=PTS-STARTPTS,scale={width}:-2[v{i}]')
+
+    inputs = ''.join(f'[v{i}]' for i in range(len(times)))
+    concat = f'{inputs}concat=n={len(times)}:v=1:a=0'
+    if kind == 'gif':
+        filters.append(
+            f'{concat},setpts=N/({PREVIEW_FPS}*TB),split[s0][s1];'
+            f'[s0]palettegen=max_colors={PREVIEW_COLORS}[p];[s1][p]paletteuse'
+        )
+        cmd += ['-filter_complex', ';'.join(filters), '-loop', '0']
+    else:
+        # 不足的格子留空,拼图只输出一帧
+        filters.append(f'{concat},tile={SHEET_COLUMNS}x{SHEET_ROWS}:padding=2')
+        cmd += ['-filter_complex', ';'.join(filters), '-frames:v', '1']
+    cmd.append(str(output_path))
+    return cmd
+
+
+class PreviewCache:
+    """
+    预览文件缓存: 以 路径 + 大小 + 修改时间 + 类型 为键,命中时直接返回已有文件
+    预览文件的修改时间记录最近使用时间,每生成一个新预览后按预算淘汰最久未使用的文件
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=PREVIEW_CACHE_MAX_BYTES):
+        """
+        :param cache_dir: 预览目录,默认为系统临时目录下的 video_to_gif_previews
+        :param max_bytes: 预览目录的总大小上限(字节)
+        """
+        self.cache_dir = Path(cache_dir or os.path.join(tempfile.gettempdir(), 'video_to_gif_previews'))
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def path_for(self, video_path, kind):
+        """预览文件路径,源文件变化后路径随之变化"""
+        video_path = Path(video_path)
+        stat = video_path.stat()
+        source = f'{video_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}|{kind}'
+        key = hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+        return self.cache_dir / (key + ('.gif' if kind == 'gif' else '.png'))
+
+    def get(self, video_path, kind, duration):
+        """
+        返回预览文件,没有缓存时生成
+        :param duration: 视频时长(秒)
+        :return: 预览文件路径
+        :raises RuntimeError: ffmpeg生成失败
+        """
+        if kind not in PREVIEW_KINDS:
+            raise ValueError(f"不支持的预览类型: {kind}")
+        preview_path = self.path_for(video_path, kind)
+        if preview_path.exists():
+            try:
+                os.utime(preview_path)
+            except OSError:
+                pass
+            return preview_path
+
+        # 先写临时文件再改名,并发请求同一预览时不会读到半个文件
+        fd, tmp_path = tempfile.mkstemp(suffix=preview_path.suffix, dir=self.cache_dir)
+        os.close(fd)
+        tmp_path = Path(tmp_path)
+        try:
+            ffmpeg_engine.run_ffmpeg(build_preview_command(video_path, tmp_path, duration, kind))
+            os.replace(tmp_path, preview_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        self._evict(preview_path)
+        return preview_path
+
+    def _evict(self, keep):
+        """
+        总大小超出预算时按修改时间删除最久未使用的预览,并清理中断遗留的临时文件
+        :param keep: 刚生成的预览,不删除
+        """
+        now = time.time()
+        previews = []
+        total = 0
+        for path in self.cache_dir.iterdir():
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.name.startswith(tempfile.gettempprefix()):
+                # 其他进程可能正在写入,只清理足够旧的临时文件
+                if now - stat.st_mtime > STALE_TEMP_SECONDS:
+                    _remove(path)
+                continue
+            previews.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        for _, size, path in sorted(previews):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            _remove(path)
+            total -= size
+
+
+def _remove(path):
+    """删除文件,已被其他进程删除或占用时忽略"""
+    try:
+        path.unlink()
+    except OSError:
+        pass
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 任务调度与控制
+
+JobControl: 协作式的取消 / 暂停 / 继续。转换流程在每一帧之前调用 checkpoint(),
+暂停时阻塞等待,取消时抛出 ConversionCancelled,由转换流程删除未完成的临时文件。
+状态保存在 multiprocessing.Event 中,通过进程池的 initializer 传给子进程(init_worker),
+主进程中的一次调用对所有子进程立即生效
+
+JobQueue: 待转换任务的优先队列。用户置顶的任务最先转换,其余按时长从短到长(或其他顺序),
+每次取任务时重新排序,转换进行中置顶也会生效
+"""
+import multiprocessing
+from pathlib import Path
+
+
+# 暂停时检查取消的间隔(秒)
+PAUSE_POLL_SECONDS = 0.2
+
+
+class ConversionCancelled(Exception):
+    """转换被用户取消"""
+
+
+class JobControl:
+    """取消 / 暂停 / 置顶控制,可在界面线程中调用,对正在转换的所有进程生效"""
+
+    def __init__(self, manager=None):
+        """
+        :param manager: multiprocessing.Manager,指定时状态保存在管理进程中,JobControl 可以作为参数随任务提交到进程池
+                        (每个任务各自一个,单独暂停/取消);默认使用 multiprocessing.Event,只能在创建进程时传递
+        """
+        events = manager or multiprocessing
+        self._cancel = events.Event()
+        self._running = events.Event()
+        self._running.set()
+        # 置顶的文件路径(按置顶顺序),只在主进程中读取
+        self._pinned = []
+
+    def cancel(self):
+        """取消: 正在转换的文件在下一帧之前停止,尚未开始的文件不再转换"""
+        self._cancel.set()
+        # 暂停中的任务需要被唤醒才能看到取消
+        self._running.set()
+
+    def pause(self):
+        """暂停: 正在转换的文件在下一帧之前等待"""
+        self._running.clear()
+
+    def resume(self):
+        """继续已暂停的转换"""
+        self._running.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def checkpoint(self):
+        """
+        在处理下一帧之前调用: 暂停时阻塞,取消时抛出异常
+        :raises ConversionCancelled: 已取消
+        """
+        while not self._running.is_set():
+            self._running.wait(PAUSE_POLL_SECONDS)
+        if self._cancel.is_set():
+            raise ConversionCancelled("转换已取消")
+
+    def pin(self, video_path):
+        """置顶: 该文件在尚未开始的任务中最先转换"""
+        video_path = str(Path(video_path))
+        if video_path not in self._pinned:
+            self._pinned.append(video_path)
+
+    def pinned(self):
+        """置顶的文件路径列表"""
+        return list(self._pinned)
+
+
+_worker_control = None
+
+
+def init_worker(control):
+    """进程池 initializer: 记录主进程传来的 JobControl(multiprocessing.Event 只能在创建进程时传递)"""
+    global _worker_control
+    _worker_control = control
+
+
+def worker_control():
+    """当前子进程的 JobControl,进程池未设置时为None"""
+    return _worker_control
+
+
+class JobQueue:
+    """待转换任务的优先队列,元素为任务在输入列表中的序号"""
+
+    ORDERS = ['shortest', 'longest', 'name']
+
+    def __init__(self, video_files, durations=None, order='name', control=None):
+        """
+        :param video_files: 任务对应的视频路径列表
+        :param durations: 各任务的时长(秒)列表,'shortest'/'longest' 排序时需要
+        :param order: 'shortest' 时长从短到长(小文件不会排在大文件之后),
+                      'longest' 从长到短(并行时总耗时最短),'name' 保持输入顺序
+        :param control: JobControl,读取其中的置顶文件
+        """
+        if order not in self.ORDERS:
+            raise ValueError(f"不支持的任务顺序: {order}")
+        if order != 'name' and durations is None:
+            raise ValueError(f"按 {order} 排序需要各任务的时长")
+        self.video_files = [str(Path(video_file)) for video_file in video_files]
+        self.control = control
+        if order == 'shortest':
+            self._rank = list(durations)
+        elif order == 'longest':
+            self._rank = [-duration for duration in durations]
+        else:
+            self._rank = list(range(len(self.video_files)))
+        self._remaining = list(range(len(self.video_files)))
+
+    def __len__(self):
+        return len(self._remaining)
+
+    def pop(self):
+        """
+        取出下一个任务: 置顶的最先(按置顶顺序),其余按排序规则
+        :return: 任务序号,队列为空时返回None
+        """
+        if not self._remaining:
+            return None
+        pinned = self.control.pinned() if self.control else []
+
+        def priority(position):
+            video_file = self.video_files[position]
+            pin_rank = pinned.index(video_file) if video_file in pinned else len(pinned)
+            return pin_rank, self._rank[position], position
+
+        position = min(self._remaining, key=priority)
+        self._remaining.remove(position)
+        return position
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 多机共享任务队列
+
+协调端把一批待转换的文件写入共享存储上的SQLite数据库,各机器上的工作端从中租用(lease)任务:
+租用时记下工作端标识和租约到期时间,转换期间定期续约(心跳),完成后写回结果。
+工作端崩溃或断网后租约不再续期,到期的任务由下一次租用或协调端的轮询放回队列,由其他工作端重新转换;
+超过最大尝试次数的任务判为失败,不会无限重试。
+
+队列中的源文件和输出文件都记为相对输入/输出文件夹的路径,各机器把共享存储挂载在不同位置时也能使用。
+网络文件系统上不能使用WAL模式(依赖共享内存),这里使用默认的回滚日志;
+租约时间按各机器的本地时钟计算,各机器的时钟误差应远小于租约时长
+"""
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class SharedJobQueue:
+    """以SQLite文件为载体的任务租用队列,每个进程各自打开连接"""
+
+    FILE_NAME = '.video_to_gif_queue.db'
+    # 任务状态: 排队、已租用、完成、失败、取消
+    STATES = ['queued', 'leased', 'done', 'failed', 'cancelled']
+
+    def __init__(self, path, max_attempts=3):
+        """
+        打开(或创建)队列数据库
+        :param path: 数据库文件路径(位于各机器都能访问的共享存储上)
+        :param max_attempts: 每个任务最多被租用的次数,租约过期后超过该次数的任务判为失败
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        # 自行管理事务: 租用时需要 BEGIN IMMEDIATE 先取得写锁,保证同一任务不会被两个工作端同时租到
+        self._conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=DELETE')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' batch TEXT NOT NULL,'
+            ' source TEXT NOT NULL,'
+            ' output TEXT NOT NULL,'
+            ' options TEXT NOT NULL,'
+            ' state TEXT NOT NULL,'
+            ' worker TEXT,'
+            ' lease_expires REAL,'
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' success INTEGER,'
+            ' result TEXT,'
+            ' info TEXT,'
+            ' updated REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch, id)')
+
+    @contextmanager
+    def _transaction(self):
+        """写事务: 立即取得写锁,其他连接的写入等待到提交为止;出错时回滚"""
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def publish(self, batch, jobs):
+        """
+        发布一批任务,按列表顺序租用
+        :param batch: 批次标识
+        :param jobs: [{'source': 相对输入文件夹的路径, 'output': 相对输出文件夹的路径, 'options': {...}}, ...]
+        """
+        now = time.time()
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT INTO jobs (batch, source, output, options, state, updated) VALUES (?, ?, ?, ?, 'queued', ?)",
+                [(batch, job['source'], job['output'], json.dumps(job.get('options', {}), sort_keys=True), now)
+                 for job in jobs]
+            )
+
+    def _requeue_expired(self, now):
+        """把租约过期的任务放回队列,超过最大尝试次数的判为失败(在写事务中调用)"""
+        self._conn.execute(
+            "UPDATE jobs SET state = 'failed', success = 0, result = ?, worker = NULL, lease_expires = NULL,"
+            " updated = ? WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (f"租约过期 {self.max_attempts} 次,放弃转换", now, now, self.max_attempts)
+        )
+        return self._conn.execute(
+            "UPDATE jobs SET state = 'queued', worker = NULL, lease_expires = NULL, updated = ?"
+            " WHERE state = 'leased' AND lease_expires < ?",
+            (now, now)
+        ).rowcount
+
+    def requeue_expired(self):
+        """
+        把租约过期的任务放回队列(协调端轮询时调用,工作端租用时也会顺带处理)
+        :return: 放回队列的任务数
+        """
+        with self._transaction():
+            return self._requeue_expired(time.time())
+
+    def lease(self, worker, lease_seconds):
+        """
+        租用最早发布的一个排队任务
+        :param worker: 工作端标识
+        :param lease_seconds: 租约时长(秒),到期前需调用 heartbeat 续约
+        :return: 任务字典 {'id', 'batch', 'source', 'output', 'options', 'attempts'},没有排队的任务时返回None
+        """
+        now = time.time()
+        with self._transaction():
+            self._requeue_expired(now)
+            row = self._conn.execute(
+                "SELECT id, batch, source, output, options, attempts FROM jobs WHERE state = 'queued'"
+                ' ORDER BY id LIMIT 1'
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1,"
+                ' updated = ? WHERE id = ?',
+                (worker, now + lease_seconds, now, row[0])
+            )
+        return {'id': row[0], 'batch': row[1], 'source': row[2], 'output': row[3],
+                'options': json.loads(row[4]), 'attempts': row[5] + 1}
+
+    def heartbeat(self, job_id, worker, lease_seconds):
+        """
+        续约
+        :return: 租约仍属于该工作端时返回True;已过期被放回队列、被其他工作端租走或批次被取消时返回False
+        """
+        now = time.time()
+        with self._transaction():
+            return self._conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                (now + lease_seconds, now, job_id, worker)
+            ).rowcount == 1
+
+    def finish(self, job_id, worker, success, result, info=None):
+        """
+        写回转换结果,只接受当前持有租约的工作端的结果
+        :param success: 是否成功
+        :param result: 输出路径(相对输出文件夹)或错误信息
+        :param info: 可序列化为JSON的统计信息
+        :return: 结果是否被接受
+        """
+        now = time.time()
+        with self._transaction():
+            return self._conn.execute(
+                'UPDATE jobs SET state = ?, success = ?, result = ?, info = ?, lease_expires = NULL, updated = ?'
+                " WHERE id = ? AND state = 'leased' AND worker = ?",
+                ('done' if success else 'failed', int(bool(success)), result, json.dumps(info or {}), now,
+                 job_id, worker)
+            ).rowcount == 1
+
+    def release(self, job_id, worker):
+        """
+        工作端主动退出时交还租用的任务,立即放回队列,不计入尝试次数
+        :return: 是否交还成功(租约仍属于该工作端)
+        """
+        now = time.time()
+        with self._transaction():
+            return self._conn.execute(
+                "UPDATE jobs SET state = 'queued', worker = NULL, lease_expires = NULL, attempts = attempts - 1,"
+                " updated = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                (now, job_id, worker)
+            ).rowcount == 1
+
+    def cancel(self, batch):
+        """
+        取消一个批次: 排队的任务不再租出,正在转换的任务在工作端下一次续约时停止
+        :return: 被取消的任务数
+        """
+        now = time.time()
+        with self._transaction():
+            return self._conn.execute(
+                "UPDATE jobs SET state = 'cancelled', success = 0, worker = NULL, lease_expires = NULL, updated = ?"
+                " WHERE batch = ? AND state IN ('queued', 'leased')",
+                (now, batch)
+            ).rowcount
+
+    def counts(self, batch=None):
+        """
+        各状态的任务数
+        :param batch: 只统计该批次,为None时统计全部
+        :return: {状态: 数量},包含所有状态
+        """
+        query = 'SELECT state, COUNT(*) FROM jobs'
+        params = ()
+        if batch is not None:
+            query += ' WHERE batch = ?'
+            params = (batch,)
+        counts = dict.fromkeys(self.STATES, 0)
+        counts.update(self._conn.execute(query + ' GROUP BY state', params).fetchall())
+        return counts
+
+    def jobs(self, batch):
+        """
+        一个批次的全部任务(按发布顺序)
+        :return: [{'id', 'source', 'output', 'state', 'worker', 'attempts', 'success', 'result', 'info'}, ...]
+        """
+        rows = self._conn.execute(
+            'SELECT id, source, output, state, worker, attempts, success, result, info FROM jobs'
+            ' WHERE batch = ? ORDER BY id',
+            (batch,)
+        ).fetchall()
+        keys = ('id', 'source', 'output', 'state', 'worker', 'attempts', 'success', 'result', 'info')
+        jobs = []
+        for row in rows:
+            job = dict(zip(keys, row))
+            job['success'] = bool(job['success'])
+            job['info'] = json.loads(job['info']) if job['info'] else {}
+            jobs.append(job)
+        return jobs
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
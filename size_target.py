@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 目标文件大小模式
+
+把 fps/scale/colors 三个参数合成一个"压缩等级" level (0=质量档位原设置, 1=最低设置),
+各参数随 level 单调下降,输出大小也随之单调变小,于是可以对 level 做二分查找:
+    1. 用ffmpeg只编码几段抽样片段,按时长比例外推整段的输出大小(估算很便宜)
+    2. 二分查找估算大小不超过目标的最小 level
+    3. 完整编码一次;若实际大小超标,用 实际/估算 的比值校正估算后从更高的 level 继续查找
+"""
+import math
+import tempfile
+from pathlib import Path
+import ffmpeg_engine
+from metrics import NULL_METRICS
+
+
+# 搜索下限
+MIN_FPS = 4
+MIN_SCALE = 0.2
+MIN_COLORS = 16
+
+# 抽样估算: 均匀抽取的片段数和每段时长(秒)
+SAMPLE_SEGMENTS = 3
+SAMPLE_SECONDS = 1.0
+
+# 二分查找步数,level 精度为 1/2^SEARCH_STEPS
+SEARCH_STEPS = 6
+# 完整编码次数上限
+MAX_FULL_ENCODES = 3
+# 估算值需低于目标的比例,给估算误差留出余量
+SAFETY_MARGIN = 0.95
+
+
+def settings_at_level(base_settings, level):
+    """
+    计算某个压缩等级对应的质量配置
+    :param base_settings: 质量档位配置,即 level=0 时的设置
+    :param level: 0~1 的压缩等级
+    :return: 新的配置字典
+    """
+    level = min(max(level, 0.0), 1.0)
+    settings = dict(base_settings)
+
+    fps = base_settings['fps']
+    settings['fps'] = max(1, int(round(fps + (min(MIN_FPS, fps) - fps) * level)))
+
+    scale = base_settings['scale']
+    settings['scale'] = round(scale + (min(MIN_SCALE, scale) - scale) * level, 3)
+
+    # 颜色数按对数插值,128 -> 64 与 32 -> 16 的画质损失相当
+    colors = base_settings['colors']
+    log_colors = math.log2(colors) + (math.log2(min(MIN_COLORS, colors)) - math.log2(colors)) * level
+    settings['colors'] = max(2, int(round(2 ** log_colors)))
+    return settings
+
+
+class SizeEstimator:
+    """抽样编码估算输出大小,同一组设置只编码一次"""
+
+    def __init__(self, video_path, duration, ffmpeg_binary=None, metrics=NULL_METRICS, start=0.0):
+        """
+        :param video_path: 视频路径
+        :param duration: 要转换的时长(秒),整段转换时可由 VideoToGifConverter.probe 获得
+        :param ffmpeg_binary: ffmpeg路径,默认与moviepy一致
+        :param metrics: ConversionMetrics,抽样编码计入 estimate 阶段
+        :param start: 要转换片段的起点(秒),抽样只在 [start, start + duration) 内进行
+        """
+        self.video_path = Path(video_path)
+        self.duration = duration
+        self.start = start
+        self.ffmpeg_binary = ffmpeg_binary or ffmpeg_engine.get_ffmpeg_binary()
+        self.metrics = metrics
+        self.ranges = self._sample_ranges()
+        self.sampled_seconds = sum(length for _, length in self.ranges)
+        self._cache = {}
+
+    def _sample_ranges(self):
+        """均匀分布的抽样片段 (起点, 时长);视频较短时直接使用整段"""
+        if self.duration <= SAMPLE_SEGMENTS * SAMPLE_SECONDS * 2:
+            return [(self.start, self.duration)]
+        step = self.duration / SAMPLE_SEGMENTS
+        return [(self.start + step * (i + 0.5) - SAMPLE_SECONDS / 2, SAMPLE_SECONDS)
+                for i in range(SAMPLE_SEGMENTS)]
+
+    def estimate(self, settings):
+        """
+        估算整段视频按该设置编码后的大小
+        :return: 估算字节数
+        """
+        key = (settings['fps'], settings['scale'], settings['colors'])
+        if key not in self._cache:
+            with tempfile.TemporaryDirectory(prefix='gif_estimate_') as tmp_dir:
+                sample_path = Path(tmp_dir) / ('sample' + ffmpeg_engine.output_extension(settings.get('format', 'gif')))
+                cmd = ffmpeg_engine.build_gif_command(
+                    self.video_path, sample_path, settings, self.ffmpeg_binary, ranges=self.ranges
+                )
+                with self.metrics.stage('estimate'):
+                    ffmpeg_engine.run_ffmpeg(cmd)
+                sample_bytes = sample_path.stat().st_size
+            self._cache[key] = int(sample_bytes * self.duration / max(self.sampled_seconds, 1e-3))
+        return self._cache[key]
+
+
+def search_level(fits, low=0.0):
+    """
+    在 [low, 1] 内二分查找满足 fits(level) 的最小压缩等级
+    :param fits: level -> bool,随 level 增大由False变为True
+    :param low: 查找下限
+    :return: 满足条件的最小 level;都不满足时返回1.0
+    """
+    if fits(low):
+        return low
+    if low >= 1.0 or not fits(1.0):
+        return 1.0
+    bad, good = low, 1.0
+    for _ in range(SEARCH_STEPS):
+        middle = (bad + good) / 2
+        if fits(middle):
+            good = middle
+        else:
+            bad = middle
+    return good
+
+
+def fit_to_size(base_settings, target_bytes, estimator, full_encode, progress_callback=None):
+    """
+    寻找输出不超过目标大小、且尽量接近质量档位的设置,并完成最终编码
+    :param base_settings: 质量档位配置
+    :param target_bytes: 目标大小(字节)
+    :param estimator: SizeEstimator
+    :param full_encode: settings -> 输出字节数,执行一次完整编码
+    :param progress_callback: 进度回调函数
+    :return: {'settings': 最终设置, 'level': 压缩等级, 'output_bytes': 实际大小,
+              'estimated_bytes': 校正前的估算大小, 'full_encodes': 完整编码次数, 'fits': 是否达到目标}
+    """
+    correction = 1.0
+    low = 0.0
+    step = 1.0 / (1 << SEARCH_STEPS)
+    result = None
+
+    for attempt in range(1, MAX_FULL_ENCODES + 1):
+        def fits(level):
+            settings = settings_at_level(base_settings, level)
+            return estimator.estimate(settings) * correction <= target_bytes * SAFETY_MARGIN
+
+        level = search_level(fits, low)
+        settings = settings_at_level(base_settings, level)
+        estimated = estimator.estimate(settings)
+        if progress_callback:
+            progress_callback(
+                f"目标大小: 第{attempt}次编码 fps={settings['fps']} scale={settings['scale']} "
+                f"colors={settings['colors']},估算 {estimated * correction / 1024:.0f} KB"
+            )
+
+        output_bytes = full_encode(settings)
+        result = {
+            'settings': settings,
+            'level': level,
+            'output_bytes': output_bytes,
+            'estimated_bytes': estimated,
+            'full_encodes': attempt,
+            'fits': output_bytes <= target_bytes
+        }
+        if result['fits'] or level >= 1.0:
+            break
+
+        # 估算偏小: 按实际大小校正,并从更高的压缩等级继续查找
+        correction = output_bytes / max(estimated, 1)
+        low = min(1.0, level + step)
+
+    return result
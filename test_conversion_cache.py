@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转换结果缓存测试 - 索引持久化、孤立文件清理、哈希备忘清理、恢复时复制、缓存键、输出格式
+
+运行: python -m pytest test_conversion_cache.py
+"""
+import json
+import subprocess
+import ffmpeg_engine
+from conversion_cache import ConversionCache
+from video_to_gif import VideoToGifConverter
+
+
+def make_output(folder, name, content=b'GIF89a'):
+    path = folder / name
+    path.write_bytes(content)
+    return path
+
+
+def make_video(path, seconds=0.5):
+    """用ffmpeg的测试图案生成一个短视频"""
+    subprocess.run(
+        [ffmpeg_engine.get_ffmpeg_binary(), '-y', '-loglevel', 'error', '-f', 'lavfi',
+         '-i', f'testsrc=duration={seconds}:size=64x48:rate=10', str(path)],
+        check=True, capture_output=True, timeout=60
+    )
+    return path
+
+
+def cache_hits(tmp_path, **options):
+    """用同一个缓存目录批量转换一次,返回各文件是否命中缓存"""
+    converter = VideoToGifConverter(tmp_path / 'in', tmp_path / 'out', engine='stream', cache_dir=tmp_path / 'cache',
+                                    **options)
+    success, failed, results = converter.convert_batch('low', workers=1)
+    assert failed == 0
+    return [entry['cache_hit'] for entry in results]
+
+
+def test_store_saves_index(tmp_path):
+    """每次写入缓存后立即保存索引,中途中断也不会丢失记录"""
+    cache = ConversionCache(tmp_path / 'cache')
+    cache.store('k1', make_output(tmp_path, 'a.gif'), 'a.mp4')
+
+    index = json.loads((tmp_path / 'cache' / ConversionCache.INDEX_NAME).read_text(encoding='utf-8'))
+    assert list(index['entries']) == ['k1']
+
+
+def test_orphan_blobs_removed_on_load(tmp_path):
+    """索引中没有记录的缓存文件在打开缓存时删除"""
+    cache = ConversionCache(tmp_path / 'cache')
+    cache.store('k1', make_output(tmp_path, 'a.gif'), 'a.mp4')
+    orphan = cache.blob_dir / 'orphan.gif'
+    orphan.write_bytes(b'GIF89a')
+
+    reopened = ConversionCache(tmp_path / 'cache')
+    assert not orphan.exists()
+    assert reopened.restore('k1', tmp_path / 'restored.gif')
+
+
+def test_hash_memo_pruned(tmp_path):
+    """内容哈希备忘只保留仍存在且未变化的文件"""
+    kept = make_output(tmp_path, 'kept.mp4', b'video')
+    removed = make_output(tmp_path, 'removed.mp4', b'video')
+    changed = make_output(tmp_path, 'changed.mp4', b'video')
+    cache = ConversionCache(tmp_path / 'cache', hash_content=True)
+    settings = {'fps': 10}
+    for path in (kept, removed, changed):
+        cache.make_key(path, settings, 'stream')
+    cache.save()
+
+    removed.unlink()
+    changed.write_bytes(b'changed video')
+    reopened = ConversionCache(tmp_path / 'cache', hash_content=True)
+    assert list(reopened._index['hashes']) == [str(kept.resolve())]
+    assert reopened.make_key(kept, settings, 'stream') == cache.make_key(kept, settings, 'stream')
+
+
+def test_restore_copies_blob(tmp_path):
+    """命中缓存时复制到输出路径,之后改写输出文件不会改动缓存"""
+    cache = ConversionCache(tmp_path / 'cache')
+    cache.store('k1', make_output(tmp_path, 'a.gif'), 'a.mp4')
+
+    restored = tmp_path / 'out' / 'a.gif'
+    restored.parent.mkdir()
+    assert cache.restore('k1', restored)
+    with open(restored, 'r+b') as f:
+        f.write(b'edited')
+    assert (cache.blob_dir / 'k1.gif').read_bytes() == b'GIF89a'
+    assert cache.restore('k1', tmp_path / 'again.gif')
+    assert (tmp_path / 'again.gif').read_bytes() == b'GIF89a'
+
+
+def test_decode_scaling_changes_key(tmp_path):
+    """解码端缩放开关不同的转换结果分别缓存"""
+    (tmp_path / 'in').mkdir()
+    make_video(tmp_path / 'in' / 'a.mp4')
+    assert cache_hits(tmp_path, decode_scaling=True) == [False]
+    assert cache_hits(tmp_path, decode_scaling=False) == [False]
+    assert cache_hits(tmp_path, decode_scaling=True) == [True]
+    assert cache_hits(tmp_path, decode_scaling=False) == [True]
+
+
+def test_webp_restore_keeps_extension(tmp_path):
+    """WebP结果以 .webp 缓存,命中时恢复到 .webp 输出路径"""
+    (tmp_path / 'in').mkdir()
+    make_video(tmp_path / 'in' / 'a.mp4')
+    assert cache_hits(tmp_path, output_format='webp') == [False]
+    output = tmp_path / 'out' / 'a.webp'
+    content = output.read_bytes()
+    output.unlink()
+
+    assert cache_hits(tmp_path, output_format='webp') == [True]
+    assert output.read_bytes() == content
+    blob_dir = ConversionCache(tmp_path / 'cache').blob_dir
+    assert [path.suffix for path in blob_dir.iterdir()] == ['.webp']
+    assert not (tmp_path / 'out' / 'a.gif').exists()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多机批量转换测试 - 共享任务队列的租用顺序和汇总结果的顺序
+
+运行: python -m pytest test_distributed.py
+"""
+import subprocess
+import threading
+import ffmpeg_engine
+from scheduler import JobControl
+from video_to_gif import VideoToGifConverter
+
+
+def make_video(path, seconds):
+    """用ffmpeg的测试图案生成一个短视频"""
+    subprocess.run(
+        [ffmpeg_engine.get_ffmpeg_binary(), '-y', '-loglevel', 'error', '-f', 'lavfi',
+         '-i', f'testsrc=duration={seconds}:size=64x48:rate=10', str(path)],
+        check=True, capture_output=True, timeout=60
+    )
+
+
+def test_convert_distributed_keeps_input_order(tmp_path):
+    """工作端按时长从短到长租用,汇总结果仍按文件名排列"""
+    input_dir = tmp_path / 'in'
+    input_dir.mkdir()
+    for name, seconds in (('a.mp4', 1.2), ('b.mp4', 0.3), ('c.mp4', 0.6)):
+        make_video(input_dir / name, seconds)
+    converter = VideoToGifConverter(input_dir, tmp_path / 'out', engine='ffmpeg', queue_path=tmp_path / 'queue.db')
+
+    leased = []
+    control = JobControl()
+    worker = threading.Thread(target=converter.run_worker, kwargs={
+        'worker_id': 'test', 'poll_seconds': 0.05, 'exit_when_idle': False, 'control': control,
+        'progress_callback': lambda msg: leased.append(msg.split(': ')[1].split()[0]) if '处理:' in msg else None
+    })
+    worker.start()
+    try:
+        success, failed, results = converter.convert_distributed('low', order='shortest', poll_seconds=0.05,
+                                                                 timeout=120)
+    finally:
+        control.cancel()
+        worker.join()
+
+    assert leased == ['b.mp4', 'c.mp4', 'a.mp4']
+    assert (success, failed) == (3, 0)
+    assert [entry['file'] for entry in results] == ['a.mp4', 'b.mp4', 'c.mp4']
+    assert all(entry['worker'] == 'test' for entry in results)
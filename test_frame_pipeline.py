@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式帧处理管线测试 - 重复帧合并和按场景抽样的调色板
+
+运行: python -m pytest test_frame_pipeline.py
+"""
+import numpy as np
+from PIL import Image
+import frame_pipeline
+from frame_pipeline import FrameDeduplicator
+
+
+def solid(color, size=(64, 48)):
+    return Image.new('RGB', size, color)
+
+
+def test_deduplicated_merges_durations():
+    """重复帧被丢弃,时长合并到上一个保留帧,末尾的重复帧也计入"""
+    images = [solid((255, 0, 0))] * 3 + [solid((0, 0, 255))] * 2
+    dropped = [0]
+    kept = list(frame_pipeline._deduplicated(iter(images), iter([100] * 5), FrameDeduplicator(0), dropped))
+    assert [duration_ms for _, duration_ms in kept] == [300, 200]
+    assert dropped == [3]
+
+
+def test_scene_palette_sampled_across_scene():
+    """场景的第一帧是黑场(淡入)时,调色板仍包含场景后续帧的颜色"""
+    fade = [solid((level, level // 2, 255 - level)) for level in range(0, 256, 16)]
+    frames = [(image, 100) for image in fade]
+    # 阈值调高,淡入过程不算场景切换
+    paletted = list(frame_pipeline._scene_palettes(iter(frames), 16, scene_frames=len(frames),
+                                                   detector=frame_pipeline.SceneDetector(threshold=255)))
+
+    palettes = {id(palette) for _, _, palette in paletted}
+    assert len(palettes) == 1
+    palette = paletted[0][2]
+    last = np.asarray(fade[-1])
+    error = np.abs(palette.colors[palette.map(last)].astype(int) - last).mean()
+    assert error < 16
+
+
+def test_scene_palette_per_cut():
+    """每次场景切换生成新的调色板,场景内超出缓冲区的帧沿用已生成的调色板"""
+    frames = [(solid((255, 0, 0)), 100)] * 5 + [(solid((0, 255, 0)), 100)] * 5
+    paletted = list(frame_pipeline._scene_palettes(iter(frames), 8, scene_frames=2))
+    assert len(paletted) == len(frames)
+    first, second = paletted[0][2], paletted[5][2]
+    assert first is not second
+    assert all(palette is first for _, _, palette in paletted[:5])
+    assert all(palette is second for _, _, palette in paletted[5:])
+    # 查找表按每通道5位分格,颜色误差不超过半格
+    green = second.colors[second.map(np.asarray(frames[5][0]))][0, 0].astype(int)
+    assert np.abs(green - (0, 255, 0)).max() <= 4
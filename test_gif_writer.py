@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GIF写入器测试 - 用Pillow解码校验LZW编码器和并行压缩的输出
+
+运行: python -m pytest test_gif_writer.py
+"""
+import io
+import struct
+import numpy as np
+import pytest
+from PIL import Image
+import gif_writer
+from gif_writer import GifStreamWriter, encode_frame_data, lzw_encode
+
+COMPRESSORS = ['array'] + (['pillow'] if gif_writer.PILLOW_LZW else [])
+
+
+def single_frame_gif(indices, frame_data):
+    """把一帧压缩数据包装成使用256色灰阶全局颜色表的GIF文件"""
+    height, width = indices.shape
+    return (b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF7, 0, 0) + bytes(range(256)) * 3
+            + b'\x2c' + struct.pack('<HHHHB', 0, 0, width, height, 0) + frame_data + b'\x3b')
+
+
+def decode_single_frame(indices, frame_data):
+    """用Pillow解码单帧GIF,返回调色板索引数组"""
+    with Image.open(io.BytesIO(single_frame_gif(indices, frame_data))) as image:
+        return np.asarray(image)
+
+
+def patterns():
+    """各种图案,随机尺寸和取值范围覆盖码长加宽和码表写满后清除重建的各种位置"""
+    rng = np.random.default_rng(0)
+    rows, cols = np.mgrid[:240, :320]
+    cases = {
+        'noise': rng.integers(0, 256, (240, 320)),
+        'gradient': (cols // 7 + rows // 5) % 200,
+        'solid': np.zeros((240, 320)),
+        'few_colors': rng.integers(0, 4, (100, 333)),
+        '1x1': np.full((1, 1), 7),
+        '1x2': np.full((1, 2), 7),
+    }
+    for k in range(40):
+        shape = (int(rng.integers(1, 120)), int(rng.integers(1, 120)))
+        cases[f'random_{k}'] = rng.integers(0, int(rng.integers(1, 257)), shape)
+    return [pytest.param(pattern.astype(np.uint8), id=name) for name, pattern in cases.items()]
+
+
+def animation_frames(count=12):
+    """多帧测试数据: 每帧各有局部调色板"""
+    rng = np.random.default_rng(1)
+    cols = np.mgrid[:90, :160][1]
+    return [(rng.integers(0, 64, (90, 160)).astype(np.uint8) + (cols // 40).astype(np.uint8),
+             rng.integers(0, 256, 3 * 256, dtype=np.uint8).tobytes()) for _ in range(count)]
+
+
+def write_animation(path, frames, compress_workers, compressor):
+    with GifStreamWriter(path, (160, 90), compress_workers=compress_workers, compressor=compressor) as writer:
+        for indices, palette in frames:
+            writer.write_frame(indices, palette, 100)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('indices', patterns())
+def test_lzw_encode_round_trip(indices):
+    """lzw_encode 的码流经Pillow解码后还原为原索引"""
+    frame_data = bytes([gif_writer.MIN_CODE_SIZE]) + gif_writer._sub_blocks(lzw_encode(indices.tobytes()))
+    np.testing.assert_array_equal(decode_single_frame(indices, frame_data), indices)
+
+
+@pytest.mark.parametrize('compressor', COMPRESSORS)
+@pytest.mark.parametrize('indices', patterns()[:6])
+def test_encode_frame_data_round_trip(indices, compressor):
+    """两种编码器压缩的帧数据都能被Pillow还原"""
+    np.testing.assert_array_equal(decode_single_frame(indices, encode_frame_data(indices, compressor)), indices)
+
+
+@pytest.mark.parametrize('compressor', COMPRESSORS)
+@pytest.mark.parametrize('workers', [3, 4])
+def test_parallel_writer_matches_serial(tmp_path, compressor, workers):
+    """并行压缩写出的文件与逐帧压缩的逐字节相同,帧顺序不变"""
+    frames = animation_frames()
+    serial = write_animation(tmp_path / 'serial.gif', frames, 1, compressor)
+    parallel = write_animation(tmp_path / 'parallel.gif', frames, workers, compressor)
+    assert parallel == serial
+
+    with Image.open(io.BytesIO(parallel)) as image:
+        assert image.n_frames == len(frames)
+        for number, (indices, palette) in enumerate(frames):
+            image.seek(number)
+            expected = np.frombuffer(palette, dtype=np.uint8).reshape(-1, 3)[indices]
+            np.testing.assert_array_equal(np.asarray(image.convert('RGB')), expected)
+
+
+def test_writer_abort_releases_threads(tmp_path):
+    """出错退出时取消积压的压缩任务并关闭文件"""
+    writer = GifStreamWriter(tmp_path / 'abort.gif', (160, 90), compress_workers=3)
+    with pytest.raises(RuntimeError):
+        with writer:
+            for indices, palette in animation_frames(6):
+                writer.write_frame(indices, palette, 100)
+            raise RuntimeError('abort')
+    assert writer._executor is None
+    assert not writer._pending
+
+
+def test_pad_final_delay(tmp_path):
+    """补足最后一帧的时长使总时长达到指定值,帧数和画面不变"""
+    frames = animation_frames(4)
+    path = tmp_path / 'padded.gif'
+    original = write_animation(path, frames, 1, COMPRESSORS[0])
+    assert gif_writer.pad_final_delay(path, 1000) == len(frames)
+
+    with Image.open(path) as image:
+        delays = []
+        for number in range(image.n_frames):
+            image.seek(number)
+            delays.append(image.info['duration'])
+    assert delays == [100, 100, 100, 700]
+    assert len(path.read_bytes()) == len(original)
+    # 总时长已够时不缩短
+    assert gif_writer.pad_final_delay(path, 200) == len(frames)
+    assert path.read_bytes() != original
+    with Image.open(path) as image:
+        image.seek(3)
+        assert image.info['duration'] == 700
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+快速预览测试 - 预览目录按大小预算淘汰
+
+运行: python -m pytest test_preview.py
+"""
+import os
+import time
+import preview
+from preview import PreviewCache
+
+
+def make_file(folder, name, size, age):
+    """生成指定大小的文件,修改时间为 age 秒之前"""
+    path = folder / name
+    path.write_bytes(b'\0' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_evict_least_recently_used(tmp_path):
+    """超出预算时先删除最久未使用的预览,刚生成的预览保留"""
+    cache = PreviewCache(tmp_path, max_bytes=250)
+    oldest = make_file(tmp_path, 'oldest.gif', 100, 300)
+    older = make_file(tmp_path, 'older.png', 100, 200)
+    recent = make_file(tmp_path, 'recent.gif', 100, 100)
+    new = make_file(tmp_path, 'new.gif', 100, 0)
+
+    cache._evict(new)
+    assert not oldest.exists()
+    assert not older.exists()
+    assert recent.exists() and new.exists()
+
+
+def test_evict_keeps_new_preview_over_budget(tmp_path):
+    """单个预览超出预算时也不删除刚生成的预览"""
+    cache = PreviewCache(tmp_path, max_bytes=10)
+    new = make_file(tmp_path, 'new.gif', 100, 300)
+    cache._evict(new)
+    assert new.exists()
+
+
+def test_stale_temp_files_removed(tmp_path):
+    """中断遗留的临时文件过期后清理,正在写入的临时文件保留"""
+    cache = PreviewCache(tmp_path)
+    stale = make_file(tmp_path, 'tmpstale.gif', 10, preview.STALE_TEMP_SECONDS + 60)
+    writing = make_file(tmp_path, 'tmpwriting.gif', 10, 0)
+    new = make_file(tmp_path, 'new.gif', 10, 0)
+
+    cache._evict(new)
+    assert not stale.exists()
+    assert writing.exists()
@@ -4,7 +4,11 @@
 代码验证脚本 - 检查Python语法和逻辑
 """
 import ast
+import os
 import sys
+import json
+import tempfile
+import subprocess
 
 
 def check_syntax(filename):
@@ -25,6 +29,85 @@ def check_syntax(filename):
         return False
 
 
+# 启动时导入的模块耗时上限(秒),且不得导入转换时才需要的重量级依赖
+IMPORT_BUDGET_SECONDS = 0.3
+STARTUP_MODULES = ['video_to_gif', 'watch_daemon']
+HEAVY_DEPENDENCIES = ['moviepy', 'numpy', 'PIL', 'imageio']
+
+IMPORT_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+# 扫描输入文件夹并探测一个视频,同样不得导入重量级依赖(探测只调用ffmpeg/ffprobe)
+SCAN_PROBE = """
+import sys, json
+from video_to_gif import VideoToGifConverter
+converter = VideoToGifConverter({input_dir!r}, {input_dir!r})
+converter.probe(converter.get_video_files()[0])
+print(json.dumps({{'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def check_import_budget(module):
+    """在新的解释器中导入模块,检查耗时和是否过早导入重量级依赖"""
+    print(f"检查导入耗时: {module}")
+    try:
+        proc = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+            capture_output=True, text=True, timeout=60
+        )
+        if proc.returncode != 0:
+            print(f"  ✗ 导入失败: {proc.stderr.strip().splitlines()[-1:]}")
+            return False
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+    except Exception as e:
+        print(f"  ✗ 错误: {e}")
+        return False
+
+    if result['loaded']:
+        print(f"  ✗ 启动时导入了 {', '.join(result['loaded'])}")
+        return False
+    if result['seconds'] > IMPORT_BUDGET_SECONDS:
+        print(f"  ✗ 导入耗时 {result['seconds'] * 1000:.0f} ms,超过 {IMPORT_BUDGET_SECONDS * 1000:.0f} ms")
+        return False
+    print(f"  ✓ {result['seconds'] * 1000:.0f} ms")
+    return True
+
+
+def check_scan_probe():
+    """生成一个短视频,在新的解释器中扫描并探测它,检查是否导入了重量级依赖"""
+    print("检查扫描和探测: video_to_gif")
+    try:
+        import ffmpeg_engine
+        with tempfile.TemporaryDirectory() as input_dir:
+            subprocess.run(
+                [ffmpeg_engine.get_ffmpeg_binary(), '-y', '-loglevel', 'error', '-f', 'lavfi',
+                 '-i', 'testsrc=duration=0.5:size=64x48:rate=10', os.path.join(input_dir, 'probe.mp4')],
+                check=True, capture_output=True, timeout=60
+            )
+            proc = subprocess.run(
+                [sys.executable, '-c', SCAN_PROBE.format(input_dir=input_dir, heavy=HEAVY_DEPENDENCIES)],
+                capture_output=True, text=True, timeout=60
+            )
+        if proc.returncode != 0:
+            print(f"  ✗ 探测失败: {proc.stderr.strip().splitlines()[-1:]}")
+            return False
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+    except Exception as e:
+        print(f"  ✗ 错误: {e}")
+        return False
+
+    if result['loaded']:
+        print(f"  ✗ 扫描和探测时导入了 {', '.join(result['loaded'])}")
+        return False
+    print("  ✓ 未导入重量级依赖")
+    return True
+
+
 def main():
     """主函数"""
     print("=" * 60)
@@ -34,6 +117,26 @@ def main():
 
     files_to_check = [
         'video_to_gif.py',
+        'ffmpeg_engine.py',
+        'conversion_cache.py',
+        'frame_pipeline.py',
+        'gif_writer.py',
+        'palette.py',
+        'watch_daemon.py',
+        'metrics.py',
+        'size_target.py',
+        'preview.py',
+        'job_journal.py',
+        'shared_queue.py',
+        'distributed.py',
+        'http_service.py',
+        'scheduler.py',
+        'benchmark.py',
+        'test_gif_writer.py',
+        'test_frame_pipeline.py',
+        'test_conversion_cache.py',
+        'test_distributed.py',
+        'test_preview.py',
         'gui.py',
         'build_exe.py'
     ]
@@ -44,6 +147,15 @@ def main():
             all_passed = False
         print()
 
+    for module in STARTUP_MODULES:
+        if not check_import_budget(module):
+            all_passed = False
+        print()
+
+    if not check_scan_probe():
+        all_passed = False
+    print()
+
     print("=" * 60)
     if all_passed:
         print("所有文件验证通过!")
@@ -2,32 +2,100 @@
 # -*- coding: utf-8 -*-
 """
 视频转GIF工具 - 核心转换模块
+
+moviepy 和流式管线(numpy/PIL)导入耗时较长,推迟到第一次转换时才导入,
+界面启动和扫描文件不受影响;可调用 warm_up() 在后台提前导入
 """
+import re
 import os
 import sys
+import json
+import math
+import time
+import uuid
+import socket
+import importlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
-from moviepy.editor import VideoFileClip
+import ffmpeg_engine
+import size_target
+from preview import PreviewCache
+from conversion_cache import ConversionCache
+from job_journal import JobJournal
+from shared_queue import SharedJobQueue
+import scheduler
+from scheduler import ConversionCancelled, JobQueue
+from metrics import ConversionMetrics
+
+
+# 转换时才需要的重量级模块,warm_up() 按顺序预先导入
+HEAVY_MODULES = ['moviepy.editor', 'frame_pipeline']
+
+
+def warm_up(background=True):
+    """
+    提前导入转换所需的重量级模块,第一次转换时无需再等待
+    :param background: 是否在后台守护线程中导入
+    :return: 后台导入时返回线程对象,否则返回None
+    """
+    if not background:
+        _import_heavy_modules()
+        return None
+    thread = threading.Thread(target=_import_heavy_modules, name='warm-up', daemon=True)
+    thread.start()
+    return thread
+
+
+def _import_heavy_modules():
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            # 导入失败留到真正转换时再报告
+            pass
 
 
 class QualitySettings:
-    """质量配置类"""
+    """
+    质量配置类
+    palette: 调色板模式 ('frame' 逐帧, 'global' 全局, 'scene' 按场景),见 palette.PALETTE_MODES
+    dedup: 重复帧阈值(0-255),相邻帧差异不超过该值时丢弃并把时长合并到前一帧,None表示不去重
+    format: 输出格式 ('gif', 'webp' 有损动态WebP, 'webp_lossless' 无损动态WebP, 'apng'),
+            见 ffmpeg_engine.OUTPUT_FORMATS;colors/palette/dedup 只对GIF生效
+    webp_quality: 动态WebP的质量(0-100),无损模式下为压缩力度
+    """
     HIGH = {
         'fps': 15,
         'scale': 1.0,
         'optimize': True,
-        'colors': 256
+        'colors': 256,
+        'palette': 'scene',
+        'dedup': 1,
+        'format': 'gif',
+        'webp_quality': 90
     }
     MEDIUM = {
         'fps': 10,
         'scale': 0.75,
         'optimize': True,
-        'colors': 128
+        'colors': 128,
+        'palette': 'global',
+        'dedup': 3,
+        'format': 'gif',
+        'webp_quality': 80
     }
     LOW = {
         'fps': 8,
         'scale': 0.5,
         'optimize': True,
-        'colors': 64
+        'colors': 64,
+        'palette': 'global',
+        'dedup': 6,
+        'format': 'gif',
+        'webp_quality': 65
     }
 
 
@@ -35,15 +103,54 @@ class VideoToGifConverter:
     """视频转GIF转换器"""
 
     SUPPORTED_FORMATS = ['.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm', '.m4v']
+    ENGINES = ['moviepy', 'ffmpeg', 'stream']
+    # 分段并行编码时每段的最短时长(秒),过短的分段得不偿失
+    MIN_SEGMENT_SECONDS = 10
+    # 并发探测元数据的线程数,每个线程只是等待一个ffprobe/ffmpeg子进程
+    PROBE_WORKERS = 8
+
+    # 元数据探测缓存: 路径 -> ((大小, 修改时间), 元数据, 错误信息)
+    # 放在类上,同一进程内的所有转换器共享(界面每次扫描都会新建转换器),也不会随实例序列化到子进程
+    _probe_cache = {}
+    _probe_lock = threading.Lock()
 
-    def __init__(self, input_dir='D:/GIF/start', output_dir='D:/GIF/finish'):
+    def __init__(self, input_dir='D:/GIF/start', output_dir='D:/GIF/finish', engine='moviepy',
+                 cache_dir=None, cache_max_bytes=2 * 1024 ** 3, cache_hash=False, max_memory_mb=512,
+                 segment_workers=1, preview_dir=None, journal_path=None, output_format=None,
+                 decode_scaling=True, queue_path=None):
         """
         初始化转换器
         :param input_dir: 输入视频文件夹
         :param output_dir: 输出GIF文件夹
+        :param engine: 默认转换引擎 ('moviepy', 'ffmpeg', 'stream')
+        :param cache_dir: 转换缓存目录,为None时不启用缓存
+        :param cache_max_bytes: 缓存总大小上限(字节)
+        :param cache_hash: 是否以文件内容哈希代替修改时间作为缓存键
+        :param max_memory_mb: 流式引擎(stream)每个转换任务的帧缓冲内存上限(MB)
+        :param segment_workers: 流式引擎把单个长视频分段并行编码的进程数,1表示不分段
+        :param preview_dir: 预览缓存目录,默认为 cache_dir 下的 previews,未启用缓存时使用系统临时目录
+        :param journal_path: 批量任务日志(SQLite)路径,默认为输出文件夹下的 .video_to_gif_journal.db
+        :param output_format: 默认输出格式 ('gif', 'webp', 'webp_lossless', 'apng'),为None时使用质量档位中的格式
+        :param decode_scaling: moviepy/流式引擎是否在解码端完成抽帧和缩放(ffmpeg_engine.FrameReader),
+                               关闭时按源分辨率和帧率解码后在Python中逐帧缩放
+        :param queue_path: 多机转换的共享任务队列(SQLite)路径,默认为输出文件夹下的 .video_to_gif_queue.db,
+                           见 publish_batch / run_worker
         """
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
+        self.engine = engine
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024)
+        self.segment_workers = segment_workers
+        self.output_format = output_format
+        self.decode_scaling = decode_scaling
+        self.cache = None
+        if cache_dir:
+            self.cache = ConversionCache(cache_dir, cache_max_bytes, cache_hash)
+        if preview_dir is None and cache_dir:
+            preview_dir = Path(cache_dir) / 'previews'
+        self.preview_dir = preview_dir
+        self.journal_path = Path(journal_path) if journal_path else self.output_dir / JobJournal.FILE_NAME
+        self.queue_path = Path(queue_path) if queue_path else self.output_dir / SharedJobQueue.FILE_NAME
         self._ensure_dirs()
 
     def _ensure_dirs(self):
@@ -61,65 +168,483 @@ class VideoToGifConverter:
                     video_files.append(file)
         return sorted(video_files)
 
-    def convert_single(self, video_path, quality='medium', progress_callback=None):
+    def probe(self, video_path):
         """
-        转换单个视频文件为GIF
+        读取视频元数据(不解码),结果按文件大小和修改时间缓存,文件变化后重新探测
         :param video_path: 视频文件路径
-        :param quality: 质量等级 ('high', 'medium', 'low')
-        :param progress_callback: 进度回调函数
-        :return: (成功标志, 输出文件路径或错误信息)
+        :return: {'duration', 'width', 'height', 'fps', 'codec', 'rotation'},见 ffmpeg_engine.probe_video
+        :raises RuntimeError: 文件无法读取或没有视频流
+        :raises OSError: 文件不存在
         """
-        try:
-            video_path = Path(video_path)
-            output_filename = video_path.stem + '.gif'
-            output_path = self.output_dir / output_filename
+        video_path = Path(video_path)
+        stat = video_path.stat()
+        signature = (stat.st_size, stat.st_mtime_ns)
+        key = str(video_path.resolve())
 
-            # 获取质量配置
-            quality_settings = self._get_quality_settings(quality)
+        with self._probe_lock:
+            cached = self._probe_cache.get(key)
+        if cached and cached[0] == signature:
+            _, info, error = cached
+        else:
+            try:
+                info, error = ffmpeg_engine.probe_video(video_path), None
+            except RuntimeError as e:
+                info, error = None, str(e)
+            with self._probe_lock:
+                self._probe_cache[key] = (signature, info, error)
 
-            if progress_callback:
-                progress_callback(f"正在加载视频: {video_path.name}")
+        if error:
+            raise RuntimeError(error)
+        return dict(info)
 
-            # 加载视频
-            clip = VideoFileClip(str(video_path))
+    def probe_all(self, video_files=None):
+        """
+        并发探测多个视频的元数据
+        :param video_files: 视频路径列表,默认为输入文件夹中的所有视频
+        :return: (元数据字典 {路径: 元数据}, 错误字典 {路径: 错误信息})
+        """
+        video_files = self.get_video_files() if video_files is None else list(video_files)
+        infos = {}
+        errors = {}
+        if not video_files:
+            return infos, errors
 
-            # 应用缩放
-            if quality_settings['scale'] != 1.0:
-                new_width = int(clip.w * quality_settings['scale'])
-                new_height = int(clip.h * quality_settings['scale'])
-                clip = clip.resize((new_width, new_height))
+        with ThreadPoolExecutor(max_workers=min(self.PROBE_WORKERS, len(video_files))) as executor:
+            futures = {video_file: executor.submit(self.probe, video_file) for video_file in video_files}
+        for video_file, future in futures.items():
+            try:
+                infos[video_file] = future.result()
+            except (OSError, RuntimeError) as e:
+                errors[video_file] = str(e)
+        return infos, errors
 
-            if progress_callback:
-                progress_callback(f"正在转换: {video_path.name}")
+    def preview(self, video_path, kind='gif'):
+        """
+        生成快速预览(只解码关键帧),结果按文件缓存
+        :param video_path: 视频文件路径
+        :param kind: 'gif' 低帧率小尺寸预览动图, 'sheet' 缩略图拼图(PNG)
+        :return: 预览文件路径
+        :raises RuntimeError: 文件无法读取或预览生成失败
+        """
+        duration = self.probe(video_path)['duration']
+        return PreviewCache(self.preview_dir).get(video_path, kind, duration)
 
-            # 转换为GIF
-            clip.write_gif(
-                str(output_path),
-                fps=quality_settings['fps'],
-                program='ffmpeg',
-                opt='nq',
-                colors=quality_settings['colors']
-            )
+    def unfinished_jobs(self):
+        """
+        上次批量转换中失败或被中断的文件,可用 convert_batch(resume=True) 继续
+        :return: [{'source', 'output', 'state', 'error', 'attempts'}, ...],没有日志时为空列表
+        """
+        if not self.journal_path.exists():
+            return []
+        with JobJournal(self.journal_path) as journal:
+            return journal.unfinished()
+
+    def _output_path(self, video_path, time_range=None, name=None, output_format=None):
+        """
+        视频文件对应的输出路径
+        :param time_range: 截取的片段 (起点, 终点),文件名中追加时间范围,如 clip_1.5-4.gif
+        :param name: 指定输出文件名(不含扩展名)
+        :param output_format: 输出格式,决定扩展名,默认为构造时指定的格式(未指定时为GIF)
+        """
+        extension = ffmpeg_engine.output_extension(output_format or self.output_format or 'gif')
+        if name:
+            return self.output_dir / (name + extension)
+        stem = Path(video_path).stem
+        if time_range:
+            stem += f'_{time_range[0]:g}-{time_range[1]:g}'
+        return self.output_dir / (stem + extension)
+
+    def _resolve_range(self, video_path, start=None, end=None, duration=None):
+        """
+        把 start/end/duration 参数换算为 (起点, 终点) 秒,终点不超过视频时长
+        :return: (起点, 终点),三个参数都为None时返回None表示整段转换
+        :raises ValueError: 范围无效
+        """
+        if start is None and end is None and duration is None:
+            return None
+        if end is not None and duration is not None:
+            raise ValueError("end 和 duration 只能指定一个")
+
+        video_duration = self.probe(video_path)['duration']
+        start = float(start or 0.0)
+        if duration is not None:
+            end = start + float(duration)
+        end = video_duration if end is None else min(float(end), video_duration)
+        if start < 0 or start >= video_duration:
+            raise ValueError(f"起点 {start:g} 秒超出视频时长 {video_duration:g} 秒")
+        if end <= start:
+            raise ValueError(f"时间范围无效: {start:g} - {end:g} 秒")
+        return start, end
+
+    def convert_single(self, video_path, quality='medium', progress_callback=None, engine=None,
+                       event_callback=None, target_bytes=None, start=None, end=None, duration=None, control=None,
+                       output_format=None):
+        """
+        转换单个视频文件为GIF(或动态WebP/APNG)
+        :param video_path: 视频文件路径
+        :param quality: 质量等级 ('high', 'medium', 'low')
+        :param progress_callback: 进度回调函数
+        :param engine: 转换引擎 ('moviepy', 'ffmpeg', 'stream'),默认使用构造时指定的引擎
+        :param event_callback: 结构化计时事件回调函数,事件格式见 metrics 模块
+        :param target_bytes: 目标文件大小(字节),指定后以质量档位为上限自动降低 fps/scale/colors,见 size_target 模块
+        :param start: 截取起点(秒),在输入端定位,之前的帧不解码
+        :param end: 截取终点(秒),与 duration 二选一
+        :param duration: 截取时长(秒)
+        :param control: scheduler.JobControl,每帧之前检查暂停/取消,取消后不留下输出文件
+        :param output_format: 输出格式 ('gif', 'webp', 'webp_lossless', 'apng'),默认使用构造时指定的格式,
+                              都未指定时使用质量档位中的格式
+        :return: (成功标志, 输出文件路径或错误信息)
+        """
+        success, result, _ = self._convert_single(video_path, quality, progress_callback, engine, event_callback,
+                                                  target_bytes, start, end, duration, control=control,
+                                                  output_format=output_format)
+        return success, result
 
-            clip.close()
+    def _convert_single(self, video_path, quality='medium', progress_callback=None, engine=None,
+                        event_callback=None, target_bytes=None, start=None, end=None, duration=None,
+                        output_path=None, clip=None, control=None, job=None, output_format=None,
+                        compare_formats=None, partial_tag=None, publish_check=None):
+        """
+        convert_single 的实现,额外返回转换统计信息
+        :param output_path: 指定输出路径,默认由 _output_path 生成
+        :param clip: 已打开的 moviepy 视频剪辑,同一源文件截取多个片段时复用,由调用方关闭
+        :param job: 批量转换中的 (序号, 总数),写入进度事件
+        :param compare_formats: 转换完成后用同样的设置再编码为这些格式(写入临时文件夹,不保留),
+                                对比输出大小和编码耗时,见 _compare_formats
+        :param partial_tag: 临时文件名中追加的标识,多个进程可能同时转换同一输出时各自使用不同的临时文件
+        :param publish_check: 改名为正式输出之前调用,返回False时放弃结果(按取消处理,只删除自己的临时文件)
+        :return: (成功标志, 输出文件路径或错误信息, 统计信息字典)
+                 目标大小模式下统计信息的 'target' 记录最终选择的设置,见 size_target.fit_to_size;
+                 被取消时统计信息的 'cancelled' 为True;指定 compare_formats 时 'comparison' 为各格式的对比结果
+        """
+        info = {'frames_dropped': 0}
+        video_path = Path(video_path)
+        metrics = ConversionMetrics(video_path.name, event_callback)
+        metrics.job = job
+        partial_path = None
+        try:
+            if control:
+                control.checkpoint()
+            time_range = self._resolve_range(video_path, start, end, duration)
+            # 获取质量配置
+            quality_settings = self._get_quality_settings(quality, output_format)
+            if not output_path:
+                output_path = self._output_path(video_path, time_range, output_format=quality_settings['format'])
+            output_path = Path(output_path)
+            output_filename = output_path.name
+            # 先写入临时文件,完成后再改名,中途崩溃不会留下半个GIF
+            partial_path = _partial_path(output_path, partial_tag)
+            if time_range:
+                info['range'] = time_range
+
+            engine = (engine or self.engine).lower()
+            if engine not in self.ENGINES:
+                raise ValueError(f"不支持的转换引擎: {engine}")
+
+            source = {'time_range': time_range, 'clip': clip, 'control': control}
+            if target_bytes:
+                target = self._convert_to_target(engine, video_path, partial_path, quality_settings,
+                                                 target_bytes, progress_callback, metrics, info, source)
+                info['target'] = target
+                if not target['fits']:
+                    raise RuntimeError(
+                        f"最低设置下输出仍为 {target['output_bytes'] / 1024 ** 2:.2f} MB,"
+                        f"超过目标 {target_bytes / 1024 ** 2:.2f} MB"
+                    )
+            else:
+                info.update(self._run_engine(engine, video_path, partial_path, quality_settings,
+                                             progress_callback, metrics, **source))
+            if publish_check and not publish_check():
+                raise ConversionCancelled("结果已失效,不写入输出文件")
+            os.replace(partial_path, output_path)
 
             if progress_callback:
+                if info['frames_dropped']:
+                    progress_callback(f"已合并 {info['frames_dropped']} 个重复帧")
                 progress_callback(f"完成: {output_filename}")
 
-            return True, str(output_path)
+            info['metrics'] = metrics.finish(True, output_path)
+            if compare_formats:
+                settings = info['target']['settings'] if 'target' in info else quality_settings
+                info['comparison'] = self._compare_formats(engine, video_path, output_path, settings, compare_formats,
+                                                           info['metrics'], progress_callback, source)
+            return True, str(output_path), info
 
+        except ConversionCancelled:
+            if progress_callback:
+                progress_callback(f"已取消: {video_path.name}")
+            info['cancelled'] = True
+            info['metrics'] = metrics.finish(False)
+            return False, f"已取消: {video_path.name}", info
         except Exception as e:
             error_msg = f"转换失败 {video_path.name}: {str(e)}"
             if progress_callback:
                 progress_callback(error_msg)
-            return False, error_msg
+            info['metrics'] = metrics.finish(False)
+            return False, error_msg, info
+        finally:
+            if partial_path and partial_path.exists():
+                partial_path.unlink()
+
+    def _run_engine(self, engine, video_path, output_path, quality_settings, progress_callback, metrics,
+                    time_range=None, clip=None, control=None):
+        """
+        使用指定引擎完成一次完整编码
+        :param time_range: 只转换的片段 (起点, 终点),为None时转换整段
+        :param clip: 已打开的 moviepy 视频剪辑,为None时由引擎自行打开(ffmpeg引擎不使用)
+        :param control: scheduler.JobControl,为None时不检查暂停/取消
+        :return: 引擎返回的统计信息(流式引擎含 frames_dropped)
+        """
+        # 目标大小模式下每次完整编码都从0开始计算进度
+        metrics.frames = 0
+        metrics.frames_total = self._expected_frames(video_path, time_range, quality_settings['fps'])
+        metrics.output_path = output_path
+        metrics.report_progress()
+        args = (video_path, output_path, quality_settings, progress_callback, metrics)
+        if engine == 'ffmpeg':
+            try:
+                return self._convert_with_ffmpeg(*args, time_range=time_range, control=control)
+            except ConversionCancelled:
+                raise
+            except Exception as e:
+                # ffmpeg引擎失败时回退到moviepy
+                if progress_callback:
+                    progress_callback(f"FFmpeg引擎失败,改用MoviePy: {str(e)}")
+                return self._convert_with_moviepy(*args, time_range=time_range, clip=clip, control=control)
+        elif engine == 'stream':
+            return self._convert_with_stream(*args, time_range=time_range, clip=clip, control=control)
+        else:
+            return self._convert_with_moviepy(*args, time_range=time_range, clip=clip, control=control)
 
-    def convert_batch(self, quality='medium', progress_callback=None):
+    def _expected_frames(self, video_path, time_range, fps):
+        """按时长和输出帧率估计总帧数,时长未知时返回None"""
+        if time_range:
+            duration = time_range[1] - time_range[0]
+        else:
+            try:
+                duration = self.probe(video_path)['duration']
+            except (OSError, RuntimeError):
+                return None
+        return int(math.ceil(duration * fps - 1e-6)) if duration > 0 else None
+
+    def _convert_to_target(self, engine, video_path, output_path, quality_settings, target_bytes,
+                           progress_callback, metrics, info, source):
+        """
+        目标大小模式: 抽样估算输出大小,查找不超过目标的设置后完整编码,超标时校正估算再试
+        抽样编码计入 estimate 阶段
+        :param source: 传给 _run_engine 的 time_range、clip 和 control
+        :return: size_target.fit_to_size 的结果
+        """
+        time_range = source['time_range']
+        if time_range:
+            start, duration = time_range[0], time_range[1] - time_range[0]
+        else:
+            start, duration = 0.0, self.probe(video_path)['duration']
+        estimator = size_target.SizeEstimator(video_path, duration, metrics=metrics, start=start)
+
+        def full_encode(settings):
+            info.update(self._run_engine(engine, video_path, output_path, settings, progress_callback, metrics,
+                                         **source))
+            return output_path.stat().st_size
+
+        return size_target.fit_to_size(quality_settings, target_bytes, estimator, full_encode, progress_callback)
+
+    def _compare_formats(self, engine, video_path, output_path, quality_settings, compare_formats, summary,
+                         progress_callback, source):
+        """
+        用同样的设置和引擎把视频再编码为其他格式,输出写入临时文件夹后删除,只记录大小和耗时
+        取消时停止对比,已完成的输出保留
+        :param quality_settings: 实际使用的设置(目标大小模式下为最终选择的设置)
+        :param summary: 已完成输出的 metrics 汇总,作为对比基准
+        :param source: 传给 _run_engine 的 time_range、clip 和 control
+        :return: {格式: {'output_bytes', 'encode_seconds', 'size_ratio', 'time_ratio'}, ...},
+                 比值为相对已完成输出的倍数;包含已完成输出本身,编码失败的格式为 {'error': 错误信息}
+        """
+        base_bytes = summary['output_bytes']
+        base_seconds = summary['wall_seconds']
+        comparison = {quality_settings['format']: {
+            'output_bytes': base_bytes, 'encode_seconds': base_seconds, 'size_ratio': 1.0, 'time_ratio': 1.0
+        }}
+        with tempfile.TemporaryDirectory(prefix='.compare-', dir=output_path.parent) as tmp_dir:
+            for output_format in compare_formats:
+                if output_format in comparison:
+                    continue
+                settings = dict(quality_settings, format=output_format)
+                metrics = ConversionMetrics(video_path.name)
+                try:
+                    sample_path = Path(tmp_dir) / (output_path.stem + ffmpeg_engine.output_extension(output_format))
+                    self._run_engine(engine, video_path, sample_path, settings, None, metrics, **source)
+                    result = metrics.finish(True, sample_path)
+                except ConversionCancelled:
+                    break
+                except Exception as e:
+                    comparison[output_format] = {'error': str(e)}
+                    continue
+                comparison[output_format] = {
+                    'output_bytes': result['output_bytes'],
+                    'encode_seconds': result['wall_seconds'],
+                    'size_ratio': result['output_bytes'] / base_bytes if base_bytes else None,
+                    'time_ratio': result['wall_seconds'] / base_seconds if base_seconds else None
+                }
+                if progress_callback:
+                    progress_callback(
+                        f"格式对比 {video_path.name} -> {output_format}: {result['output_bytes'] / 1024:.0f} KB "
+                        f"({comparison[output_format]['size_ratio']:.2f}x), "
+                        f"{result['wall_seconds']:.1f} 秒 ({comparison[output_format]['time_ratio']:.2f}x)"
+                    )
+        return comparison
+
+    def _open_clip(self, video_path, metrics, clip=None):
+        """
+        打开视频(第一次转换时包含导入moviepy的耗时,计入 load 阶段)
+        :param clip: 已打开的剪辑,不为None时直接复用
+        :return: (剪辑, 是否由本次调用打开)
+        """
+        if clip is not None:
+            return clip, False
+        with metrics.stage('load'):
+            from moviepy.editor import VideoFileClip
+            return VideoFileClip(str(video_path), audio=False), True
+
+    def _frame_reader(self, video_path, quality_settings, time_range=None):
+        """
+        解码端完成抽帧和缩放的读取器,读出的帧已是目标尺寸和帧率
+        :param time_range: 只读取的片段 (起点, 终点)
+        :return: ffmpeg_engine.FrameReader;未开启 decode_scaling 或探测不到时长/尺寸时返回None,
+                 由调用方改用moviepy解码
+        """
+        if not self.decode_scaling:
+            return None
+        info = self.probe(video_path)
+        if time_range:
+            start, duration = time_range[0], time_range[1] - time_range[0]
+        else:
+            start, duration = 0.0, info['duration']
+        if duration <= 0 or not info['width'] or not info['height']:
+            return None
+        size = _scaled_size(info, quality_settings['scale'])
+        return ffmpeg_engine.FrameReader(video_path, quality_settings['fps'], size, duration, start=start)
+
+    def _open_source(self, video_path, quality_settings, metrics, time_range=None, clip=None):
+        """
+        打开要转换的帧来源: 优先使用解码端缩放的 FrameReader,否则用moviepy打开(或复用)剪辑并截取片段
+        :return: (帧来源, 是否已按目标尺寸缩放, 需要关闭的对象或None)
+        """
+        with metrics.stage('load'):
+            reader = self._frame_reader(video_path, quality_settings, time_range)
+        if reader is not None:
+            return reader, True, reader
+        clip, opened = self._open_clip(video_path, metrics, clip)
+        source = clip.subclip(*time_range) if time_range else clip
+        return source, False, clip if opened else None
+
+    def _convert_with_moviepy(self, video_path, output_path, quality_settings, progress_callback, metrics,
+                              time_range=None, clip=None, control=None):
+        """
+        MoviePy引擎: 由moviepy解码(开启 decode_scaling 时由 FrameReader 在解码端抽帧和缩放),
+        在当前进程中经流式管线完成调色板量化(按档位的 palette 模式查表映射)、重复帧合并和写出,不分段;
+        截取片段时使用 subclip,moviepy的读取器在输入端跳转到片段起点
+        :return: 统计信息,见 _convert_with_stream
+        """
+        return self._convert_with_stream(video_path, output_path, quality_settings, progress_callback, metrics,
+                                         time_range=time_range, clip=clip, control=control, segmented=False)
+
+    def _convert_with_ffmpeg(self, video_path, output_path, quality_settings, progress_callback, metrics,
+                             time_range=None, control=None):
+        """
+        使用单条ffmpeg滤镜图命令完成抽帧、缩放、去重(mpdecimate)和调色板量化
+        整个ffmpeg进程计入 encode 阶段
+        :return: 统计信息;输出GIF且开启去重时为 {'frames': 写入帧数, 'frames_dropped': 丢弃的重复帧数}
+        """
+        if progress_callback:
+            progress_callback(f"正在转换(FFmpeg): {video_path.name}")
+
+        ranges = [(time_range[0], time_range[1] - time_range[0])] if time_range else None
+        cmd = ffmpeg_engine.build_gif_command(video_path, output_path, quality_settings, ranges=ranges)
+        # 只在需要上报进度时解析ffmpeg的进度输出
+        on_progress = (lambda frames: metrics.advance(frames - metrics.frames)) if metrics.event_callback else None
+        with metrics.stage('encode'):
+            ffmpeg_engine.run_ffmpeg(cmd, control, on_progress)
+        return _finish_decimated(output_path, quality_settings, metrics.frames_total)
+
+    def _convert_with_stream(self, video_path, output_path, quality_settings, progress_callback, metrics,
+                             time_range=None, clip=None, control=None, segmented=True):
+        """
+        流式转换: 有界队列逐帧解码、量化并增量写入GIF,帧缓冲不超过内存上限;
+        动态WebP/APNG 的缩放后帧经管道交给ffmpeg编码器(不分段)。
+        开启 decode_scaling 时由 FrameReader 在解码端抽帧和缩放,缓冲区按缩放后的帧大小计算
+        :param segmented: 是否允许长视频按时间分段在多个进程中并行编码
+        :return: 统计信息 {'frames': 写入帧数, 'frames_dropped': 丢弃的重复帧数}
+        """
+        if progress_callback:
+            progress_callback(f"正在加载视频: {video_path.name}")
+
+        import frame_pipeline
+        source, scaled, closeable = self._open_source(video_path, quality_settings, metrics, time_range, clip)
+        try:
+            size = None
+            if not scaled and quality_settings['scale'] != 1.0:
+                size = (int(source.w * quality_settings['scale']), int(source.h * quality_settings['scale']))
+
+            if quality_settings['format'] != 'gif':
+                if progress_callback:
+                    progress_callback(f"正在转换(流式, {quality_settings['format']}): {video_path.name}")
+                return frame_pipeline.stream_to_animation(source, output_path, quality_settings['fps'],
+                                                          self.max_memory_bytes, quality_settings, size=size,
+                                                          metrics=metrics, control=control)
+
+            options = dict(
+                fps=quality_settings['fps'],
+                colors=quality_settings['colors'],
+                max_memory_bytes=self.max_memory_bytes,
+                size=size,
+                palette_mode=quality_settings.get('palette', 'frame'),
+                optimize=quality_settings['optimize'],
+                dedup_threshold=quality_settings.get('dedup'),
+                metrics=metrics,
+                control=control
+            )
+
+            # 足够长的视频按时间分段,在多个进程中并行编码
+            segments = min(self.segment_workers, int(source.duration // self.MIN_SEGMENT_SECONDS))
+            if segmented and segments > 1:
+                if progress_callback:
+                    progress_callback(f"正在转换(流式, {segments} 段并行): {video_path.name}")
+                return frame_pipeline.segmented_stream_to_gif(
+                    source, video_path, output_path, workers=segments,
+                    start_time=time_range[0] if time_range else 0.0, decode_scaling=scaled, **options
+                )
+
+            if progress_callback:
+                progress_callback(f"正在转换(流式): {video_path.name}")
+            return frame_pipeline.stream_to_gif(source, output_path, **options)
+        finally:
+            if closeable is not None:
+                closeable.close()
+
+    def convert_batch(self, quality='medium', progress_callback=None, workers=None, engine=None,
+                      event_callback=None, target_bytes=None, resume=False, control=None, order='shortest',
+                      output_format=None, compare_formats=None):
         """
         批量转换所有视频文件
         :param quality: 质量等级
         :param progress_callback: 进度回调函数
-        :return: (成功数量, 失败数量, 结果列表)
+        :param workers: 并行进程数,默认为CPU核数,1表示在当前进程内逐个转换
+        :param engine: 转换引擎,默认使用构造时指定的引擎
+        :param event_callback: 结构化计时事件回调函数,并行时子进程的事件也在当前进程中回调
+        :param target_bytes: 每个GIF的目标大小(字节),见 convert_single
+        :param resume: 继续上次的批量转换: 任务日志中已完成、源文件和设置都未变化的文件直接跳过,
+                       失败或中断的文件重新转换
+        :param control: scheduler.JobControl,可在其他线程中取消、暂停或置顶文件;
+                        取消后正在转换的文件在下一帧之前停止,尚未开始的文件不再转换
+        :param order: 转换顺序,'shortest' 时长从短到长(默认,小文件不会排在大文件之后),
+                      'longest' 从长到短(并行时总耗时最短),'name' 按文件名;置顶的文件总是最先转换
+        :param output_format: 输出格式,见 convert_single
+        :param compare_formats: 每个文件转换完成后再编码为这些格式,对比输出大小和编码耗时(对比用的输出不保留)
+        :return: (成功数量, 失败数量, 结果列表),被取消的文件不计入失败数量
+                 目标大小模式下结果中的 'settings' 为实际使用的 fps/scale/colors 等设置,
+                 续转时跳过的文件 'resumed' 为True,被取消的文件 'cancelled' 为True;
+                 本次转换的文件有 'output_bytes' 和 'encode_seconds',指定 compare_formats 时有 'comparison'
         """
         video_files = self.get_video_files()
         total = len(video_files)
@@ -132,40 +657,1023 @@ class VideoToGifConverter:
         if progress_callback:
             progress_callback(f"找到 {total} 个视频文件,开始转换...")
 
+        engine = engine or self.engine
+        with JobJournal(self.journal_path) as journal:
+            return self._convert_batch(video_files, quality, progress_callback, workers, engine,
+                                       event_callback, target_bytes, resume, journal, control, order,
+                                       output_format, compare_formats)
+
+    def _convert_batch(self, video_files, quality, progress_callback, workers, engine,
+                       event_callback, target_bytes, resume, journal, control, order,
+                       output_format=None, compare_formats=None):
+        """convert_batch 的实现,journal 为本次批量转换使用的任务日志"""
+        total = len(video_files)
+        outcomes = [None] * total
+        cache_keys = [None] * total
+        cache_hits = [False] * total
+        resumed = [False] * total
+        quality_settings = self._get_quality_settings(quality, output_format)
+        output_format = quality_settings['format']
+        journal_settings = JobJournal.settings_key(quality_settings, engine, target_bytes)
+
+        def output_path_of(video_file):
+            return self._output_path(video_file, output_format=output_format)
+
+        # 续转: 上次已完成的文件直接跳过,不再查询缓存和探测
+        if resume:
+            for i, video_file in enumerate(video_files):
+                output_path = output_path_of(video_file)
+                if journal.is_done(video_file, output_path, journal_settings):
+                    outcomes[i] = (True, str(output_path), {'frames_dropped': 0})
+                    resumed[i] = True
+            if progress_callback and any(resumed):
+                progress_callback(f"继续上次的转换: 跳过已完成的 {sum(resumed)} 个文件")
+
+        # 先在主进程中查询缓存,只有未命中的文件才交给转换流程
+        if self.cache:
+            # 解码端缩放与moviepy缩放得到的帧不同,两种方式的结果分别缓存
+            cache_settings = dict(quality_settings, decode_scaling=self.decode_scaling)
+            if target_bytes:
+                cache_settings['target_bytes'] = target_bytes
+            for i, video_file in enumerate(video_files):
+                if outcomes[i] is not None:
+                    continue
+                try:
+                    cache_keys[i] = self.cache.make_key(video_file, cache_settings, engine)
+                    if self.cache.restore(cache_keys[i], output_path_of(video_file)):
+                        outcomes[i] = (True, str(output_path_of(video_file)), {'frames_dropped': 0})
+                        cache_hits[i] = True
+                        if progress_callback:
+                            progress_callback(f"缓存命中,跳过: {video_file.name}")
+                except OSError as e:
+                    if progress_callback:
+                        progress_callback(f"缓存不可用 {video_file.name}: {str(e)}")
+
+        # 先探测元数据,无法读取的文件直接判为失败,不再启动解码
+        infos, errors = self.probe_all([video_files[i] for i in range(total) if outcomes[i] is None])
+        for i, video_file in enumerate(video_files):
+            if video_file in errors:
+                error_msg = f"转换失败 {video_file.name}: 无法读取视频信息 ({errors[video_file]})"
+                if progress_callback:
+                    progress_callback(error_msg)
+                outcomes[i] = (False, error_msg, {'frames_dropped': 0})
+
+        # 除续转跳过的文件外都记入日志;转换前标记为 running,进程崩溃后续转时会重试这些文件
+        journal.start([(video_files[i], output_path_of(video_files[i])) for i in range(total) if not resumed[i]],
+                      journal_settings)
+        for i in range(total):
+            if outcomes[i] is not None and not resumed[i]:
+                journal.finish(output_path_of(video_files[i]), outcomes[i][0], outcomes[i][1])
+
+        pending = [i for i in range(total) if outcomes[i] is None]
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(int(workers), len(pending) or 1))
+
+        pending_files = [video_files[i] for i in pending]
+        queue = JobQueue(pending_files, [infos[video_file]['duration'] for video_file in pending_files], order, control)
+
+        def on_outcome(position, outcome):
+            """每个文件转换结束时立即记录,不等待整批完成"""
+            i = pending[position]
+            journal.finish(output_path_of(video_files[i]), outcome[0], outcome[1])
+            if self.cache and outcome[0] and cache_keys[i]:
+                try:
+                    self.cache.store(cache_keys[i], outcome[1], video_files[i].name)
+                except OSError as e:
+                    if progress_callback:
+                        progress_callback(f"写入缓存失败 {video_files[i].name}: {str(e)}")
+
+        # 批量进度: 界面据此计算总进度,跳过的文件(续转、缓存命中、无法读取)不计入
+        if event_callback:
+            event_callback({'event': 'batch', 'files': len(pending), 'skipped': total - len(pending),
+                            'timestamp': time.time()})
+
+        options = {'engine': engine, 'event_callback': event_callback, 'target_bytes': target_bytes,
+                   'output_format': output_format, 'compare_formats': compare_formats}
+        try:
+            if not pending_files:
+                pending_outcomes = []
+            elif workers == 1:
+                pending_outcomes = self._convert_serial(pending_files, quality, progress_callback, options,
+                                                        on_outcome=on_outcome, queue=queue, control=control)
+            else:
+                if progress_callback:
+                    progress_callback(f"使用 {workers} 个进程并行转换")
+                pending_outcomes = self._convert_parallel(pending_files, quality, progress_callback, workers, options,
+                                                          on_outcome=on_outcome, queue=queue, control=control)
+        finally:
+            # 缓存命中更新的最近使用时间也写回索引(新增的条目已在 store 时保存)
+            if self.cache:
+                try:
+                    self.cache.save()
+                except OSError as e:
+                    if progress_callback:
+                        progress_callback(f"保存缓存索引失败: {str(e)}")
+
+        for i, outcome in zip(pending, pending_outcomes):
+            outcomes[i] = outcome
+
         success_count = 0
         fail_count = 0
+        cancel_count = 0
         results = []
 
-        for idx, video_file in enumerate(video_files, 1):
-            if progress_callback:
-                progress_callback(f"\n处理 [{idx}/{total}]: {video_file.name}")
-
-            success, result = self.convert_single(video_file, quality, progress_callback)
-
+        for video_file, (success, result, info), cache_hit, skipped in zip(video_files, outcomes, cache_hits, resumed):
             if success:
                 success_count += 1
+            elif info.get('cancelled'):
+                cancel_count += 1
             else:
                 fail_count += 1
 
-            results.append({
+            entry = {
                 'file': video_file.name,
                 'success': success,
-                'result': result
-            })
+                'result': result,
+                'cache_hit': cache_hit,
+                'resumed': skipped,
+                'cancelled': info.get('cancelled', False),
+                'frames_dropped': info['frames_dropped']
+            }
+            if 'target' in info:
+                entry['settings'] = info['target']['settings']
+            if success and 'metrics' in info:
+                entry['output_bytes'] = info['metrics']['output_bytes']
+                entry['encode_seconds'] = info['metrics']['wall_seconds']
+            if 'comparison' in info:
+                entry['comparison'] = info['comparison']
+            results.append(entry)
+
+        if progress_callback:
+            if cancel_count:
+                progress_callback(f"\n转换已取消! 成功: {success_count}, 失败: {fail_count}, 取消: {cancel_count}")
+            else:
+                progress_callback(f"\n转换完成! 成功: {success_count}, 失败: {fail_count}")
+
+        return success_count, fail_count, results
 
+    def convert_manifest(self, manifest, quality='medium', progress_callback=None, workers=None, engine=None,
+                         event_callback=None, target_bytes=None, control=None, output_format=None):
+        """
+        按清单截取多个片段,每个源文件只打开一次,各片段分别输出GIF
+        清单格式(JSON文件路径或同结构的字典):
+            {"clips": [
+                {"source": "a.mp4", "ranges": [
+                    {"start": 1.5, "end": 4},
+                    {"start": 10, "duration": 2, "name": "a_intro"}
+                ]}
+            ]}
+        source 为相对路径时相对于输入文件夹;name 省略时输出为 a_1.5-4.gif 形式
+        :param manifest: 清单文件路径或字典
+        :param workers: 并行进程数(按源文件并行),默认为CPU核数
+        其余参数同 convert_batch
+        :return: (成功数量, 失败数量, 结果列表),每个片段一条结果,含 'range'
+        """
+        entries = load_manifest(manifest, self.input_dir)
+        engine = engine or self.engine
+        output_format = self._get_quality_settings(quality, output_format)['format']
+
+        # 先在主进程中换算时间范围,无效的片段直接判为失败;结果按清单顺序排列
+        results = []
+        tasks = []
+        slots = []
+        for video_path, ranges in entries:
+            resolved = []
+            indices = []
+            for item in ranges:
+                try:
+                    time_range = self._resolve_range(video_path, item.get('start'), item.get('end'),
+                                                     item.get('duration'))
+                    if time_range is None:
+                        raise ValueError("片段缺少 start/end/duration")
+                except (OSError, RuntimeError, ValueError) as e:
+                    error_msg = f"转换失败 {video_path.name}: {str(e)}"
+                    if progress_callback:
+                        progress_callback(error_msg)
+                    results.append({'file': video_path.name, 'range': None, 'success': False,
+                                    'result': error_msg, 'cancelled': False, 'frames_dropped': 0})
+                    continue
+                output_path = self._output_path(video_path, time_range, item.get('name'), output_format)
+                resolved.append({'start': time_range[0], 'end': time_range[1], 'output': str(output_path)})
+                indices.append(len(results))
+                results.append(None)
+            if resolved:
+                tasks.append((video_path, resolved))
+                slots.append(indices)
+
+        if progress_callback:
+            progress_callback(f"清单包含 {len(tasks)} 个源文件, "
+                              f"{sum(len(ranges) for _, ranges in tasks)} 个片段")
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(int(workers), len(tasks) or 1))
+
+        video_files = [video_path for video_path, _ in tasks]
+        task_options = [{'ranges': ranges} for _, ranges in tasks]
+        options = {'engine': engine, 'event_callback': event_callback, 'target_bytes': target_bytes,
+                   'output_format': output_format}
+        if not tasks:
+            grouped = []
+        elif workers == 1:
+            grouped = self._convert_serial(video_files, quality, progress_callback, options,
+                                           '_convert_ranges', task_options, control=control)
+        else:
+            if progress_callback:
+                progress_callback(f"使用 {workers} 个进程并行转换")
+            grouped = self._convert_parallel(video_files, quality, progress_callback, workers, options,
+                                             '_convert_ranges', task_options, control=control)
+
+        for (video_path, ranges), indices, outcomes in zip(tasks, slots, grouped):
+            for item, index, (success, result, info) in zip(ranges, indices, outcomes):
+                results[index] = {
+                    'file': video_path.name,
+                    'range': (item['start'], item['end']),
+                    'success': success,
+                    'result': result,
+                    'cancelled': info.get('cancelled', False),
+                    'frames_dropped': info['frames_dropped']
+                }
+
+        success_count = sum(1 for entry in results if entry['success'])
+        fail_count = sum(1 for entry in results if not entry['success'] and not entry.get('cancelled'))
         if progress_callback:
             progress_callback(f"\n转换完成! 成功: {success_count}, 失败: {fail_count}")
+        return success_count, fail_count, results
+
+    def _convert_ranges(self, video_path, quality='medium', progress_callback=None, engine=None,
+                        event_callback=None, target_bytes=None, ranges=(), control=None, job=None, output_format=None):
+        """
+        从同一个源文件截取多个片段
+        ffmpeg引擎用一条命令输出全部片段;其他引擎开启 decode_scaling 时只解码一遍,各片段从同一个读取器取帧,
+        否则只打开一次视频,各片段复用同一个剪辑
+        :param ranges: [{'start': 起点, 'end': 终点, 'output': 输出路径}, ...]
+        :return: 每个片段的 (成功标志, 输出文件路径或错误信息, 统计信息) 列表
+        """
+        video_path = Path(video_path)
+        engine = (engine or self.engine).lower()
+
+        if engine == 'ffmpeg' and not target_bytes:
+            outcomes = self._convert_ranges_with_ffmpeg(video_path, quality, progress_callback, event_callback,
+                                                        ranges, control, output_format)
+            if outcomes:
+                return outcomes
 
+        # 目标大小模式每个片段要多次编码,仍逐个片段转换
+        if engine in ('moviepy', 'stream') and self.decode_scaling and not target_bytes and len(ranges) > 1:
+            outcomes = self._convert_ranges_shared(video_path, quality, progress_callback, event_callback,
+                                                   ranges, control, job, output_format)
+            if outcomes:
+                return outcomes
+
+        clip = None
+        # 解码端缩放时每个片段各自定位读取,不需要共享的moviepy剪辑
+        if engine != 'ffmpeg' and not self.decode_scaling:
+            try:
+                clip, _ = self._open_clip(video_path, ConversionMetrics(video_path.name))
+            except Exception as e:
+                error_msg = f"转换失败 {video_path.name}: {str(e)}"
+                if progress_callback:
+                    progress_callback(error_msg)
+                return [(False, error_msg, {'frames_dropped': 0})] * len(ranges)
+        try:
+            return [
+                self._convert_single(video_path, quality, progress_callback, engine, event_callback, target_bytes,
+                                     item['start'], item['end'], output_path=item['output'], clip=clip,
+                                     control=control, job=job, output_format=output_format)
+                for item in ranges
+            ]
+        finally:
+            if clip is not None:
+                clip.close()
+
+    def _convert_ranges_shared(self, video_path, quality, progress_callback, event_callback, ranges,
+                               control=None, job=None, output_format=None):
+        """
+        解码端缩放的一个读取器覆盖全部片段,只解码一遍,各片段按自己的时间范围取帧并编码,见 frame_pipeline.fan_out
+        各片段使用同一质量配置,缩放尺寸相同,读取器只输出一种尺寸
+        :return: 每个片段的结果列表;探测不到时长/尺寸或读取器失败时返回None,由调用方逐个片段转换
+        """
+        import frame_pipeline
+        metrics = ConversionMetrics(video_path.name, event_callback)
+        metrics.job = job
+        quality_settings = self._get_quality_settings(quality, output_format)
+        try:
+            info = self.probe(video_path)
+        except (OSError, RuntimeError):
+            return None
+        if not info['duration'] or not info['width'] or not info['height']:
+            return None
+
+        fps = quality_settings['fps']
+        size = _scaled_size(info, quality_settings['scale'])
+        decode_start = min(item['start'] for item in ranges)
+        decode_end = min(info['duration'], max(item['end'] for item in ranges))
+        targets = [
+            frame_pipeline.FanOutTarget(_partial_path(item['output']), quality_settings, size,
+                                        item['start'] - decode_start,
+                                        max(1, int(math.ceil((item['end'] - item['start']) * fps - 1e-6))))
+            for item in ranges
+        ]
+        if progress_callback:
+            progress_callback(f"正在转换(一次解码, {len(ranges)} 个片段): {video_path.name}")
+
+        try:
+            with metrics.stage('load'):
+                reader = ffmpeg_engine.StackedFrameReader(video_path, fps, [size], decode_end - decode_start,
+                                                          start=decode_start)
+            metrics.frames_total = reader.frame_count
+            metrics.report_progress()
+            try:
+                fanned = frame_pipeline.fan_out(reader, targets, self.max_memory_bytes, metrics, control)
+            finally:
+                reader.close()
+
+            outcomes = []
+            outputs_done = []
+            for item, target, (success, result) in zip(ranges, targets, fanned):
+                output_name = Path(item['output']).name
+                if success:
+                    os.replace(target.output_path, item['output'])
+                    outputs_done.append(item['output'])
+                    if progress_callback:
+                        if result['frames_dropped']:
+                            progress_callback(f"已合并 {result['frames_dropped']} 个重复帧")
+                        progress_callback(f"完成: {output_name}")
+                    info = {'frames_dropped': result['frames_dropped'], 'range': (item['start'], item['end'])}
+                    outcomes.append((True, item['output'], info))
+                elif isinstance(result, ConversionCancelled):
+                    if progress_callback:
+                        progress_callback(f"已取消: {output_name}")
+                    outcomes.append((False, f"已取消: {output_name}", {'frames_dropped': 0, 'cancelled': True}))
+                else:
+                    error_msg = f"转换失败 {output_name}: {str(result)}"
+                    if progress_callback:
+                        progress_callback(error_msg)
+                    outcomes.append((False, error_msg, {'frames_dropped': 0}))
+        except Exception as e:
+            if progress_callback:
+                progress_callback(f"一次解码失败,改为逐个片段转换: {str(e)}")
+            return None
+        finally:
+            for target in targets:
+                if target.output_path.exists():
+                    target.output_path.unlink()
+
+        summary = metrics.finish(len(outputs_done) == len(ranges), outputs_done)
+        for _, _, info in outcomes:
+            info['metrics'] = summary
+        return outcomes
+
+    def _convert_ranges_with_ffmpeg(self, video_path, quality, progress_callback, event_callback, ranges,
+                                    control=None, output_format=None):
+        """
+        一条ffmpeg命令输出全部片段,各片段在输入端定位
+        :return: 每个片段的结果列表;ffmpeg失败时返回None,由调用方逐个片段重试
+        """
+        metrics = ConversionMetrics(video_path.name, event_callback)
+        quality_settings = self._get_quality_settings(quality, output_format)
+        partial_paths = [_partial_path(item['output']) for item in ranges]
+        outputs = [(partial_path, item['start'], item['end'] - item['start'])
+                   for partial_path, item in zip(partial_paths, ranges)]
+        if progress_callback:
+            progress_callback(f"正在转换(FFmpeg, {len(ranges)} 个片段): {video_path.name}")
+
+        try:
+            cmd = ffmpeg_engine.build_multi_gif_command(video_path, outputs, quality_settings)
+            with metrics.stage('encode'):
+                ffmpeg_engine.run_ffmpeg(cmd, control)
+            stats = []
+            for partial_path, item in zip(partial_paths, ranges):
+                frames_total = self._expected_frames(video_path, (item['start'], item['end']), quality_settings['fps'])
+                stats.append(_finish_decimated(partial_path, quality_settings, frames_total))
+            for partial_path, item in zip(partial_paths, ranges):
+                os.replace(partial_path, item['output'])
+        except ConversionCancelled:
+            if progress_callback:
+                progress_callback(f"已取消: {video_path.name}")
+            metrics.finish(False)
+            return [(False, f"已取消: {Path(item['output']).name}", {'frames_dropped': 0, 'cancelled': True})
+                    for item in ranges]
+        except Exception as e:
+            if progress_callback:
+                progress_callback(f"FFmpeg引擎失败,改为逐个片段转换: {str(e)}")
+            return None
+        finally:
+            for partial_path in partial_paths:
+                if partial_path.exists():
+                    partial_path.unlink()
+
+        summary = metrics.finish(True, [item['output'] for item in ranges])
+        outcomes = []
+        for item, stat in zip(ranges, stats):
+            if progress_callback:
+                progress_callback(f"完成: {Path(item['output']).name}")
+            info = {'frames_dropped': 0, 'range': (item['start'], item['end']), 'metrics': summary}
+            info.update(stat)
+            outcomes.append((True, item['output'], info))
+        return outcomes
+
+    def convert_multi(self, video_path, outputs, progress_callback=None, event_callback=None, control=None):
+        """
+        源视频只解码一遍,同时输出多个文件(不同质量档位、格式、片段及封面图),见 frame_pipeline.fan_out
+        解码帧率为各路共同的帧率(各路不同时为源视频帧率),解码端同时缩放出各路的尺寸,各路再按自己的帧率取帧
+        :param video_path: 视频文件路径
+        :param outputs: 输出规格列表,每项为字典:
+            quality  质量档位 ('high', 'medium', 'low'),默认 'medium'
+            format   输出格式 ('gif', 'webp', 'webp_lossless', 'apng'),默认同 convert_single;
+                     'poster' 输出一帧静态封面图(JPEG,输出路径以 .png 结尾时为PNG)
+            start / end / duration  截取片段,同 convert_single,省略时为整段
+            time     封面图的时刻(秒),默认为片段中点
+            output   输出路径;省略时为输出文件夹下的 name + 扩展名,
+                     name 也省略时为 源文件名_档位[_片段],封面图为 源文件名_poster[_时刻]
+        :param progress_callback: 进度回调函数
+        :param event_callback: 结构化计时事件回调函数,进度按解码帧数报告,各路的阶段耗时合计在一个 'file' 事件中
+        :param control: scheduler.JobControl,每帧之前检查暂停/取消,取消后不留下输出文件
+        :return: 与 outputs 顺序一致的 [(成功标志, 输出文件路径或错误信息), ...]
+        """
+        video_path = Path(video_path)
+        metrics = ConversionMetrics(video_path.name, event_callback)
+        results = [None] * len(outputs)
+
+        def fail(position, error_msg):
+            results[position] = (False, error_msg)
+            if progress_callback:
+                progress_callback(error_msg)
+
+        planned = []
+        try:
+            info = self.probe(video_path)
+            if not info['duration'] or not info['width'] or not info['height']:
+                raise RuntimeError("无法读取视频时长或尺寸")
+        except (OSError, RuntimeError) as e:
+            for position in range(len(outputs)):
+                fail(position, f"转换失败 {video_path.name}: {str(e)}")
+            metrics.finish(False)
+            return results
+
+        for position, spec in enumerate(outputs):
+            try:
+                plan = self._plan_output(video_path, spec, info)
+                if any(plan[-1] == other[-1] for _, other in planned):
+                    raise ValueError(f"输出路径重复: {plan[-1]}")
+                planned.append((position, plan))
+            except (OSError, RuntimeError, ValueError) as e:
+                fail(position, f"转换失败 {video_path.name}: {str(e)}")
+        if not planned:
+            metrics.finish(False)
+            return results
+
+        import frame_pipeline
+        animated_fps = {settings['fps'] for _, (settings, _, _, _) in planned
+                        if settings['format'] != frame_pipeline.POSTER_FORMAT}
+        if len(animated_fps) == 1:
+            decode_fps = animated_fps.pop()
+        else:
+            decode_fps = info['fps'] or max(settings['fps'] for _, (settings, _, _, _) in planned)
+        # 封面图只需要其时刻所在的一帧
+        decode_start = min(start for _, (_, start, _, _) in planned)
+        decode_end = min(info['duration'], max(max(end, start + 1.0 / decode_fps)
+                                               for _, (_, start, end, _) in planned))
+
+        targets = []
+        for _, (settings, start, end, output_path) in planned:
+            if settings['format'] == frame_pipeline.POSTER_FORMAT:
+                frame_count = 1
+            else:
+                frame_count = max(1, int(math.ceil((end - start) * settings['fps'] - 1e-6)))
+            targets.append(frame_pipeline.FanOutTarget(_partial_path(output_path), settings,
+                                                       _scaled_size(info, settings['scale']),
+                                                       start - decode_start, frame_count))
+        if progress_callback:
+            progress_callback(f"正在转换(一次解码, {len(targets)} 路输出): {video_path.name}")
+
+        try:
+            reader = ffmpeg_engine.StackedFrameReader(video_path, decode_fps, [target.size for target in targets],
+                                                      decode_end - decode_start, start=decode_start)
+            metrics.frames_total = reader.frame_count
+            metrics.report_progress()
+            try:
+                outcomes = frame_pipeline.fan_out(reader, targets, self.max_memory_bytes, metrics, control)
+            finally:
+                reader.close()
+
+            outputs_done = []
+            for (position, (_, _, _, output_path)), target, (success, result) in zip(planned, targets, outcomes):
+                if success:
+                    os.replace(target.output_path, output_path)
+                    outputs_done.append(str(output_path))
+                    results[position] = (True, str(output_path))
+                    if progress_callback:
+                        progress_callback(f"完成: {output_path.name}")
+                elif isinstance(result, ConversionCancelled):
+                    fail(position, f"已取消: {output_path.name}")
+                else:
+                    fail(position, f"转换失败 {output_path.name}: {str(result)}")
+            metrics.finish(len(outputs_done) == len(outputs), outputs_done)
+        except Exception as e:
+            for position, _ in planned:
+                if results[position] is None:
+                    fail(position, f"转换失败 {video_path.name}: {str(e)}")
+            metrics.finish(False)
+        finally:
+            for target in targets:
+                if target.output_path.exists():
+                    target.output_path.unlink()
+        return results
+
+    def _plan_output(self, video_path, spec, info):
+        """
+        换算 convert_multi 的一项输出规格
+        :param info: 源视频元数据
+        :return: (质量配置, 起点, 终点, 输出路径),封面图的起点和终点都为其时刻
+        :raises ValueError: 规格无效
+        """
+        quality = spec.get('quality', 'medium')
+        time_range = self._resolve_range(video_path, spec.get('start'), spec.get('end'), spec.get('duration'))
+        start, end = time_range or (0.0, info['duration'])
+
+        import frame_pipeline
+        if spec.get('format') == frame_pipeline.POSTER_FORMAT:
+            settings = dict(self._get_quality_settings(quality), format=frame_pipeline.POSTER_FORMAT)
+            poster_time = spec.get('time')
+            if poster_time is not None:
+                poster_time = float(poster_time)
+                if not 0 <= poster_time < info['duration']:
+                    raise ValueError(f"封面时刻 {poster_time:g} 秒超出视频时长 {info['duration']:g} 秒")
+            name = spec.get('name') or Path(video_path).stem + '_poster' + (
+                f'_{poster_time:g}' if poster_time is not None else '')
+            output_path = Path(spec['output']) if spec.get('output') else self.output_dir / (name + '.jpg')
+            if poster_time is None:
+                poster_time = (start + end) / 2
+            return settings, poster_time, poster_time, output_path
+
+        settings = self._get_quality_settings(quality, spec.get('format'))
+        if spec.get('output'):
+            output_path = Path(spec['output'])
+        else:
+            name = spec.get('name') or Path(video_path).stem + f'_{quality.lower()}' + (
+                f'_{start:g}-{end:g}' if time_range else '')
+            output_path = self.output_dir / (name + ffmpeg_engine.output_extension(settings['format']))
+        return settings, start, end, output_path
+
+    def publish_batch(self, quality='medium', engine=None, target_bytes=None, order='shortest', output_format=None,
+                      progress_callback=None):
+        """
+        协调端: 把输入文件夹中的视频作为一个批次发布到共享任务队列,由各机器上的 run_worker 租用转换
+        队列中记录相对输入/输出文件夹的路径,各机器的输入/输出文件夹应指向同一共享存储
+        :param order: 发布顺序(即各工作端租用的顺序),见 convert_batch
+        其余参数同 convert_batch
+        :return: 批次标识,交给 collect_batch 汇总结果
+        """
+        video_files = self.get_video_files()
+        quality_settings = self._get_quality_settings(quality, output_format)
+        durations = None
+        if order != 'name':
+            # 无法读取的文件也发布,由工作端判为失败,结果中不会缺少文件
+            infos, _ = self.probe_all(video_files)
+            durations = [infos[video_file]['duration'] if video_file in infos else 0.0 for video_file in video_files]
+        job_queue = JobQueue(video_files, durations, order)
+
+        options = {'quality': quality, 'engine': engine or self.engine, 'target_bytes': target_bytes,
+                   'output_format': quality_settings['format']}
+        jobs = []
+        while job_queue:
+            video_file = video_files[job_queue.pop()]
+            output_path = self._output_path(video_file, output_format=quality_settings['format'])
+            jobs.append({'source': video_file.relative_to(self.input_dir).as_posix(),
+                         'output': output_path.relative_to(self.output_dir).as_posix(),
+                         'options': options})
+
+        batch = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with SharedJobQueue(self.queue_path) as queue:
+            queue.publish(batch, jobs)
+        if progress_callback:
+            progress_callback(f"已发布批次 {batch}: {len(jobs)} 个视频文件")
+        return batch
+
+    def run_worker(self, worker_id=None, lease_seconds=60, poll_seconds=2.0, exit_when_idle=True,
+                   progress_callback=None, event_callback=None, control=None):
+        """
+        工作端: 从共享任务队列逐个租用任务并在本机转换,源文件和输出文件按本机的输入/输出文件夹解析
+        转换期间每 lease_seconds/3 续约一次(心跳);续约失败(租约已过期被放回队列,或批次被取消)时
+        停止当前文件且不写回结果。各机器可同时运行多个工作端进程
+        :param worker_id: 工作端标识,默认为 主机名-进程号
+        :param lease_seconds: 租约时长(秒),工作端失联超过该时长后任务被放回队列,由其他工作端重新转换
+        :param poll_seconds: 没有排队任务时的轮询间隔(秒)
+        :param exit_when_idle: 队列中既没有排队也没有转换中的任务时退出;为False时一直等待新批次,直到 control 取消
+        :param control: scheduler.JobControl,暂停/继续传给正在转换的文件;取消后当前任务交还队列,工作端退出
+        :return: (成功数量, 失败数量),只统计本工作端写回的结果
+        """
+        worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        success_count = 0
+        fail_count = 0
+        with SharedJobQueue(self.queue_path) as queue:
+            while not (control and control.cancelled):
+                job = queue.lease(worker_id, lease_seconds)
+                if job is None:
+                    counts = queue.counts()
+                    if exit_when_idle and not counts['queued'] and not counts['leased']:
+                        break
+                    time.sleep(poll_seconds)
+                    continue
+
+                if progress_callback:
+                    progress_callback(f"\n[{worker_id}] 处理: {job['source']} (第 {job['attempts']} 次)")
+                success, result, info, status = self._convert_leased(job, worker_id, lease_seconds, progress_callback,
+                                                                     event_callback, control)
+                if status == 'lost':
+                    if progress_callback:
+                        progress_callback(f"租约已失效,放弃结果: {job['source']}")
+                elif status == 'stopped':
+                    queue.release(job['id'], worker_id)
+                elif queue.finish(job['id'], worker_id, success, result, info):
+                    if success:
+                        success_count += 1
+                    else:
+                        fail_count += 1
+
+        if progress_callback:
+            progress_callback(f"\n[{worker_id}] 工作端退出! 成功: {success_count}, 失败: {fail_count}")
+        return success_count, fail_count
+
+    def _convert_leased(self, job, worker_id, lease_seconds, progress_callback, event_callback, control):
+        """
+        转换一个租用的任务,后台线程负责续约并把 control 的暂停/取消转给本任务
+        :return: (成功标志, 输出路径(相对输出文件夹)或错误信息, 可序列化的统计信息, 状态)
+                 状态为 'done' 正常结束,'lost' 租约已失效,'stopped' 工作端被取消
+        """
+        job_control = scheduler.JobControl()
+        finished = threading.Event()
+        lost = threading.Event()
+
+        def keep_alive():
+            # sqlite3 连接不能跨线程使用,续约使用单独的连接
+            with SharedJobQueue(self.queue_path) as queue:
+                interval = lease_seconds / 3.0
+                next_beat = time.monotonic() + interval
+                while not finished.wait(scheduler.PAUSE_POLL_SECONDS):
+                    if control and control.cancelled:
+                        job_control.cancel()
+                    elif control and control.paused and not job_control.paused:
+                        job_control.pause()
+                    elif control and not control.paused and job_control.paused:
+                        job_control.resume()
+                    if time.monotonic() >= next_beat:
+                        if not queue.heartbeat(job['id'], worker_id, lease_seconds):
+                            lost.set()
+                            job_control.cancel()
+                            return
+                        next_beat += interval
+
+        def still_leased():
+            # 改名前再续约一次: 租约已被其他工作端接手时放弃结果;续约成功后租约至少还有 lease_seconds,足够完成改名
+            with SharedJobQueue(self.queue_path) as queue:
+                if queue.heartbeat(job['id'], worker_id, lease_seconds):
+                    return True
+            lost.set()
+            return False
+
+        heartbeat = threading.Thread(target=keep_alive, name='lease-heartbeat', daemon=True)
+        heartbeat.start()
+        options = job['options']
+        try:
+            # 临时文件名带工作端标识和本次租约的随机标识: 租约过期后重租同一任务的工作端写入另一个临时文件,
+            # 失去租约的一方只删除自己的临时文件
+            success, result, info = self._convert_single(
+                self.input_dir / job['source'], options['quality'], progress_callback, options['engine'],
+                event_callback, options['target_bytes'], output_path=self.output_dir / job['output'],
+                control=job_control, output_format=options['output_format'],
+                partial_tag=f'{worker_id}-{uuid.uuid4().hex[:8]}', publish_check=still_leased
+            )
+        finally:
+            finished.set()
+            heartbeat.join()
+
+        if lost.is_set():
+            return success, result, None, 'lost'
+        if info.get('cancelled'):
+            return success, result, None, 'stopped'
+        summary = {'frames_dropped': info['frames_dropped']}
+        if 'target' in info:
+            summary['settings'] = info['target']['settings']
+        if success and 'metrics' in info:
+            summary['output_bytes'] = info['metrics']['output_bytes']
+            summary['encode_seconds'] = info['metrics']['wall_seconds']
+        return success, job['output'] if success else result, summary, 'done'
+
+    def collect_batch(self, batch, progress_callback=None, poll_seconds=2.0, timeout=None, control=None):
+        """
+        协调端: 等待批次中的任务全部结束(期间把租约过期的任务放回队列),汇总为与 convert_batch 相同的结果
+        :param batch: publish_batch 返回的批次标识
+        :param poll_seconds: 查询队列的间隔(秒)
+        :param timeout: 最长等待时间(秒),超时后尚未结束的任务记为失败,为None时一直等待
+        :param control: scheduler.JobControl,取消时取消整个批次: 排队的任务不再租出,转换中的在下次续约时停止
+        :return: (成功数量, 失败数量, 结果列表),格式和顺序同 convert_batch,每条结果另有
+                 'worker'(写回结果的工作端)和 'attempts'(租用次数);输出路径按本机的输出文件夹给出
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        last_counts = None
+        with SharedJobQueue(self.queue_path) as queue:
+            while True:
+                if control and control.cancelled:
+                    queue.cancel(batch)
+                queue.requeue_expired()
+                counts = queue.counts(batch)
+                if progress_callback and counts != last_counts:
+                    progress_callback(f"批次 {batch}: 完成 {counts['done']}, 失败 {counts['failed']}, "
+                                      f"转换中 {counts['leased']}, 排队 {counts['queued']}")
+                    last_counts = counts
+                if not counts['queued'] and not counts['leased']:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                time.sleep(poll_seconds)
+            # 队列按租用优先级发布,结果改回与 convert_batch 相同的文件顺序
+            jobs = sorted(queue.jobs(batch), key=lambda job: Path(job['source']))
+
+        success_count = 0
+        fail_count = 0
+        cancel_count = 0
+        results = []
+        for job in jobs:
+            cancelled = job['state'] == 'cancelled'
+            if job['state'] in ('queued', 'leased'):
+                result = f"转换失败 {Path(job['source']).name}: 等待超时,任务尚未结束 ({job['state']})"
+            elif cancelled:
+                result = f"已取消: {Path(job['source']).name}"
+            elif job['success']:
+                result = str(self.output_dir / job['output'])
+            else:
+                result = job['result']
+            if job['success']:
+                success_count += 1
+            elif cancelled:
+                cancel_count += 1
+            else:
+                fail_count += 1
+
+            info = job['info']
+            entry = {
+                'file': Path(job['source']).name,
+                'success': job['success'],
+                'result': result,
+                'cache_hit': False,
+                'resumed': False,
+                'cancelled': cancelled,
+                'frames_dropped': info.get('frames_dropped', 0),
+                'worker': job['worker'],
+                'attempts': job['attempts']
+            }
+            for key in ('settings', 'output_bytes', 'encode_seconds'):
+                if key in info:
+                    entry[key] = info[key]
+            results.append(entry)
+
+        if progress_callback:
+            if cancel_count:
+                progress_callback(f"\n转换已取消! 成功: {success_count}, 失败: {fail_count}, 取消: {cancel_count}")
+            else:
+                progress_callback(f"\n转换完成! 成功: {success_count}, 失败: {fail_count}")
         return success_count, fail_count, results
 
-    def _get_quality_settings(self, quality):
-        """获取质量配置"""
+    def convert_distributed(self, quality='medium', progress_callback=None, engine=None, target_bytes=None,
+                            order='shortest', output_format=None, poll_seconds=2.0, timeout=None, control=None):
+        """
+        多机批量转换(协调端): 发布批次后等待各机器上的工作端(run_worker)转换完成并汇总结果
+        不使用本机的转换缓存和任务日志;重试由队列的租约和最大尝试次数负责
+        参数同 publish_batch 和 collect_batch
+        :return: (成功数量, 失败数量, 结果列表),同 collect_batch
+        """
+        batch = self.publish_batch(quality, engine, target_bytes, order, output_format, progress_callback)
+        return self.collect_batch(batch, progress_callback, poll_seconds, timeout, control)
+
+    def _convert_serial(self, video_files, quality, progress_callback, options,
+                        method='_convert_single', task_options=None, on_outcome=None, queue=None, control=None):
+        """
+        在当前进程内逐个转换
+        :param options: 传给 _convert_single 的其余关键字参数
+        :param method: 转换方法名,'_convert_single' 或 '_convert_ranges'
+        :param task_options: 每个文件额外的关键字参数列表
+        :param on_outcome: 每个文件转换结束时立即调用 on_outcome(序号, 返回值),用于记录任务日志
+        :param queue: scheduler.JobQueue,决定转换顺序,默认按输入顺序
+        :param control: scheduler.JobControl,取消后尚未开始的文件直接记为已取消
+        :return: 与输入顺序一致的 method 返回值列表
+        """
+        total = len(video_files)
+        task_options = task_options or [{}] * total
+        queue = queue or JobQueue(video_files)
+        outcomes = [None] * total
+        idx = 0
+        while queue and not (control and control.cancelled):
+            position = queue.pop()
+            idx += 1
+            video_file = video_files[position]
+            if progress_callback:
+                progress_callback(f"\n处理 [{idx}/{total}]: {video_file.name}")
+            outcomes[position] = getattr(self, method)(video_file, quality, progress_callback, **options,
+                                                       **task_options[position], control=control, job=(idx, total))
+            if on_outcome:
+                on_outcome(position, outcomes[position])
+        return _fill_cancelled(outcomes, video_files, method, task_options)
+
+    def _convert_parallel(self, video_files, quality, progress_callback, workers, options,
+                          method='_convert_single', task_options=None, on_outcome=None, queue=None, control=None):
+        """
+        使用进程池并行转换
+        子进程的进度信息和计时事件经由共享队列转发到当前进程的回调函数,
+        结果按输入顺序返回;method、task_options、on_outcome、queue 和 control 同 _convert_serial,
+        on_outcome 按完成顺序在当前进程中调用。
+        同时只提交 workers 个任务,空出进程时再从 queue 取下一个,转换中置顶的文件也能优先开始;
+        control 经由进程池 initializer 传给子进程
+        """
+        total = len(video_files)
+        task_options = task_options or [{}] * total
+        queue = queue or JobQueue(video_files)
+        event_callback = options.get('event_callback')
+        manager = None
+        relay = None
+        worker_callback = None
+        worker_options = dict(options)
+
+        if progress_callback or event_callback:
+            manager = multiprocessing.Manager()
+            message_queue = manager.Queue()
+            relay = threading.Thread(
+                target=_relay_progress, args=(message_queue, progress_callback, event_callback), daemon=True
+            )
+            relay.start()
+            if progress_callback:
+                worker_callback = _QueueProgress(message_queue)
+            if event_callback:
+                worker_options['event_callback'] = _QueueProgress(message_queue)
+
+        outcomes = [None] * total
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=scheduler.init_worker,
+                                     initargs=(control,)) as executor:
+                running = {}
+
+                def submit_next():
+                    position = queue.pop()
+                    running[executor.submit(_convert_worker, self, method, video_files[position], quality,
+                                            total - len(queue), total, worker_callback,
+                                            dict(worker_options, **task_options[position]))] = position
+
+                while queue and len(running) < workers:
+                    submit_next()
+                while running:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        position = running.pop(future)
+                        try:
+                            outcome = future.result()
+                        except Exception as e:
+                            # 子进程异常退出时 convert_single 自身的异常处理无法生效
+                            error_msg = f"转换失败 {video_files[position].name}: {str(e)}"
+                            if progress_callback:
+                                worker_callback(error_msg)
+                            outcome = (False, error_msg, {'frames_dropped': 0})
+                            # _convert_ranges 每个片段各有一个结果
+                            if method == '_convert_ranges':
+                                outcome = [outcome] * len(task_options[position]['ranges'])
+                        outcomes[position] = outcome
+                        if on_outcome:
+                            on_outcome(position, outcome)
+                    while queue and len(running) < workers and not (control and control.cancelled):
+                        submit_next()
+        finally:
+            if manager:
+                message_queue.put(None)
+                relay.join()
+                manager.shutdown()
+
+        return _fill_cancelled(outcomes, video_files, method, task_options)
+
+    def _get_quality_settings(self, quality, output_format=None):
+        """
+        获取质量配置
+        :param output_format: 覆盖档位中的输出格式,为None时使用构造时指定的格式,都未指定时保持档位自带的格式
+        :raises ValueError: 不支持的输出格式
+        """
         quality_map = {
             'high': QualitySettings.HIGH,
             'medium': QualitySettings.MEDIUM,
             'low': QualitySettings.LOW
         }
-        return quality_map.get(quality.lower(), QualitySettings.MEDIUM)
+        settings = quality_map.get(quality.lower(), QualitySettings.MEDIUM)
+        output_format = output_format or self.output_format
+        if output_format:
+            ffmpeg_engine.output_extension(output_format)
+            settings = dict(settings, format=output_format)
+        return settings
+
+
+def load_manifest(manifest, input_dir='.'):
+    """
+    读取片段清单,格式见 VideoToGifConverter.convert_manifest
+    :param manifest: JSON文件路径或字典(也可直接是 clips 列表)
+    :param input_dir: 相对路径的源文件所在文件夹
+    :return: [(源文件路径, [片段字典, ...]), ...]
+    :raises ValueError: 清单格式错误
+    """
+    if isinstance(manifest, (str, os.PathLike)):
+        with open(manifest, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    clips = manifest.get('clips') if isinstance(manifest, dict) else manifest
+    if not isinstance(clips, list):
+        raise ValueError("清单缺少 clips 列表")
+
+    entries = []
+    for clip in clips:
+        if not isinstance(clip, dict) or 'source' not in clip or not isinstance(clip.get('ranges'), list):
+            raise ValueError(f"清单条目格式错误: {clip!r}")
+        source = Path(clip['source'])
+        if not source.is_absolute():
+            source = Path(input_dir) / source
+        entries.append((source, clip['ranges']))
+    return entries
+
+
+def _fill_cancelled(outcomes, video_files, method, task_options):
+    """取消后尚未开始的任务记为已取消,返回补齐后的结果列表"""
+    for position, outcome in enumerate(outcomes):
+        if outcome is None:
+            outcome = (False, f"已取消: {video_files[position].name}", {'frames_dropped': 0, 'cancelled': True})
+            if method == '_convert_ranges':
+                outcome = [outcome] * len(task_options[position]['ranges'])
+            outcomes[position] = outcome
+    return outcomes
+
+
+def _finish_decimated(output_path, quality_settings, frames_total):
+    """
+    ffmpeg输出的GIF开启去重(mpdecimate)时: 补上末尾被丢弃帧的时长,并按实际帧数统计丢弃的帧数
+    :param frames_total: 不去重时的帧数,未知时不处理
+    :return: 统计信息 {'frames', 'frames_dropped'},未开启去重时为空字典
+    """
+    if quality_settings['format'] != 'gif' or quality_settings.get('dedup') is None or not frames_total:
+        return {}
+    import gif_writer
+    frames = gif_writer.pad_final_delay(output_path, frames_total * 1000.0 / quality_settings['fps'])
+    return {'frames': frames, 'frames_dropped': max(0, frames_total - frames)}
+
+
+def _scaled_size(info, scale):
+    """
+    按缩放比例计算解码端输出的画面尺寸
+    :param info: probe 返回的元数据;ffmpeg按旋转信息自动旋转画面,尺寸按旋转后的宽高计算
+    :return: (宽, 高)
+    """
+    width, height = info['width'], info['height']
+    if info.get('rotation') in (90, 270):
+        width, height = height, width
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _partial_path(output_path, tag=None):
+    """
+    输出文件转换期间使用的临时路径(同一文件夹下的隐藏文件,改名是原子操作),扩展名不变以便ffmpeg识别格式
+    :param tag: 追加在文件名中的标识,同一输出可能被多个进程同时转换时(多机转换的租约过期重租)互不覆盖
+    """
+    output_path = Path(output_path)
+    tag = f"-{re.sub(r'[^0-9A-Za-z_.-]', '_', tag)}" if tag else ''
+    return output_path.with_name(f'.{output_path.stem}.partial{tag}{output_path.suffix}')
+
+
+class _QueueProgress:
+    """可跨进程传递的进度/事件回调,把消息放入共享队列"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __call__(self, msg):
+        self.queue.put(msg)
+
+
+def _relay_progress(queue, progress_callback, event_callback=None):
+    """
+    在主进程中转发队列里的消息,收到 None 时结束
+    字符串交给 progress_callback,字典(计时事件)交给 event_callback
+    """
+    while True:
+        msg = queue.get()
+        if msg is None:
+            break
+        if isinstance(msg, dict):
+            event_callback(msg)
+        else:
+            progress_callback(msg)
+
+
+def _convert_worker(converter, method, video_path, quality, idx, total, progress_callback, options):
+    """进程池任务: 转换单个视频(或同一视频的多个片段),暂停/取消由进程池 initializer 传入"""
+    if progress_callback:
+        progress_callback(f"\n处理 [{idx}/{total}]: {Path(video_path).name}")
+    return getattr(converter, method)(video_path, quality, progress_callback, **options,
+                                      control=scheduler.worker_control(), job=(idx, total))
 
 
 if __name__ == '__main__':
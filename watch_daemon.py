@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+视频转GIF工具 - 监视文件夹守护进程
+
+持续监视输入文件夹(Linux下使用inotify,其他平台轮询),
+文件写入完成(大小和修改时间稳定)后才加入队列,只转换新增或变化的文件,
+单个文件失败不影响后续处理
+
+用法:
+    python watch_daemon.py --input D:/GIF/start --output D:/GIF/finish --quality medium
+"""
+import os
+import sys
+import time
+import select
+import signal
+import struct
+import argparse
+import threading
+import ctypes
+import ctypes.util
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import ffmpeg_engine
+from video_to_gif import VideoToGifConverter
+from metrics import JsonLinesExporter, PrometheusExporter, combine_callbacks, emit_summary
+
+
+class PollingWatcher:
+    """轮询监视器: 定期扫描输入文件夹,返回大小或修改时间有变化的文件"""
+
+    def __init__(self, converter, interval=1.0):
+        self.converter = converter
+        self.interval = interval
+        self._seen = {}
+
+    def wait(self, timeout):
+        """
+        等待变化
+        :param timeout: 最长等待时间(秒)
+        :return: 可能发生变化的文件路径集合
+        """
+        time.sleep(min(timeout, self.interval))
+        changed = set()
+        current = {}
+        for video_file in self.converter.get_video_files():
+            try:
+                stat = video_file.stat()
+            except OSError:
+                continue
+            current[video_file] = (stat.st_size, stat.st_mtime_ns)
+            if self._seen.get(video_file) != current[video_file]:
+                changed.add(video_file)
+        self._seen = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """基于inotify的监视器(仅Linux),事件队列溢出时退化为一次全量扫描"""
+
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, converter):
+        self.converter = converter
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self._fd, str(converter.input_dir).encode(), mask) < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch 失败')
+        # 启动时先报告已存在的文件
+        self._rescan = True
+
+    def wait(self, timeout):
+        """
+        等待inotify事件
+        :param timeout: 最长等待时间(秒)
+        :return: 可能发生变化的文件路径集合
+        """
+        if self._rescan:
+            self._rescan = False
+            return set(self.converter.get_video_files())
+
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        data = os.read(self._fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, mask, _, name_len = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0').decode('utf-8', errors='replace')
+            offset += name_len
+            if mask & self.IN_Q_OVERFLOW:
+                return set(self.converter.get_video_files())
+            path = self.converter.input_dir / name
+            if path.suffix.lower() in self.converter.SUPPORTED_FORMATS:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(converter, poll_interval=1.0):
+    """优先使用inotify,不可用时回退到轮询"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(converter)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(converter, poll_interval)
+
+
+class WatchDaemon:
+    """监视文件夹并持续转换新增视频"""
+
+    def __init__(self, converter, quality='medium', workers=None, engine=None,
+                 settle_seconds=2.0, poll_interval=1.0, progress_callback=None, event_callback=None):
+        """
+        :param converter: VideoToGifConverter 实例
+        :param quality: 质量等级
+        :param workers: 进程池大小,默认为CPU核数
+        :param engine: 转换引擎,默认使用转换器的引擎
+        :param settle_seconds: 文件大小和修改时间保持不变多久后视为写入完成(秒)
+        :param poll_interval: 轮询间隔(秒),仅在无法使用inotify时生效
+        :param progress_callback: 日志回调函数
+        :param event_callback: 计时事件回调函数,子进程的汇总在当前进程中展开后回调
+        """
+        self.converter = converter
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.progress_callback = progress_callback or print
+        self.event_callback = event_callback
+        # 等待写入完成的文件: 路径 -> (大小, 修改时间, 开始稳定的时刻)
+        self._settling = {}
+        # 已稳定、等待空闲进程的文件
+        self._ready = deque()
+        # 最近一次处理过的文件版本: 路径 -> (大小, 修改时间)
+        self._done = {}
+        self._running = {}
+
+    def _log(self, msg):
+        self.progress_callback(msg)
+
+    def _is_up_to_date(self, video_file, stat):
+        """输出文件存在且不早于输入文件时视为无需转换"""
+        output_path = self.converter._output_path(video_file)
+        try:
+            return output_path.stat().st_mtime_ns >= stat.st_mtime_ns
+        except OSError:
+            return False
+
+    def _update_settling(self, now):
+        """检查等待中的文件,写入完成的移入就绪队列"""
+        for video_file in list(self._settling):
+            size, mtime, since = self._settling[video_file]
+            try:
+                stat = video_file.stat()
+            except OSError:
+                # 文件已被删除或移走
+                del self._settling[video_file]
+                continue
+
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature != (size, mtime):
+                self._settling[video_file] = signature + (now,)
+                continue
+            if now - since < self.settle_seconds:
+                continue
+            if video_file in self._running:
+                # 转换期间文件又有变化: 留在等待列表中,转换结束后与转换的版本比较,不同则重新转换
+                continue
+
+            del self._settling[video_file]
+            if self._done.get(video_file) == signature:
+                continue
+            # 本次运行中转换过旧版本的文件不比较输出时间: 旧版本的输出晚于新版本的修改时间
+            if video_file not in self._done and self._is_up_to_date(video_file, stat):
+                self._done[video_file] = signature
+                continue
+            self._ready.append((video_file, signature))
+
+    def _submit_ready(self, executor):
+        """有空闲进程时提交就绪文件,其余留在队列中等待"""
+        while self._ready and len(self._running) < self.workers:
+            video_file, signature = self._ready.popleft()
+            if video_file in self._running:
+                continue
+            try:
+                future = executor.submit(self.converter._convert_single, video_file, self.quality,
+                                         None, self.engine)
+            except BrokenProcessPool:
+                self._ready.appendleft((video_file, signature))
+                raise
+            self._log(f"开始转换: {video_file.name}")
+            self._running[video_file] = (future, signature)
+
+    def _collect_finished(self):
+        """收集已完成的任务,失败只记录日志"""
+        for video_file in list(self._running):
+            future, signature = self._running[video_file]
+            if not future.done():
+                continue
+            del self._running[video_file]
+            try:
+                success, result, info = future.result()
+            except Exception as e:
+                success, result, info = False, f"转换失败 {video_file.name}: {str(e)}", {}
+            if self.event_callback and info.get('metrics'):
+                emit_summary(info['metrics'], self.event_callback)
+
+            # 失败的版本同样记录,文件再次变化后才会重试
+            self._done[video_file] = signature
+            if success:
+                self._log(f"完成: {result}")
+            else:
+                self._log(result)
+
+    def run(self, stop_event=None):
+        """
+        运行守护循环,直到 stop_event 被设置
+        :param stop_event: threading.Event,为None时一直运行
+        """
+        stop_event = stop_event or threading.Event()
+        watcher = create_watcher(self.converter, self.poll_interval)
+        mode = 'inotify' if isinstance(watcher, InotifyWatcher) else '轮询'
+        self._log(f"开始监视 {self.converter.input_dir} ({mode}), 进程数: {self.workers}")
+
+        executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            while not stop_event.is_set():
+                # 有文件在等待稳定或转换时缩短等待,及时推进状态
+                busy = self._settling or self._running
+                timeout = min(self.poll_interval, 0.5) if busy else self.poll_interval
+                now = time.monotonic()
+                for video_file in watcher.wait(timeout):
+                    if video_file not in self._settling:
+                        self._settling[video_file] = (-1, -1, now)
+
+                self._update_settling(time.monotonic())
+                self._collect_finished()
+                try:
+                    self._submit_ready(executor)
+                except BrokenProcessPool:
+                    # 子进程崩溃会使整个进程池失效,重建后继续处理
+                    self._log("转换进程异常退出,正在重建进程池")
+                    executor.shutdown(wait=False)
+                    executor = ProcessPoolExecutor(max_workers=self.workers)
+
+            self._log("正在停止,等待进行中的转换完成...")
+        finally:
+            executor.shutdown(wait=True)
+            watcher.close()
+        self._collect_finished()
+        self._log("监视已停止")
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='监视文件夹,自动把新增视频转换为GIF')
+    parser.add_argument('--input', default='D:/GIF/start', help='输入视频文件夹')
+    parser.add_argument('--output', default='D:/GIF/finish', help='输出GIF文件夹')
+    parser.add_argument('--quality', default='medium', choices=['high', 'medium', 'low'], help='质量等级')
+    parser.add_argument('--engine', default='moviepy', choices=VideoToGifConverter.ENGINES, help='转换引擎')
+    parser.add_argument('--format', default=None, choices=list(ffmpeg_engine.OUTPUT_FORMATS),
+                        help='输出格式,默认为GIF')
+    parser.add_argument('--workers', type=int, default=None, help='并行进程数,默认为CPU核数')
+    parser.add_argument('--settle', type=float, default=2.0, help='文件稳定多少秒后开始转换')
+    parser.add_argument('--poll', type=float, default=1.0, help='轮询间隔(秒)')
+    parser.add_argument('--metrics-jsonl', default=None, help='把计时事件追加写入该JSON Lines文件')
+    parser.add_argument('--metrics-prom', default=None, help='把汇总指标写入该Prometheus文本文件')
+    args = parser.parse_args()
+
+    converter = VideoToGifConverter(args.input, args.output, engine=args.engine, output_format=args.format)
+
+    def print_progress(msg):
+        print(f"[{time.strftime('%H:%M:%S')}] {msg}", flush=True)
+
+    event_callback = combine_callbacks(
+        JsonLinesExporter(args.metrics_jsonl) if args.metrics_jsonl else None,
+        PrometheusExporter(args.metrics_prom) if args.metrics_prom else None
+    )
+
+    stop_event = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop_event.set())
+
+    daemon = WatchDaemon(
+        converter,
+        quality=args.quality,
+        workers=args.workers,
+        settle_seconds=args.settle,
+        poll_interval=args.poll,
+        progress_callback=print_progress,
+        event_callback=event_callback
+    )
+    daemon.run(stop_event)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())